@@ -0,0 +1,109 @@
+"""
+Benchmark: judge evidence fetch, full download + BeautifulSoup vs streamed <head> parsing.
+
+Serves a corpus of saved pages from a local HTTP server and fetches every page
+both ways, comparing time, bytes read and whether the extracted title and
+description agree.
+
+Usage:
+    python research/benchmarks/head_fetch_bench.py                   # synthetic corpus
+    python research/benchmarks/head_fetch_bench.py --corpus saved_pages/
+"""
+import os
+import sys
+import time
+import shutil
+import random
+import argparse
+import tempfile
+import threading
+import functools
+import statistics
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+import requests
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "src", "ai_worker"))
+from page_head import fetch_head
+
+def make_synthetic_corpus(path, pages=40, seed=3):
+    """Landing pages with a normal <head> and a 0.2-4 MB body."""
+    rng = random.Random(seed)
+    filler = "<div class='card'><img src='/x.png'><p>" + "lorem ipsum dolor sit amet " * 40 + "</p></div>\n"
+    for i in range(pages):
+        body_repeats = rng.randint(200, 4000)
+        with open(os.path.join(path, f"page{i}.html"), "w") as f:
+            f.write(f"""<!DOCTYPE html><html><head><meta charset="utf-8">
+<title>Example Site {i} &amp; Friends</title>
+<meta name="viewport" content="width=device-width">
+<meta name="description" content="Landing page number {i} for the benchmark">
+<meta property="og:title" content="Example {i}">
+<script>{"var x=1;" * rng.randint(10, 2000)}</script>
+</head><body>
+""")
+            f.write(filler * body_repeats)
+            f.write("</body></html>\n")
+
+def old_path(session, url):
+    """The judge's original fetch: whole body + BeautifulSoup over the full document."""
+    start = time.perf_counter()
+    response = session.get(url, timeout=5)
+    soup = BeautifulSoup(response.text, 'html.parser')
+    title = soup.title.string.strip() if soup.title and soup.title.string else None
+    meta = soup.find('meta', attrs={'name': 'description'})
+    desc = meta['content'].strip() if meta else None
+    return {"title": title, "description": desc, "bytes_read": len(response.content), "elapsed": time.perf_counter() - start}
+
+def new_path(session, url):
+    return fetch_head(session, url, timeout=5)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="Directory of saved .html pages (default: synthetic)")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    corpus = args.corpus
+    tmp = None
+    if not corpus:
+        tmp = tempfile.mkdtemp()
+        make_synthetic_corpus(tmp)
+        corpus = tmp
+
+    pages = sorted(p for p in os.listdir(corpus) if p.endswith((".html", ".htm")))
+    handler = functools.partial(SimpleHTTPRequestHandler, directory=corpus)
+    handler.log_message = lambda *a: None
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    session = requests.Session()
+    results = {"old": [], "new": []}
+    mismatches = 0
+    try:
+        for _ in range(args.rounds):
+            for page in pages:
+                url = f"{base}/{page}"
+                old = old_path(session, url)
+                new = new_path(session, url)
+                results["old"].append(old)
+                results["new"].append(new)
+                if (old["title"], old["description"]) != (new["title"], new["description"]):
+                    mismatches += 1
+    finally:
+        server.shutdown()
+        if tmp:
+            shutil.rmtree(tmp)
+
+    print(f"{len(pages)} pages x {args.rounds} rounds")
+    print(f"{'path':<28} {'mean ms':>9} {'p95 ms':>9} {'mean KB read':>13}")
+    for name, label in [("old", "full body + BeautifulSoup"), ("new", "streamed <head> parser")]:
+        times = sorted(r["elapsed"] * 1000 for r in results[name])
+        p95 = times[int(len(times) * 0.95) - 1] if len(times) > 1 else times[0]
+        kb = statistics.mean(r["bytes_read"] for r in results[name]) / 1024
+        print(f"{label:<28} {statistics.mean(times):>9.1f} {p95:>9.1f} {kb:>13.1f}")
+    print(f"Title/description mismatches: {mismatches}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Benchmark: worker ignore set as a plain Python set vs CompactDomainSet vs the mmapped blocklist index.
+
+Usage:
+    python research/benchmarks/ignore_set_bench.py                 # 2M synthetic domains
+    python research/benchmarks/ignore_set_bench.py --count 500000
+    python research/benchmarks/ignore_set_bench.py --file data/blocklists/final_blocklist.txt
+
+Each structure is built in its own subprocess so the RSS numbers don't bleed into each other.
+"heap MB" only counts anonymous memory. The index is mapped, not loaded: its pages are read in
+lazily by lookups, as file-backed page cache shared by every process that maps the same file.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "src", "ai_worker"))
+
+LOOKUPS = 200_000
+
+def rss_mb(field="VmRSS"):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(f"{field}:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+def synthetic_domains(count, seed=42):
+    rng = random.Random(seed)
+    tlds = ["com", "net", "org", "xyz", "info", "io", "co.uk", "ru", "de"]
+    alphabet = "abcdefghijklmnopqrstuvwxyz0123456789-"
+    for _ in range(count):
+        label = "".join(rng.choice(alphabet[:-1]) + "".join(rng.choices(alphabet, k=rng.randint(4, 14))))
+        sub = f"{rng.choice(['www', 'cdn', 'm', 'img', 'api'])}." if rng.random() < 0.3 else ""
+        yield f"{sub}{label}.{rng.choice(tlds)}"
+
+def write_synthetic_list(count, path):
+    """Writes synthetic domains in final_blocklist.txt format (sorted, v4 + v6 lines)."""
+    with open(path, "w") as f:
+        f.write("127.0.0.1 localhost\n::1 localhost\n")
+        for domain in sorted(set(synthetic_domains(count))):
+            f.write(f"0.0.0.0 {domain}\n:: {domain}\n")
+
+def stream_domains(path):
+    from ignore_cache import parse_line
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        for line in f:
+            domain = parse_line(line, needs_parsing=True)
+            if domain:
+                yield domain
+
+def write_index_for(path, index_path):
+    from blocklist_index import write_index, reversed_key
+    write_index(index_path, ((key, 0) for key in sorted(reversed_key(d) for d in stream_domains(path))))
+
+def run_one(kind, path):
+    """Runs inside the subprocess: builds one structure the way the worker does and reports RSS + latency."""
+    from domain_set import CompactDomainSet
+    from blocklist_index import BlocklistIndex
+
+    before, before_anon = rss_mb(), rss_mb("RssAnon")
+    start = time.perf_counter()
+    if kind == "set":
+        structure = set(stream_domains(path))
+    elif kind == "compact":
+        structure = CompactDomainSet.from_sorted(stream_domains(path))
+    else:
+        structure = BlocklistIndex(f"{path}.idx")
+    build_s = time.perf_counter() - start
+    rss, anon = rss_mb() - before, rss_mb("RssAnon") - before_anon
+
+    # Half hits, half misses
+    rng = random.Random(7)
+    every = max(1, len(structure) // (LOOKUPS // 2))
+    probes = [d for i, d in enumerate(stream_domains(path)) if i % every == 0]
+    probes += [f"miss-{i}.example" for i in range(len(probes))]
+    rng.shuffle(probes)
+
+    start = time.perf_counter()
+    hits = sum(1 for d in probes if d in structure)
+    lookup_s = time.perf_counter() - start
+
+    domains = len(structure)
+    add_us = None
+    if hasattr(structure, "add"): # The index is read-only (the worker keeps its own blocks in a small set)
+        start = time.perf_counter()
+        for i in range(10_000):
+            structure.add(f"new-{i}.example")
+        add_us = round((time.perf_counter() - start) / 10_000 * 1e6, 2)
+
+    print(json.dumps({
+        "structure": kind,
+        "domains": domains,
+        "rss_mb": round(rss, 1),
+        "heap_mb": round(anon, 1),
+        "build_s": round(build_s, 2),
+        "lookup_us": round(lookup_s / len(probes) * 1e6, 2),
+        "add_us": add_us,
+        "hits": hits,
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=2_000_000, help="Synthetic domains to generate")
+    parser.add_argument("--file", help="Use a real final_blocklist.txt (sorted) instead of synthetic domains")
+    parser.add_argument("--run", choices=["set", "compact", "index"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_one(args.run, args.file)
+        return
+
+    path = args.file
+    if not path:
+        tmp = tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False)
+        tmp.close()
+        path = tmp.name
+        write_synthetic_list(args.count, path)
+
+    results = []
+    try:
+        write_index_for(path, f"{path}.idx")
+        for kind in ["set", "compact", "index"]:
+            out = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--run", kind, "--file", path])
+            results.append(json.loads(out))
+    finally:
+        os.remove(f"{path}.idx")
+        if not args.file:
+            os.remove(path)
+
+    print(f"{'structure':<10} {'domains':>10} {'RSS MB':>8} {'heap MB':>8} {'build s':>8} {'lookup µs':>10} {'add µs':>8}")
+    for r in results:
+        print(f"{r['structure']:<10} {r['domains']:>10} {r['rss_mb']:>8} {r['heap_mb']:>8} {r['build_s']:>8} "
+              f"{r['lookup_us']:>10} {str(r['add_us'] or '-'):>8}")
+
+if __name__ == "__main__":
+    main()
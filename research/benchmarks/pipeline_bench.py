@@ -0,0 +1,369 @@
+"""
+Benchmark: the whole pipeline on synthetic DNS traffic.
+
+Writes a CoreDNS-style query.log at a fixed rate (Zipf-distributed domain mix) and runs the real
+bridge (src/bridge/log_monitor.py) and worker (src/ai_worker/worker.py) on it against a local Redis,
+each in its own process, in a scratch directory. Records:
+  - bridge lines/sec (from its periodic summary) and queue depth over time
+  - worker domains/sec (pushed minus still queued)
+  - time to block: first time a name appeared in the log -> its entry in ai_blocks (p50/p99)
+  - peak RSS of the bridge and the worker (VmHWM, including pool processes)
+and writes them as JSON, so runs can be compared (--baseline, or --compare A.json B.json).
+
+Usage:
+    python research/benchmarks/pipeline_bench.py                               # 200 qps for 60s
+    python research/benchmarks/pipeline_bench.py --qps 2000 --duration 120 --zipf 1.2
+    python research/benchmarks/pipeline_bench.py --baseline research/benchmarks/results/old.json
+    python research/benchmarks/pipeline_bench.py --compare old.json new.json
+
+Needs a Redis on localhost:6379 (the address both components use) and the model in nlp_model/.
+The queue keys must be empty: the benchmark refuses to run next to real traffic (--flush-queue to clear them).
+"""
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import bisect
+import random
+import argparse
+import tempfile
+import datetime
+import threading
+import subprocess
+
+import redis
+
+REPO = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+sys.path.insert(0, os.path.join(REPO, "src", "ai_worker"))
+from list_store import ListStore, LIST_FILES
+from public_suffix import PublicSuffixList
+from ignore_set_bench import synthetic_domains
+
+QUEUE_NAME = "dns_traffic"
+STREAM_NAME = "dns_traffic_stream"
+STREAM_GROUP = "ai_workers"
+RESULTS_DIR = os.path.join(REPO, "research", "benchmarks", "results")
+
+SAMPLE_INTERVAL = 0.5 # Seconds between queue depth samples
+TICK = 0.02 # Generator write interval
+STARTUP_TIMEOUT = 300 # Seconds to wait for a component's "ready" line
+SUMMARY_WAIT = 12 # The bridge prints its counts every LOG_INTERVAL (10s)
+
+# Unsafe-looking names, for the pre-filter and the model to catch
+UNSAFE_WORDS = ["casino", "porn", "xxx", "betting", "slots", "escort", "sexcam", "jackpot"]
+
+BRIDGE_SUMMARY_RE = re.compile(r"Sent to AI: (\d+) \(matched (\d+)")
+WORKER_THROUGHPUT_RE = re.compile(r"Throughput: ([\d.]+) domains/sec popped, ([\d.]+) domains/sec scanned")
+
+# --- TRAFFIC ---
+def build_universe(size, unsafe_share, seed=11):
+    """Domain mix by popularity rank: whitelisted sites first, then synthetic sites (some with several subdomains)."""
+    rng = random.Random(seed)
+    whitelist = os.path.join(REPO, "data", "blocklists", "whitelist.txt")
+    universe = []
+    if os.path.exists(whitelist):
+        with open(whitelist) as f:
+            universe = [l.strip() for l in f if l.strip() and not l.startswith("#")][:size // 10]
+    synthetic = synthetic_domains(size, seed)
+    while len(universe) < size:
+        site = next(synthetic).split(".", 1)[-1] if rng.random() < 0.3 else next(synthetic)
+        if rng.random() < unsafe_share:
+            site = f"{rng.choice(UNSAFE_WORDS)}-{site}"
+        universe.append(site)
+        for sub in rng.sample(["cdn", "img", "api", "static", "m"], rng.randint(0, 2)):
+            if len(universe) < size:
+                universe.append(f"{sub}.{site}")
+    return universe
+
+class ZipfSampler:
+    """Draws ranks with P(rank k) proportional to 1 / k^s."""
+
+    def __init__(self, n, s, seed=5):
+        self.rng = random.Random(seed)
+        total = 0.0
+        self.cumulative = []
+        for k in range(1, n + 1):
+            total += 1 / k ** s
+            self.cumulative.append(total)
+        self.total = total
+
+    def sample(self):
+        return bisect.bisect_left(self.cumulative, self.rng.random() * self.total)
+
+class TrafficGenerator(threading.Thread):
+    """Appends CoreDNS `log` lines to the query log at `qps`, remembering when each name first appeared."""
+
+    def __init__(self, path, universe, qps, duration, zipf, seed=5):
+        super().__init__(daemon=True)
+        self.path = path
+        self.universe = universe
+        self.qps = qps
+        self.duration = duration
+        self.sampler = ZipfSampler(len(universe), zipf, seed)
+        self.rng = random.Random(seed)
+        self.first_seen = {}
+        self.lines = 0
+        self.started = None
+        self.elapsed = 0.0
+        self.drained = None # When the queue was empty again (or the drain time ran out)
+
+    def line(self, domain):
+        client = f"192.168.{self.rng.randint(0, 3)}.{self.rng.randint(2, 254)}"
+        return (f'[INFO] {client}:{self.rng.randint(1024, 65535)} - {self.rng.randint(1, 65535)} '
+                f'"A IN {domain}. udp 40 false 512" NOERROR qr,rd,ra 56 0.0001s\n')
+
+    def run(self):
+        start = self.started = time.time()
+        owed = 0.0
+        with open(self.path, "a", buffering=1 << 16) as f:
+            while time.time() - start < self.duration:
+                owed += self.qps * TICK
+                lines = []
+                now = time.time()
+                for _ in range(int(owed)):
+                    domain = self.universe[self.sampler.sample()]
+                    self.first_seen.setdefault(domain, now)
+                    lines.append(self.line(domain))
+                owed -= len(lines)
+                f.write("".join(lines))
+                f.flush()
+                self.lines += len(lines)
+                time.sleep(max(0.0, TICK - (time.time() - now)))
+        self.elapsed = time.time() - start
+
+# --- COMPONENTS ---
+class Component:
+    """One pipeline process; its output lines are collected with arrival times."""
+
+    def __init__(self, name, argv, cwd, env):
+        self.name = name
+        self.output = [] # (time, line)
+        self.proc = subprocess.Popen(argv, cwd=cwd, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        for line in self.proc.stdout:
+            self.output.append((time.time(), line.rstrip("\n")))
+
+    def wait_for(self, text, timeout=STARTUP_TIMEOUT):
+        deadline = time.time() + timeout
+        seen = 0
+        while time.time() < deadline:
+            for _, line in self.output[seen:]:
+                if text in line:
+                    return True
+            seen = len(self.output)
+            if self.proc.poll() is not None:
+                break
+            time.sleep(0.1)
+        tail = "\n".join(line for _, line in self.output[-20:])
+        raise RuntimeError(f"{self.name} never printed {text!r}:\n{tail}")
+
+    def peak_rss_mb(self):
+        """VmHWM of the process and of every descendant (pool processes), in MB."""
+        peaks = {}
+        pending = [self.proc.pid]
+        while pending:
+            pid = pending.pop()
+            try:
+                with open(f"/proc/{pid}/status") as f:
+                    peaks[pid] = next(int(l.split()[1]) / 1024 for l in f if l.startswith("VmHWM:"))
+                for tid in os.listdir(f"/proc/{pid}/task"):
+                    with open(f"/proc/{pid}/task/{tid}/children") as f:
+                        pending.extend(int(child) for child in f.read().split())
+            except (OSError, StopIteration):
+                continue
+        return {"process": round(peaks.get(self.proc.pid, 0.0), 1),
+                "children": [round(mb, 1) for pid, mb in peaks.items() if pid != self.proc.pid]}
+
+    def stop(self):
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+
+def prepare_workdir(workdir, with_final_list):
+    """Scratch copy of the layout the components expect (relative paths): own lists, shared model and index."""
+    os.makedirs(os.path.join(workdir, "data", "blocklists"), exist_ok=True)
+    os.makedirs(os.path.join(workdir, "logs"), exist_ok=True)
+    for rel in ["data/blocklists/whitelist.txt", "data/blocklists/blacklist.txt"]:
+        if os.path.exists(os.path.join(REPO, rel)):
+            shutil.copy(os.path.join(REPO, rel), os.path.join(workdir, rel)) # Copied: the run must not touch the real lists
+    links = ["nlp_model", "nlp_model_int8", "nlp_model_onnx", "data/public_suffix_list.dat"]
+    if with_final_list:
+        links += ["data/blocklists/final_blocklist.txt", "data/blocklists/final_blocklist.idx"]
+    for rel in links:
+        if os.path.exists(os.path.join(REPO, rel)):
+            os.symlink(os.path.join(REPO, rel), os.path.join(workdir, rel))
+    open(os.path.join(workdir, "logs", "query.log"), "w").close()
+
+def queue_depth(r, backend):
+    if backend == "list":
+        return r.llen(QUEUE_NAME)
+    try:
+        group = next(g for g in r.xinfo_groups(STREAM_NAME) if g["name"] in (STREAM_GROUP, STREAM_GROUP.encode()))
+    except (redis.ResponseError, StopIteration):
+        return 0
+    return (group.get("lag") or 0) + group["pending"] # lag needs Redis 7
+
+# --- RESULTS ---
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def block_latencies(store, first_seen, since):
+    """Seconds from a name's first log line to its ai_blocks entry. A site entry counts from its first subdomain."""
+    psl = PublicSuffixList(os.path.join(REPO, "data", "public_suffix_list.dat"))
+    first = {}
+    for domain, seen in first_seen.items():
+        for name in {domain, psl.registrable(domain) or domain}:
+            first[name] = min(seen, first.get(name, seen))
+    latencies = []
+    rows = store.db.execute("SELECT domain, at FROM list_changes WHERE version > ? AND list = 'ai_blocks' AND op = '+'", (since,))
+    for domain, at in rows:
+        if domain in first:
+            latencies.append(at - first[domain])
+    return latencies
+
+def summarize(args, generator, bridge, worker, depth, pushed, latencies, rss):
+    # The bridge prints a summary every LOG_INTERVAL with the counts since the previous one
+    times = [generator.started] + [t for t, _, _ in pushed]
+    lines_per_sec = [round(matched / max(t - prev, 1e-9), 1) for prev, (t, matched, _) in zip(times, pushed)]
+    total_pushed = sum(sent for _, _, sent in pushed)
+    consumed = total_pushed - (depth[-1][1] if depth else 0)
+    busy = generator.drained - generator.started # Until the queue was empty: at most the offered load if the worker keeps up
+    return {
+        "run": {
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": subprocess.run(["git", "-C", REPO, "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip(),
+            "qps": args.qps, "duration_s": args.duration, "zipf": args.zipf, "universe": args.universe,
+            "unsafe_share": args.unsafe_share, "queue": args.queue,
+            "env": {k: v for k, v in os.environ.items() if k.startswith(("WORKER_", "PREFILTER", "BRIDGE_"))},
+        },
+        "generator": {"lines": generator.lines, "lines_per_sec": round(generator.lines / max(generator.elapsed, 1e-9), 1),
+                      "unique_names": len(generator.first_seen)},
+        "bridge": {"lines_per_sec": lines_per_sec, "mean_lines_per_sec": round(sum(lines_per_sec) / max(len(lines_per_sec), 1), 1),
+                   "pushed": total_pushed},
+        "queue_depth": {"max": max((d for _, d in depth), default=0), "final": depth[-1][1] if depth else 0,
+                        "samples": [(round(t - depth[0][0], 1), d) for t, d in depth]},
+        "worker": {"domains_per_sec": round(consumed / max(busy, 1e-9), 1),
+                   "consumed": consumed,
+                   "reported": [{"popped": float(p), "scanned": float(s)} for _, line in worker.output
+                                for p, s in WORKER_THROUGHPUT_RE.findall(line)]},
+        "time_to_block_s": {"blocked": len(latencies), "p50": _round(percentile(latencies, 50)),
+                            "p99": _round(percentile(latencies, 99)), "max": _round(max(latencies, default=None))},
+        "peak_rss_mb": rss,
+    }
+
+def _round(value):
+    return None if value is None else round(value, 3)
+
+METRICS = [("bridge", "mean_lines_per_sec", True), ("worker", "domains_per_sec", True), ("queue_depth", "max", False),
+           ("time_to_block_s", "p50", False), ("time_to_block_s", "p99", False)]
+
+def compare(baseline, current):
+    """Prints the headline metrics side by side. Returns the number that got worse by more than 10%."""
+    worse = 0
+    print(f"{'metric':<28} {'baseline':>12} {'current':>12} {'change':>9}")
+    rows = [(f"{section}.{key}", baseline[section][key], current[section][key], higher_is_better)
+            for section, key, higher_is_better in METRICS]
+    rows += [(f"peak_rss_mb.{name}", baseline["peak_rss_mb"][name]["process"], current["peak_rss_mb"][name]["process"], False)
+             for name in ("bridge", "worker")]
+    for name, old, new, higher_is_better in rows:
+        change = (new - old) / old if old and new is not None else None
+        regressed = change is not None and (change < -0.1 if higher_is_better else change > 0.1)
+        worse += regressed
+        print(f"{name:<28} {str(old):>12} {str(new):>12} {f'{change:+.0%}' if change is not None else '-':>9}"
+              f"{'  ⚠️' if regressed else ''}")
+    return worse
+
+# --- ORCHESTRATION ---
+def run(args):
+    r = redis.Redis(host="localhost", port=6379)
+    r.ping()
+    keys = [QUEUE_NAME, STREAM_NAME]
+    if any(r.exists(key) for key in keys):
+        if not args.flush_queue:
+            sys.exit(f"{' / '.join(keys)} already exist in Redis: is a real pipeline running? (--flush-queue to clear them)")
+        r.delete(*keys)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="pipeline_bench_")
+    prepare_workdir(workdir, not args.no_final_list)
+    env = {**os.environ, "DNS_QUEUE": args.queue, "BRIDGE_INPUT": "log", "PYTHONUNBUFFERED": "1"}
+    store = ListStore(os.path.join(workdir, "data", "blocklists", "lists.db"),
+                      {name: os.path.join(workdir, path) for name, path in LIST_FILES.items()})
+    since = store.version()
+    print(f"📁 Working directory: {workdir}")
+
+    universe = build_universe(args.universe, args.unsafe_share)
+    worker = Component("worker", [sys.executable, os.path.join(REPO, "src", "ai_worker", "worker.py")], workdir, env)
+    bridge = Component("bridge", [sys.executable, os.path.join(REPO, "src", "bridge", "log_monitor.py")], workdir, env)
+    try:
+        bridge.wait_for("Bridge Started")
+        worker.wait_for("AI Model Loaded" if not args.no_wait_model else "Smart Worker")
+        print(f"🚦 Pipeline up, sending {args.qps} qps for {args.duration}s...")
+
+        generator = TrafficGenerator(os.path.join(workdir, "logs", "query.log"), universe, args.qps, args.duration, args.zipf)
+        generator.start()
+        depth = [(time.time(), queue_depth(r, args.queue))] # Always one sample, however short the run
+        while generator.is_alive() or (depth[-1][1] and time.time() < generator.started + generator.elapsed + args.drain):
+            time.sleep(SAMPLE_INTERVAL)
+            depth.append((time.time(), queue_depth(r, args.queue)))
+        generator.drained = depth[-1][0]
+        # The bridge's summary for the last seconds of traffic, and the last verdicts reaching the store
+        deadline = time.time() + SUMMARY_WAIT
+        while time.time() < deadline and not any(t > generator.drained and "Sent to AI" in line for t, line in bridge.output):
+            time.sleep(0.2)
+        rss = {"bridge": bridge.peak_rss_mb(), "worker": worker.peak_rss_mb()}
+    finally:
+        bridge.stop()
+        worker.stop()
+
+    pushed = [(t, int(matched), int(sent)) for t, line in bridge.output for sent, matched in BRIDGE_SUMMARY_RE.findall(line)]
+    latencies = block_latencies(store, generator.first_seen, since)
+    return summarize(args, generator, bridge, worker, depth, pushed, latencies, rss)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--qps", type=float, default=200, help="Query log lines per second")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds of traffic")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent of the domain popularity")
+    parser.add_argument("--universe", type=int, default=50_000, help="Distinct names the traffic is drawn from")
+    parser.add_argument("--unsafe-share", type=float, default=0.05, help="Share of synthetic sites with an unsafe keyword")
+    parser.add_argument("--queue", choices=["list", "stream"], default="list", help="DNS_QUEUE for both components")
+    parser.add_argument("--drain", type=float, default=60, help="Max seconds to wait for the queue to empty afterwards")
+    parser.add_argument("--no-final-list", action="store_true", help="Don't link the deployed final list into the run")
+    parser.add_argument("--no-wait-model", action="store_true", help="Start traffic before the worker's model is loaded")
+    parser.add_argument("--flush-queue", action="store_true", help="Delete leftover queue keys before starting")
+    parser.add_argument("--workdir", help="Scratch directory (default: a new temp dir)")
+    parser.add_argument("--out", help="Result file (default: research/benchmarks/results/pipeline-<time>.json)")
+    parser.add_argument("--baseline", help="Earlier result to compare this run with")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="Only compare two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as a, open(args.compare[1]) as b:
+            sys.exit(1 if compare(json.load(a), json.load(b)) else 0)
+
+    result = run(args)
+    out = args.out or os.path.join(RESULTS_DIR, f"pipeline-{datetime.datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2)
+
+    t = result["time_to_block_s"]
+    print(f"📊 bridge {result['bridge']['mean_lines_per_sec']} lines/sec, worker {result['worker']['domains_per_sec']} domains/sec, "
+          f"max queue {result['queue_depth']['max']}, time to block p50 {t['p50']}s / p99 {t['p99']}s ({t['blocked']} blocks), "
+          f"peak RSS bridge {result['peak_rss_mb']['bridge']['process']} MB / worker {result['peak_rss_mb']['worker']['process']} MB")
+    print(f"💾 {out}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            sys.exit(1 if compare(json.load(f), result) else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import os
+import json
+import mmap
+import struct
+import bisect
+from array import array
+from domain_set import _SortedView
+
+# Compiled form of final_blocklist.txt, written by the manager next to the text file.
+#
+#   header | keys blob | offsets (count + 1 entries, 4 or 8 bytes each) | source masks (4 bytes each) | source names (JSON)
+#
+# Keys are reversed-label domains ("ads.example.com" -> b"com example ads"), sorted, so a
+# domain is followed directly by all of its subdomains. Key i is blob[offsets[i]:offsets[i + 1]]
+# (offsets are absolute file positions). Bit j of masks[i] is set when source j listed key i.
+# Integers are little-endian, like every box we run on.
+MAGIC = b"BHIDX\x00\x00\x01"
+VERSION = 2
+# magic, version, offset width, count, blob start, offsets start, masks start, names start, names length, content hash
+HEADER = struct.Struct("<8sIIQQQQQQ64s")
+MAX_SOURCES = 32
+
+def reversed_key(domain):
+    # Same ordering as the manager's suffix collapse: space sorts below every hostname character
+    return " ".join(reversed(domain.split(".")))
+
+def key_domain(key):
+    return ".".join(reversed(key.split(" ")))
+
+def write_index(path, sorted_records, content_hash="", sources=()):
+    """
+    Writes an index from (reversed key, source mask) pairs in key order, atomically.
+    `sources` names the mask bits. Returns the number of records.
+    """
+    if len(sources) > MAX_SOURCES:
+        raise ValueError(f"At most {MAX_SOURCES} sources fit in a mask")
+    offsets = array("Q")
+    masks = array("I")
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(b"\x00" * HEADER.size) # Filled in once the counts are known
+        for key, mask in sorted_records:
+            offsets.append(f.tell())
+            masks.append(mask)
+            f.write(key.encode("utf-8"))
+        offsets.append(f.tell())
+        f.write(b"\x00" * (-f.tell() % 8)) # Align the offset table
+        offsets_start = f.tell()
+
+        # 4-byte offsets are enough below 4 GiB
+        if offsets[-1] < 2 ** 32:
+            offsets = array("I", offsets)
+        f.write(offsets.tobytes())
+        f.write(b"\x00" * (-f.tell() % 4))
+        masks_start = f.tell()
+        f.write(masks.tobytes())
+        names_start = f.tell()
+        names = json.dumps(list(sources)).encode("utf-8")
+        f.write(names)
+
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, offsets.itemsize, len(masks), HEADER.size, offsets_start,
+                            masks_start, names_start, len(names), content_hash.encode("ascii")))
+    os.replace(tmp, path)
+    return len(masks)
+
+class BlocklistIndex:
+    """
+    Read-only view of an index file through mmap: nothing is copied into the heap, and every
+    process that opens the same file shares one page-cache copy. Lookups are binary searches.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            self.stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, width, count, _, offsets_start, masks_start, names_start, names_len, content_hash = \
+            HEADER.unpack_from(self.mm)
+        if magic != MAGIC or version != VERSION:
+            self.mm.close()
+            raise ValueError(f"{path} is not a version {VERSION} blocklist index")
+        self.content_hash = content_hash.rstrip(b"\x00").decode("ascii")
+        self.sources = json.loads(self.mm[names_start:names_start + names_len])
+        self._views = [memoryview(self.mm)]
+        self._views.append(self._views[0][offsets_start:offsets_start + (count + 1) * width])
+        self._views.append(self._views[0][masks_start:masks_start + count * 4])
+        self.offsets = self._views[1].cast("I" if width == 4 else "Q")
+        self.masks = self._views[2].cast("I")
+        self.keys_view = _SortedView(self.mm, self.offsets)
+
+    def changed(self):
+        """True once the file on disk was replaced (the manager swaps in a new index atomically)."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return True
+        return (st.st_ino, st.st_mtime_ns, st.st_size) != self.stamp
+
+    def _find(self, domain):
+        """Position of `domain` in the index, or -1."""
+        key = reversed_key(domain).encode("utf-8")
+        i = bisect.bisect_left(self.keys_view, key)
+        return i if i < len(self.keys_view) and self.keys_view[i] == key else -1
+
+    def __contains__(self, domain):
+        """Exact match, like the CoreDNS hosts plugin."""
+        return self._find(domain) >= 0
+
+    def sources_of(self, domain):
+        """Names of the sources that listed `domain` (exact match), or None if it isn't listed."""
+        i = self._find(domain)
+        if i < 0:
+            return None
+        mask = self.masks[i]
+        return [name for bit, name in enumerate(self.sources) if mask >> bit & 1]
+
+    def suffix_match(self, domain):
+        """Returns the shortest listed name that is `domain` or one of its parents, or None."""
+        labels = domain.split(".")
+        for i in range(len(labels) - 1, -1, -1):
+            parent = ".".join(labels[i:])
+            if parent in self:
+                return parent
+        return None
+
+    def keys(self):
+        """Raw reversed keys (bytes) in index order."""
+        for i in range(len(self.keys_view)):
+            yield self.keys_view[i]
+
+    def __iter__(self):
+        for key in self.keys():
+            yield key_domain(key.decode("utf-8"))
+
+    def __len__(self):
+        return len(self.keys_view)
+
+    def close(self):
+        # Every view into the mapping must be released before it can be unmapped
+        for view in [self.offsets, self.masks, *reversed(self._views)]:
+            view.release()
+        self.mm.close()
@@ -0,0 +1,155 @@
+import bisect
+from array import array
+
+# New domains go into a small overflow set; once it grows past this it is merged into the blob.
+MERGE_THRESHOLD = 50_000
+
+class _SortedView:
+    """Lets bisect walk the blob as if it were a sorted list of bytes."""
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.blob[self.offsets[i]:self.offsets[i + 1]]
+
+class _BlobBuilder:
+    """Appends sorted items to a growing blob + offset array."""
+
+    def __init__(self):
+        self.blob = bytearray()
+        # 4-byte offsets are enough for blobs below 4 GiB; widened to 8 bytes if we get there
+        self.offsets = array("I", [0])
+
+    def append(self, item):
+        self.blob += item
+        end = len(self.blob)
+        if end >= 2**32 and self.offsets.typecode == "I":
+            self.offsets = array("Q", self.offsets)
+        self.offsets.append(end)
+
+    def finish(self):
+        # The bytearray is kept as is (no copy); it is never mutated after this.
+        return self.blob, self.offsets
+
+class CompactDomainSet:
+    """
+    Memory-efficient set of domains.
+
+    All domains are UTF-8 encoded and concatenated, in sorted order, into one
+    bytes blob with a uint32/uint64 offset array next to it. Lookups are a
+    binary search (~21 probes for 2M domains). Compared to a Python set of str
+    this saves the per-object and hash-table overhead: roughly 25 bytes per
+    domain instead of ~120.
+    """
+
+    def __init__(self, domains=()):
+        self._extra = set()
+        self._load(sorted(set(d.encode("utf-8") for d in domains)))
+
+    @classmethod
+    def from_sorted(cls, domains):
+        """Builds from an iterable of str that is (mostly) sorted, e.g. final_blocklist.txt, without holding a list of str."""
+        self = cls.__new__(cls)
+        self._extra = set()
+        builder = _BlobBuilder()
+        last = None
+        out_of_order = []
+        for domain in domains:
+            item = domain.encode("utf-8")
+            if last is not None and item <= last:
+                if item != last:
+                    out_of_order.append(item)
+                continue
+            builder.append(item)
+            last = item
+        self._blob, self._offsets = builder.finish()
+        if out_of_order:
+            self._extra.update(i.decode("utf-8") for i in out_of_order if not self._in_blob(i))
+            self._merge()
+        return self
+
+    def _load(self, sorted_items):
+        builder = _BlobBuilder()
+        for item in sorted_items:
+            builder.append(item)
+        self._blob, self._offsets = builder.finish()
+
+    def _in_blob(self, item):
+        view = _SortedView(self._blob, self._offsets)
+        i = bisect.bisect_left(view, item)
+        return i < len(view) and view[i] == item
+
+    def _merge(self):
+        """Folds the overflow set into the sorted blob."""
+        if not self._extra:
+            return
+        extra = sorted(d.encode("utf-8") for d in self._extra)
+        self._extra = set()
+        self._load(_merge_sorted(self._iter_blob(), extra))
+
+    def _iter_blob(self):
+        blob, offsets = self._blob, self._offsets
+        for i in range(len(offsets) - 1):
+            yield blob[offsets[i]:offsets[i + 1]]
+
+    def add(self, domain):
+        if domain in self:
+            return
+        self._extra.add(domain)
+        if len(self._extra) > MERGE_THRESHOLD:
+            self._merge()
+
+    def __contains__(self, domain):
+        if domain in self._extra:
+            return True
+        return self._in_blob(domain.encode("utf-8"))
+
+    def __len__(self):
+        return len(self._offsets) - 1 + len(self._extra)
+
+    def __iter__(self):
+        """Yields every domain in sorted order."""
+        extra = sorted(d.encode("utf-8") for d in self._extra)
+        for item in _merge_sorted(self._iter_blob(), extra):
+            yield item.decode("utf-8")
+
+    def nbytes(self):
+        """Approximate heap size of the sorted part (blob + offsets)."""
+        return len(self._blob) + self._offsets.itemsize * len(self._offsets)
+
+def _merge_sorted(a, b):
+    """Merges two sorted iterables of unique bytes, dropping duplicates."""
+    a, b = iter(a), iter(b)
+    x, y = next(a, None), next(b, None)
+    while x is not None and y is not None:
+        if x < y:
+            yield x; x = next(a, None)
+        elif y < x:
+            yield y; y = next(b, None)
+        else:
+            yield x; x, y = next(a, None), next(b, None)
+    while x is not None:
+        yield x; x = next(a, None)
+    while y is not None:
+        yield y; y = next(b, None)
+
+def diff_counts(old, new):
+    """Counts (added, removed) between two sorted collections (e.g. CompactDomainSets) by walking both in order."""
+    added = removed = 0
+    a, b = iter(old), iter(new)
+    x, y = next(a, None), next(b, None)
+    while x is not None and y is not None:
+        if x < y:
+            removed += 1; x = next(a, None)
+        elif y < x:
+            added += 1; y = next(b, None)
+        else:
+            x, y = next(a, None), next(b, None)
+    removed += sum(1 for _ in a) + (x is not None)
+    added += sum(1 for _ in b) + (y is not None)
+    return added, removed
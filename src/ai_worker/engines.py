@@ -0,0 +1,178 @@
+import os
+import sys
+import time
+import logging
+import argparse
+import torch
+from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+# --- CONFIGURATION ---
+MODEL_PATH = "nlp_model"
+INT8_PATH = f"{MODEL_PATH}_int8/model.pt"   # Written by: engines.py export
+ONNX_PATH = f"{MODEL_PATH}_onnx/model.onnx" # Written by: engines.py export
+MAX_LENGTH = 64
+THRESHOLD = 0.90 # Above this UNSAFE probability the domain is blocked
+
+# Reference domains for the parity check (real, hand-labeled lists)
+PARITY_FILES = ["data/blocklists/blacklist.txt", "data/blocklists/whitelist.txt"]
+
+ENGINES = ["torch-fp32", "torch-dynamic-int8", "onnxruntime"]
+
+# CPU only: our DNS boxes have no GPU
+device = torch.device("cpu")
+
+class TorchEngine:
+    """Plain fp32 PyTorch model (the original worker behaviour)."""
+    name = "torch-fp32"
+
+    def __init__(self, model_path=MODEL_PATH):
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        self.model = AutoModelForSequenceClassification.from_pretrained(model_path).to(device)
+        self.model.eval()
+
+    def after_fork(self, threads):
+        """Called in each pool process: the model weights stay shared, only the thread count is per process."""
+        torch.set_num_threads(threads)
+
+    def score(self, domains):
+        """Returns the UNSAFE probability for each domain (one forward pass)."""
+        inputs = self.tokenizer(domains, return_tensors="pt", padding=True, truncation=True, max_length=MAX_LENGTH).to(device)
+        with torch.no_grad():
+            outputs = self.model(**inputs)
+            probs = torch.nn.functional.softmax(outputs.logits, dim=-1)
+        return probs[:, 1].tolist()
+
+class TorchInt8Engine(TorchEngine):
+    """Linear layers dynamically quantized to int8. Loads the exported model if present, otherwise quantizes on the fly."""
+    name = "torch-dynamic-int8"
+
+    def __init__(self, model_path=MODEL_PATH):
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        if os.path.exists(INT8_PATH):
+            self.model = torch.load(INT8_PATH, map_location=device, weights_only=False)
+        else:
+            logging.warning(f"⚠️ {INT8_PATH} not found, quantizing in memory (run: python src/ai_worker/engines.py export)")
+            self.model = quantize_int8(AutoModelForSequenceClassification.from_pretrained(model_path))
+        self.model.eval()
+
+class OnnxEngine:
+    """ONNX Runtime session on the exported graph."""
+    name = "onnxruntime"
+
+    def __init__(self, model_path=MODEL_PATH):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise RuntimeError("onnxruntime is not installed (pip install onnxruntime)")
+        if not os.path.exists(ONNX_PATH):
+            raise RuntimeError(f"{ONNX_PATH} not found (run: python src/ai_worker/engines.py export)")
+
+        self.ort = ort
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        self.session = ort.InferenceSession(ONNX_PATH, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def after_fork(self, threads):
+        """ORT thread pools don't survive fork(), so each pool process opens its own session."""
+        options = self.ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        self.session = self.ort.InferenceSession(ONNX_PATH, options, providers=["CPUExecutionProvider"])
+
+    def score(self, domains):
+        """Returns the UNSAFE probability for each domain (one session run)."""
+        inputs = self.tokenizer(domains, return_tensors="np", padding=True, truncation=True, max_length=MAX_LENGTH)
+        feed = {name: inputs[name].astype("int64") for name in self.input_names}
+        logits = torch.from_numpy(self.session.run(None, feed)[0])
+        return torch.nn.functional.softmax(logits, dim=-1)[:, 1].tolist()
+
+ENGINE_CLASSES = {cls.name: cls for cls in [TorchEngine, TorchInt8Engine, OnnxEngine]}
+
+def load_engine(name, model_path=MODEL_PATH):
+    """Builds the inference engine called `name` (one of ENGINES)."""
+    if name not in ENGINE_CLASSES:
+        raise ValueError(f"Unknown engine '{name}'. Choose one of: {', '.join(ENGINES)}")
+    return ENGINE_CLASSES[name](model_path)
+
+def quantize_int8(model):
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+def export(model_path=MODEL_PATH):
+    """One-time conversion: writes the int8 and ONNX models next to nlp_model."""
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model = AutoModelForSequenceClassification.from_pretrained(model_path)
+    model.eval()
+
+    # 1. ONNX graph (dynamic batch and sequence length)
+    os.makedirs(os.path.dirname(ONNX_PATH), exist_ok=True)
+    sample = tokenizer(["example.com", "another-example.org"], return_tensors="pt", padding=True)
+    torch.onnx.export(
+        model,
+        (sample["input_ids"], sample["attention_mask"]),
+        ONNX_PATH,
+        input_names=["input_ids", "attention_mask"],
+        output_names=["logits"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "sequence"},
+            "attention_mask": {0: "batch", 1: "sequence"},
+            "logits": {0: "batch"},
+        },
+        opset_version=14,
+    )
+    logging.info(f"✅ Wrote {ONNX_PATH}")
+
+    # 2. Dynamic int8 quantization (fp32 weights stay untouched in nlp_model)
+    os.makedirs(os.path.dirname(INT8_PATH), exist_ok=True)
+    torch.save(quantize_int8(model), INT8_PATH)
+    logging.info(f"✅ Wrote {INT8_PATH}")
+
+def load_reference_domains(files=PARITY_FILES):
+    domains = []
+    for filepath in files:
+        if not os.path.exists(filepath): continue
+        with open(filepath, "r", encoding="utf-8", errors="ignore") as f:
+            domains.extend(l.strip() for l in f if l.strip() and not l.startswith("#"))
+    return sorted(set(domains))
+
+def parity(engine_names=ENGINES, domains=None, batch_size=64):
+    """Checks that every engine makes the same block decision as torch-fp32. Returns the number of disagreements."""
+    domains = domains or load_reference_domains()
+    logging.info(f"🔬 Parity check on {len(domains)} reference domains")
+
+    decisions = {}
+    for name in engine_names:
+        engine = load_engine(name)
+        start = time.time()
+        scores = []
+        for i in range(0, len(domains), batch_size):
+            scores.extend(engine.score(domains[i:i + batch_size]))
+        elapsed = time.time() - start
+        decisions[name] = [s > THRESHOLD for s in scores]
+        logging.info(f"    {name}: {len(domains) / elapsed:.1f} domains/sec")
+
+    baseline = decisions[engine_names[0]]
+    mismatches = 0
+    for name in engine_names[1:]:
+        diff = [d for d, a, b in zip(domains, baseline, decisions[name]) if a != b]
+        mismatches += len(diff)
+        if diff:
+            logging.error(f"❌ {name} disagrees with {engine_names[0]} on {len(diff)} domains: {diff[:10]}")
+        else:
+            logging.info(f"✅ {name} matches {engine_names[0]}")
+    return mismatches
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(asctime)s - ENGINES - %(levelname)s - %(message)s', level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Classifier inference engines")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("export", help="Write the int8 and ONNX models next to nlp_model")
+    check = sub.add_parser("parity", help="Fail if engines disagree on the block decision")
+    check.add_argument("--engines", nargs="+", default=ENGINES, choices=ENGINES)
+    check.add_argument("--domains", help="File with one reference domain per line")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export()
+    else:
+        domains = load_reference_domains([args.domains]) if args.domains else None
+        sys.exit(1 if parity(args.engines, domains) else 0)
@@ -0,0 +1,201 @@
+import os
+import time
+import logging
+from collections import OrderedDict
+from domain_set import CompactDomainSet, diff_counts
+from blocklist_index import BlocklistIndex
+from list_store import FEED_LIMIT
+
+def parse_line(line, needs_parsing=False):
+    """Returns the domain on a list line, or None for blanks/comments."""
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    # final_blocklist.txt format: 0.0.0.0 domain.com
+    # The matching ":: domain.com" lines and the localhost header lines are skipped.
+    if needs_parsing:
+        parts = line.split()
+        if len(parts) >= 2 and parts[0] not in ("::", "::1", "127.0.0.1"):
+            return parts[1]
+        return None
+    return line
+
+class ListSource:
+    """A list file (the final list's text, when there is no index yet) plus what we know about it since the last refresh."""
+
+    def __init__(self, path, needs_parsing=False):
+        self.path = path
+        self.needs_parsing = needs_parsing
+        # The final list is huge: a CompactDomainSet instead of a set
+        self.domains = CompactDomainSet()
+        self.mtime = None
+        self.size = 0
+
+    def _iter_domains(self, f):
+        for raw in f:
+            domain = parse_line(raw.decode("utf-8", errors="ignore"), self.needs_parsing)
+            if domain:
+                yield domain
+
+    def refresh(self):
+        """Brings self.domains up to date with the file. Returns (added, removed) counts."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            removed = len(self.domains)
+            self.domains = CompactDomainSet()
+            self.mtime, self.size = None, 0
+            return 0, removed
+
+        # 1. Untouched since last time: nothing to do
+        if (st.st_mtime_ns, st.st_size) == (self.mtime, self.size):
+            return 0, 0
+
+        # 2. Rewritten: build the new blob straight from the (sorted) file,
+        # then count the diff by walking old and new side by side.
+        with open(self.path, "rb") as f:
+            new = CompactDomainSet.from_sorted(self._iter_domains(f))
+        added, removed = diff_counts(self.domains, new)
+        self.domains = new
+        self.mtime, self.size = st.st_mtime_ns, st.st_size
+        return added, removed
+
+class IndexSource:
+    """
+    The manager's compiled index of the final list, mmapped: the domains stay in the page
+    cache (shared with every other process using the index) instead of in our heap.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.domains = frozenset()
+
+    def refresh(self):
+        """Re-opens the index once the manager swapped in a new one. Returns (added, removed) counts."""
+        if isinstance(self.domains, BlocklistIndex) and not self.domains.changed():
+            return 0, 0
+        if not os.path.exists(self.path):
+            removed = len(self.domains)
+            self.domains = frozenset()
+            return 0, removed
+
+        old, new = self.domains, BlocklistIndex(self.path)
+        if isinstance(old, BlocklistIndex):
+            added, removed = (0, 0) if old.content_hash == new.content_hash else diff_counts(old.keys(), new.keys())
+            old.close()
+        else:
+            added, removed = len(new), 0
+        self.domains = new
+        return added, removed
+
+class StoreSource:
+    """Lists from the shared list store (list_store.py), kept current through its change feed."""
+
+    def __init__(self, store, lists):
+        self.store = store
+        self.lists = set(lists)
+        self.path = store.path
+        self.domains = {} # domain -> names of the lists it is on
+        self.version = None
+
+    def _reload(self):
+        version = self.store.version() # Read first: changes after it are replayed (idempotently) next time
+        domains = {}
+        for name in self.lists:
+            for domain in self.store.members(name):
+                domains.setdefault(domain, set()).add(name)
+        added = len(domains.keys() - self.domains.keys())
+        removed = len(self.domains.keys() - domains.keys())
+        self.domains, self.version = domains, version
+        return added, removed
+
+    def refresh(self):
+        """Applies the changes since the last refresh. Returns (added, removed) counts."""
+        if self.version is None or self.version < self.store.oldest_version() - 1:
+            return self._reload()
+        added = removed = 0
+        while True:
+            changes = self.store.changes_since(self.version)
+            for version, name, domain, op in changes:
+                self.version = version
+                if name not in self.lists:
+                    continue
+                lists = self.domains.get(domain)
+                if op == "+":
+                    if lists is None:
+                        lists = self.domains[domain] = set()
+                        added += 1
+                    lists.add(name)
+                elif lists is not None:
+                    lists.discard(name)
+                    if not lists:
+                        del self.domains[domain]
+                        removed += 1
+            if len(changes) < FEED_LIMIT:
+                return added, removed
+
+class IgnoreCache:
+    """Every domain the worker should skip, kept current by change-driven refreshes."""
+
+    def __init__(self, sources):
+        self.sources = sources
+        self.local = set() # Domains the worker itself just blocked (until the file refresh sees them)
+
+    def refresh(self):
+        """Re-reads only the lists that changed. Returns True if anything changed."""
+        changed = False
+        for source in self.sources:
+            added, removed = source.refresh()
+            if added or removed:
+                changed = True
+                logging.info(f"🔄 {os.path.basename(source.path)}: +{added} / -{removed}")
+        if changed:
+            self.local.clear()
+        return changed
+
+    def add(self, domain):
+        self.local.add(domain)
+
+    def __contains__(self, domain):
+        if domain in self.local:
+            return True
+        return any(domain in source.domains for source in self.sources)
+
+    def __len__(self):
+        return sum(len(source.domains) for source in self.sources) + len(self.local)
+
+class VerdictCache:
+    """
+    Bounded LRU of recent model verdicts (SAFE ones too, which no list remembers), each valid
+    for `ttl` seconds. Keyed by registrable domain, so every subdomain of a site shares one entry.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.items = OrderedDict() # site -> (blocked, expires)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, site, now=None):
+        """The cached verdict (True = blocked), or None if unknown or expired."""
+        now = now or time.time()
+        entry = self.items.get(site)
+        if entry is None or entry[1] <= now:
+            if entry is not None:
+                del self.items[site]
+            self.misses += 1
+            return None
+        self.items.move_to_end(site)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, site, blocked, now=None):
+        self.items[site] = (blocked, (now or time.time()) + self.ttl)
+        self.items.move_to_end(site)
+        if len(self.items) > self.max_size:
+            self.items.popitem(last=False)
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
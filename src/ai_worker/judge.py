@@ -1,94 +1,267 @@
 from google import genai
 from google.genai import types
 from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from types import SimpleNamespace
+import threading
+import json
+import re
 import time
 import os
 import sys
 import requests
-from bs4 import BeautifulSoup
+from judge_cache import JudgeCache, OFFLINE
+from list_store import ListStore
+from page_head import fetch_head
 
 # --- CONFIGURATION ---
 load_dotenv()
 API_KEY = os.getenv("API_KEY")
 MODEL_NAME = "gemma-3-12b-it"
 
-# File Paths
-AI_BLOCKS_FILE = "data/blocklists/ai_blocks.txt"
-BLACKLIST_FILE = "data/blocklists/blacklist.txt"
-WHITELIST_FILE = "data/blocklists/whitelist.txt"
+# Concurrency
+SCRAPE_WORKERS = int(os.getenv("JUDGE_WORKERS", "16"))  # Suspects scraped/judged at the same time
+LLM_RATE = float(os.getenv("JUDGE_LLM_RATE", "0.5"))    # LLM calls per second (token bucket refill)
+LLM_BURST = int(os.getenv("JUDGE_LLM_BURST", "5"))      # Calls allowed back-to-back after a quiet spell
+LLM_CLIENT = os.getenv("JUDGE_LLM_CLIENT", "gemini")    # "gemini" or "stub" (offline throughput testing)
+BATCH_SIZE = int(os.getenv("JUDGE_BATCH_SIZE", "10"))   # Domains packed into one LLM prompt (1 = one prompt per domain)
 
-# Setup Client
-if not API_KEY:
-    print("❌ Error: API_KEY not found in environment variables.")
-    sys.exit(1)
+class RateLimiter:
+    """Token bucket shared by all threads. A 429 pauses everyone with exponential backoff."""
 
-try:
-    client = genai.Client(api_key=API_KEY)
-except Exception as e:
-    print(f"❌ Configuration Error: {e}")
-    sys.exit(1)
+    def __init__(self, rate=LLM_RATE, burst=LLM_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last = time.monotonic()
+        self.paused_until = 0.0
+        self.backoff = 0.0
+        self.calls = 0 # LLM requests made (including retries)
+        self.lock = threading.Lock()
 
-def get_lines(filepath):
-    if not os.path.exists(filepath): return []
-    with open(filepath, "r") as f:
-        return sorted(list(set([l.strip() for l in f if l.strip()])))
+    def acquire(self):
+        """Blocks until a call is allowed."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    self.calls += 1
+                    return
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
 
-def append_line(filepath, line):
-    with open(filepath, "a") as f:
-        f.write(f"{line}\n")
+    def throttled(self):
+        """Called on a 429: back off 2s, 4s, 8s... (max 60s) and drain the bucket."""
+        with self.lock:
+            self.backoff = min(60.0, self.backoff * 2 or 2.0)
+            self.paused_until = max(self.paused_until, time.monotonic() + self.backoff)
+            self.tokens = 0
 
-def overwrite_file(filepath, lines):
-    with open(filepath, "w") as f:
-        f.write("\n".join(lines) + "\n")
+    def succeeded(self):
+        with self.lock:
+            self.backoff = 0.0
+
+class StubClient:
+    """Offline stand-in for genai.Client: answers by keyword after a fake network delay."""
+
+    class _Models:
+        UNSAFE_WORDS = ("porn", "xxx", "sex", "casino", "bet", "slot", "poker")
+
+        def generate_content(self, model, contents):
+            time.sleep(float(os.getenv("JUDGE_STUB_LATENCY", "0.3")))
+            verdicts = []
+            for domain, content in re.findall(r'Domain: "(.*?)"\s*Content: "(.*?)"', contents):
+                unsafe = any(w in f"{domain} {content}".lower() for w in self.UNSAFE_WORDS)
+                verdicts.append({"domain": domain, "verdict": "UNSAFE" if unsafe else "SAFE"})
+            if "JSON" in contents:
+                return SimpleNamespace(text=json.dumps(verdicts))
+            return SimpleNamespace(text=verdicts[0]["verdict"] if verdicts else "SAFE")
+
+    def __init__(self):
+        self.models = self._Models()
+
+def make_client():
+    if LLM_CLIENT == "stub":
+        return StubClient()
+
+    # Setup Client
+    if not API_KEY:
+        print("❌ Error: API_KEY not found in environment variables.")
+        sys.exit(1)
 
-def get_website_info(domain):
     try:
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
-        url = f"http://{domain}"
-        response = requests.get(url, headers=headers, timeout=5) # Increased timeout
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.text, 'html.parser')
-            title = soup.title.string.strip() if soup.title else "No Title"
-            meta = soup.find('meta', attrs={'name': 'description'})
-            desc = meta['content'].strip() if meta else "No Description"
-            return f"Title: {title[:100]} | Description: {desc[:200]}"
-    except:
-        return "Offline/Blocked"
-    return "No Data"
-
-def ask_the_judge(domain, site_info):
-    prompt = f"""
-    Domain: "{domain}"
-    Content: "{site_info}"
-    Task: Classify as SAFE or UNSAFE.
-    Rules:
+        return genai.Client(api_key=API_KEY)
+    except Exception as e:
+        print(f"❌ Configuration Error: {e}")
+        sys.exit(1)
+
+client = make_client()
+limiter = RateLimiter()
+cache = JudgeCache()
+store = ListStore() # ai_blocks / blacklist / whitelist, shared with the worker and the dashboard
+
+# One pooled HTTP session for all scraper threads (keep-alive, bounded connections)
+session = requests.Session()
+session.headers['User-Agent'] = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+session.mount("http://", requests.adapters.HTTPAdapter(pool_connections=SCRAPE_WORKERS, pool_maxsize=SCRAPE_WORKERS))
+session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=SCRAPE_WORKERS, pool_maxsize=SCRAPE_WORKERS))
+
+# Fetch timing/bandwidth for the run summary
+fetch_stats = {"pages": 0, "bytes": 0, "seconds": 0.0}
+fetch_lock = threading.Lock()
+
+def scrape(domain):
+    """Fetches the page head. Returns (evidence, http_status, title, description); http_status is None if it failed."""
+    try:
+        page = fetch_head(session, f"http://{domain}", timeout=5)
+    except Exception:
+        return OFFLINE, None, None, None
+
+    with fetch_lock:
+        fetch_stats["pages"] += 1
+        fetch_stats["bytes"] += page["bytes_read"]
+        fetch_stats["seconds"] += page["elapsed"]
+
+    if page["status"] != 200:
+        return "No Data", page["status"], None, None
+    title = page["title"] or page["og"].get("title") or "No Title"
+    desc = page["description"] or page["og"].get("description") or "No Description"
+    return f"Title: {title[:100]} | Description: {desc[:200]}", 200, title, desc
+
+def get_website_info(domain):
+    cached = cache.get_evidence(domain)
+    if cached is not None:
+        return cached
+    evidence, http_status, title, desc = scrape(domain)
+    cache.put_evidence(domain, evidence, http_status, title, desc)
+    return evidence
+
+RULES = """Rules:
     - UNSAFE: Porn, Gambling, Malware, Phishing.
-    - SAFE: News, Blogs, Shops, Tech, Social.
-    Reply ONE word: SAFE or UNSAFE.
-    """
-    
+    - SAFE: News, Blogs, Shops, Tech, Social."""
+
+def call_llm(prompt):
+    """Sends one prompt (rate limited, retried on 429). Returns the reply text, or None on error."""
     # Retry logic inside the request
-    for attempt in range(3):
+    for attempt in range(5):
+        limiter.acquire()
         try:
             response = client.models.generate_content(model=MODEL_NAME, contents=prompt)
-            answer = response.text.strip().upper()
-            if "UNSAFE" in answer: return "UNSAFE"
-            if "SAFE" in answer: return "SAFE"
+            limiter.succeeded()
+            return response.text
         except Exception as e:
             if "429" in str(e): # Rate Limit
-                time.sleep(10) # Wait a bit
+                limiter.throttled() # Every thread backs off, not just this one
             else:
                 print(f"  ⚠️ Error: {e}")
-                return "ERROR"
-    return "ERROR"
+                return None
+    return None
+
+def ask_the_judge(domain, site_info, check_cache=True):
+    prompt = f"""
+    Domain: "{domain}"
+    Content: "{site_info}"
+    Task: Classify as SAFE or UNSAFE.
+    {RULES}
+    Reply ONE word: SAFE or UNSAFE.
+    """
+    cached = cache.get_verdict(domain) if check_cache else None
+    if cached:
+        return cached
+
+    answer = (call_llm(prompt) or "").strip().upper()
+    verdict = "ERROR"
+    if "UNSAFE" in answer: verdict = "UNSAFE"
+    elif "SAFE" in answer: verdict = "SAFE"
+    cache.put_verdict(domain, verdict)
+    return verdict
+
+# LLM calls saved by batching: a batch prompt answers N domains with one call, a rejected one
+# costs a call that its split halves then repeat. Cache hits are counted by the cache.
+batch_stats = {"prompts": 0, "saved": 0}
+batch_lock = threading.Lock()
+
+def count_batch(domains, answered):
+    with batch_lock:
+        batch_stats["prompts"] += 1
+        batch_stats["saved"] += domains - 1 if answered else -1
+
+def parse_batch_verdicts(text, domains):
+    """Validates a JSON batch reply: exactly one SAFE/UNSAFE verdict per domain. Returns {domain: verdict} or None."""
+    if not text:
+        return None
+    # Models like to wrap JSON in ```json fences or add a sentence around it
+    start, end = text.find("["), text.rfind("]")
+    if start == -1 or end < start:
+        return None
+    try:
+        items = json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+
+    verdicts = {}
+    for item in items:
+        if not isinstance(item, dict):
+            return None
+        domain = str(item.get("domain", "")).strip().lower()
+        verdict = str(item.get("verdict", "")).strip().upper()
+        if domain not in domains or domain in verdicts or verdict not in ("SAFE", "UNSAFE"):
+            return None
+        verdicts[domain] = verdict
+    if len(verdicts) != len(domains):
+        return None
+    return verdicts
+
+def ask_the_judge_batch(cases):
+    """Judges [(domain, site_info), ...] in one prompt. A bad reply is split in half and retried, down to single prompts."""
+    # Verdicts still backed by fresh cached evidence need no LLM call
+    results = {}
+    for domain, _ in cases:
+        cached = cache.get_verdict(domain)
+        if cached:
+            results[domain] = cached
+    cases = [(domain, site_info) for domain, site_info in cases if domain not in results]
+    if not cases:
+        return results
+
+    if len(cases) == 1:
+        domain, site_info = cases[0]
+        return {**results, domain: ask_the_judge(domain, site_info, check_cache=False)}
+
+    websites = "\n".join(
+        f'    {i+1}. Domain: "{domain}"\n       Content: "{site_info.replace(chr(34), chr(39))}"'
+        for i, (domain, site_info) in enumerate(cases)
+    )
+    prompt = f"""
+    Classify each website below as SAFE or UNSAFE.
+    {RULES}
+    Websites:
+{websites}
+    Reply with ONLY a JSON array containing one object per website, in the same order:
+    [{{"domain": "<domain>", "verdict": "SAFE" or "UNSAFE"}}]
+    """
+    verdicts = parse_batch_verdicts(call_llm(prompt), {domain.lower() for domain, _ in cases})
+    count_batch(len(cases), verdicts is not None)
+    if verdicts is not None:
+        for domain, _ in cases:
+            results[domain] = verdicts[domain.lower()]
+            cache.put_verdict(domain, results[domain])
+        return results
+
+    half = len(cases) // 2
+    return {**results, **ask_the_judge_batch(cases[:half]), **ask_the_judge_batch(cases[half:])}
 
 def main():
-    suspects = get_lines(AI_BLOCKS_FILE)
+    suspects = store.members("ai_blocks")
     if not suspects:
         print("DONE_SIGNAL")
         return
 
-    print(f"👨‍⚖️  Judge starting on {len(suspects)} cases...")
+    print(f"👨‍⚖️  Judge starting on {len(suspects)} cases ({SCRAPE_WORKERS} at a time, {LLM_RATE:g} LLM calls/sec)...")
+    start = time.time()
     
     # List to keep domains that fail/error so we can try again later
     retry_list = []
@@ -96,31 +269,67 @@ def main():
     safe_count = 0
     banned_count = 0
 
-    for i, domain in enumerate(suspects):
-        print(f"[{i+1}/{len(suspects)}] {domain}...", end=" ", flush=True)
-        
-        evidence = get_website_info(domain)
-        verdict = ask_the_judge(domain, evidence)
-        
-        print(f"[{verdict}]")
-
-        if verdict == "SAFE":
-            append_line(WHITELIST_FILE, domain)
-            safe_count += 1
-        elif verdict == "UNSAFE":
-            append_line(BLACKLIST_FILE, domain)
-            banned_count += 1
-        else:
-            # If ERROR, keep it in the list!
-            retry_list.append(domain)
-
-        time.sleep(2) # Politeness delay
-
-    # IMPORTANT: Overwrite the file with ONLY the ones that failed
-    # This removes the processed ones but keeps the errors for next time.
-    overwrite_file(AI_BLOCKS_FILE, retry_list)
-
-    print(f"✅ DONE. Banned: {banned_count}, Safe: {safe_count}, Retrying Next Time: {len(retry_list)}")
+    def record(verdicts):
+        nonlocal safe_count, banned_count
+        safe, unsafe = [], []
+        for domain, verdict in verdicts.items():
+            done = safe_count + banned_count + len(retry_list) + 1
+            print(f"[{done}/{len(suspects)}] {domain}... [{verdict}]")
+
+            if verdict == "SAFE":
+                safe.append(domain)
+                safe_count += 1
+            elif verdict == "UNSAFE":
+                unsafe.append(domain)
+                banned_count += 1
+            else:
+                # If ERROR, keep it in the list!
+                retry_list.append(domain)
+
+        # Each move is one transaction: domains the worker adds to ai_blocks meanwhile are never lost
+        store.move(safe, "ai_blocks", "whitelist")
+        store.move(unsafe, "ai_blocks", "blacklist")
+
+    with ThreadPoolExecutor(max_workers=SCRAPE_WORKERS) as scrapers, ThreadPoolExecutor(max_workers=SCRAPE_WORKERS) as judges:
+        scrapes = {scrapers.submit(get_website_info, domain): domain for domain in suspects}
+        pending = set(scrapes)
+        remaining = len(scrapes)
+        batch = []
+
+        # Evidence is packed into batches as it arrives; verdicts are moved to their
+        # lists as each batch completes.
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in scrapes:
+                    remaining -= 1
+                    try:
+                        evidence = future.result()
+                    except Exception:
+                        evidence = "Offline/Blocked"
+                    batch.append((scrapes[future], evidence))
+                    if len(batch) >= BATCH_SIZE or remaining == 0:
+                        pending.add(judges.submit(ask_the_judge_batch, batch))
+                        batch = []
+                else:
+                    try:
+                        verdicts = future.result()
+                    except Exception as e:
+                        print(f"  ⚠️ Error: {e}")
+                        continue
+                    record(verdicts)
+
+    # Judged domains were moved out of ai_blocks above; the errors stay there for next time.
+
+    elapsed = time.time() - start
+    print(f"✅ DONE. Banned: {banned_count}, Safe: {safe_count}, Retrying Next Time: {len(retry_list)} "
+          f"({len(suspects) / max(elapsed, 1e-9):.2f} cases/sec)")
+    if fetch_stats["pages"]:
+        print(f"🌐 Fetched {fetch_stats['pages']} page heads: {fetch_stats['bytes'] / fetch_stats['pages'] / 1024:.1f} KB "
+              f"and {fetch_stats['seconds'] / fetch_stats['pages'] * 1000:.0f} ms per page on average")
+    print(f"🗄️  Cache hits: {cache.hit_ratios()} (pruned {cache.prune()} old entries)")
+    print(f"📦 LLM calls: {limiter.calls} for {len(suspects)} cases (batching saved {batch_stats['saved']} "
+          f"with {batch_stats['prompts']} batch prompts of up to {BATCH_SIZE})")
     print("DONE_SIGNAL")
 
 if __name__ == "__main__":
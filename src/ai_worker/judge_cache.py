@@ -0,0 +1,116 @@
+import os
+import time
+import sqlite3
+import threading
+
+# --- CONFIGURATION ---
+CACHE_FILE = os.getenv("JUDGE_CACHE_FILE", "data/cache/judge_cache.db")
+
+# How long scraped evidence (and the verdict based on it) stays valid, by kind of result
+TTL_POSITIVE = int(os.getenv("JUDGE_TTL_POSITIVE", str(7 * 86400))) # Page fetched (HTTP 200)
+TTL_NEGATIVE = int(os.getenv("JUDGE_TTL_NEGATIVE", str(86400)))     # Reachable, but no usable page
+TTL_OFFLINE = int(os.getenv("JUDGE_TTL_OFFLINE", str(3600)))        # Offline/Blocked (connection failed)
+MAX_ENTRIES = int(os.getenv("JUDGE_CACHE_MAX", "100000"))           # Least recently used rows go first
+
+OFFLINE = "Offline/Blocked"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS judge_cache (
+    domain      TEXT PRIMARY KEY,
+    title       TEXT,
+    description TEXT,
+    evidence    TEXT NOT NULL,
+    http_status INTEGER,          -- NULL when the fetch failed (Offline/Blocked)
+    fetched_at  REAL NOT NULL,
+    verdict     TEXT,             -- SAFE / UNSAFE once judged
+    judged_at   REAL,
+    last_used   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS judge_cache_last_used ON judge_cache (last_used);
+"""
+
+def ttl_for(http_status):
+    if http_status is None:
+        return TTL_OFFLINE
+    if http_status == 200:
+        return TTL_POSITIVE
+    return TTL_NEGATIVE
+
+class JudgeCache:
+    """On-disk (SQLite) cache of scraped evidence and verdicts, shared by all judge threads."""
+
+    def __init__(self, path=CACHE_FILE):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self.stats = {"evidence_hits": 0, "evidence_misses": 0, "verdict_hits": 0, "verdict_misses": 0}
+
+    def _fresh_row(self, domain):
+        row = self.db.execute(
+            "SELECT evidence, http_status, fetched_at, verdict FROM judge_cache WHERE domain = ?", (domain,)
+        ).fetchone()
+        if row and time.time() - row[2] < ttl_for(row[1]):
+            self.db.execute("UPDATE judge_cache SET last_used = ? WHERE domain = ?", (time.time(), domain))
+            return row
+        return None
+
+    def get_evidence(self, domain):
+        """Returns the cached evidence string, or None if missing/expired."""
+        with self.lock:
+            row = self._fresh_row(domain)
+            self.stats["evidence_hits" if row else "evidence_misses"] += 1
+            return row[0] if row else None
+
+    def put_evidence(self, domain, evidence, http_status=None, title=None, description=None):
+        """Stores freshly scraped evidence. Any verdict based on older evidence is dropped."""
+        now = time.time()
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO judge_cache (domain, title, description, evidence, http_status, fetched_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (domain, title, description, evidence, http_status, now, now),
+            )
+
+    def get_verdict(self, domain):
+        """Returns a cached SAFE/UNSAFE verdict whose evidence is still fresh, or None."""
+        with self.lock:
+            row = self._fresh_row(domain)
+            verdict = row[3] if row else None
+            self.stats["verdict_hits" if verdict else "verdict_misses"] += 1
+            return verdict
+
+    def put_verdict(self, domain, verdict):
+        if verdict not in ("SAFE", "UNSAFE"):
+            return # Errors are never cached, so they get judged again next time
+        with self.lock:
+            self.db.execute(
+                "UPDATE judge_cache SET verdict = ?, judged_at = ? WHERE domain = ?", (verdict, time.time(), domain)
+            )
+
+    def prune(self):
+        """Deletes expired rows, then the least recently used ones above MAX_ENTRIES. Returns rows removed."""
+        now = time.time()
+        with self.lock:
+            removed = self.db.execute(
+                "DELETE FROM judge_cache WHERE "
+                "(http_status IS NULL AND fetched_at < ?) OR "
+                "(http_status = 200 AND fetched_at < ?) OR "
+                "(http_status IS NOT NULL AND http_status != 200 AND fetched_at < ?)",
+                (now - TTL_OFFLINE, now - TTL_POSITIVE, now - TTL_NEGATIVE),
+            ).rowcount
+            removed += self.db.execute(
+                "DELETE FROM judge_cache WHERE domain IN ("
+                "SELECT domain FROM judge_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (MAX_ENTRIES,),
+            ).rowcount
+        return removed
+
+    def hit_ratios(self):
+        """Human-readable per-run hit ratios."""
+        def ratio(hits, misses):
+            total = self.stats[hits] + self.stats[misses]
+            return f"{self.stats[hits]}/{total} ({self.stats[hits] / total:.0%})" if total else "0/0"
+        return (f"evidence {ratio('evidence_hits', 'evidence_misses')}, "
+                f"verdicts {ratio('verdict_hits', 'verdict_misses')}")
@@ -0,0 +1,257 @@
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import threading
+
+# --- CONFIGURATION ---
+STORE_FILE = os.getenv("LIST_STORE_FILE", "data/blocklists/lists.db")
+BLOCK_DIR = "data/blocklists"
+
+# The shared lists and the text files exported for CoreDNS/the manager (and imported once on first use)
+LIST_FILES = {
+    "ai_blocks": f"{BLOCK_DIR}/ai_blocks.txt",
+    "blacklist": f"{BLOCK_DIR}/blacklist.txt",
+    "whitelist": f"{BLOCK_DIR}/whitelist.txt",
+}
+
+BUSY_TIMEOUT_MS = 10_000 # How long a writer waits for another process's transaction
+FEED_LIMIT = 10_000 # Changes returned per changes_since() call
+FEED_RETENTION = 7 * 86400 # Older changes are pruned; a reader that far behind reloads the lists
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS list_entries (
+    list     TEXT NOT NULL,
+    domain   TEXT NOT NULL,
+    added_at REAL NOT NULL,
+    PRIMARY KEY (list, domain)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS list_entries_domain ON list_entries (domain);
+
+-- Change feed: every add/remove gets the next version number
+CREATE TABLE IF NOT EXISTS list_changes (
+    version INTEGER PRIMARY KEY AUTOINCREMENT,
+    list    TEXT NOT NULL,
+    domain  TEXT NOT NULL,
+    op      TEXT NOT NULL,    -- '+' added, '-' removed
+    at      REAL NOT NULL
+);
+
+-- Bookkeeping: which text files were imported, and at which version each was last exported
+CREATE TABLE IF NOT EXISTS list_meta (
+    key   TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+class ListStore:
+    """
+    The ai_blocks / blacklist / whitelist lists in SQLite (WAL), shared by the worker, the judge,
+    the bridge and the dashboard. Writes are transactions, so concurrent writers never lose
+    entries, and every change is numbered so readers can poll changes_since(version).
+    """
+
+    def __init__(self, path=STORE_FILE, list_files=LIST_FILES):
+        self.path = path
+        self.list_files = list_files
+        self.lock = threading.Lock()
+        self.pid = None
+        self._db = None
+        self.import_text_files()
+
+    @property
+    def db(self):
+        # A SQLite connection must not be used across fork(): pool processes open their own
+        if self.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=BUSY_TIMEOUT_MS / 1000)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(SCHEMA)
+            self.pid = os.getpid()
+        return self._db
+
+    def _check(self, name):
+        if name not in self.list_files:
+            raise ValueError(f"Unknown list '{name}'. Choose one of: {', '.join(self.list_files)}")
+
+    def _write(self, fn):
+        """Runs fn(db) in one IMMEDIATE transaction (takes the write lock up front, so it can't deadlock)."""
+        with self.lock:
+            db = self.db
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(db)
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            return result
+
+    # --- WRITES ---
+    @staticmethod
+    def _add(db, name, domains, now):
+        added = []
+        for domain in domains:
+            if db.execute("INSERT OR IGNORE INTO list_entries (list, domain, added_at) VALUES (?, ?, ?)",
+                          (name, domain, now)).rowcount:
+                added.append((name, domain, "+", now))
+        db.executemany("INSERT INTO list_changes (list, domain, op, at) VALUES (?, ?, ?, ?)", added)
+        return len(added)
+
+    @staticmethod
+    def _remove(db, name, domains, now):
+        removed = []
+        for domain in domains:
+            if db.execute("DELETE FROM list_entries WHERE list = ? AND domain = ?", (name, domain)).rowcount:
+                removed.append((name, domain, "-", now))
+        db.executemany("INSERT INTO list_changes (list, domain, op, at) VALUES (?, ?, ?, ?)", removed)
+        return len(removed)
+
+    def add(self, name, domains):
+        """Adds domains to a list. Returns how many were new."""
+        self._check(name)
+        domains = _clean(domains)
+        return self._write(lambda db: self._add(db, name, domains, time.time())) if domains else 0
+
+    def remove(self, name, domains):
+        """Removes domains from a list. Returns how many were there."""
+        self._check(name)
+        domains = _clean(domains)
+        return self._write(lambda db: self._remove(db, name, domains, time.time())) if domains else 0
+
+    def move(self, domains, source, target):
+        """Moves domains from one list to another in a single transaction. Returns how many were added to target."""
+        self._check(source)
+        self._check(target)
+        domains = _clean(domains)
+        if not domains:
+            return 0
+
+        def fn(db):
+            now = time.time()
+            self._remove(db, source, domains, now)
+            return self._add(db, target, domains, now)
+        return self._write(fn)
+
+    # --- READS ---
+    def contains(self, name, domain):
+        with self.lock:
+            return self.db.execute("SELECT 1 FROM list_entries WHERE list = ? AND domain = ?", (name, domain)).fetchone() is not None
+
+    def lists_of(self, domain):
+        """Names of the lists that contain `domain`."""
+        with self.lock:
+            return [row[0] for row in self.db.execute("SELECT list FROM list_entries WHERE domain = ?", (domain,))]
+
+    def count(self, name):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM list_entries WHERE list = ?", (name,)).fetchone()[0]
+
+    def members(self, name):
+        """All domains of a list, sorted."""
+        with self.lock:
+            return [row[0] for row in self.db.execute("SELECT domain FROM list_entries WHERE list = ? ORDER BY domain", (name,))]
+
+    def page(self, name, start=0, length=10, search="", descending=False):
+        """One page of a list (sorted by domain, optionally filtered by substring). Returns (rows, matching count)."""
+        where, params = "list = ?", [name]
+        if search:
+            where += " AND instr(domain, ?) > 0"
+            params.append(search)
+        order = "DESC" if descending else "ASC"
+        with self.lock:
+            matching = self.db.execute(f"SELECT COUNT(*) FROM list_entries WHERE {where}", params).fetchone()[0]
+            rows = [row[0] for row in self.db.execute(
+                f"SELECT domain FROM list_entries WHERE {where} ORDER BY domain {order} LIMIT ? OFFSET ?",
+                params + [length, start])]
+        return rows, matching
+
+    # --- CHANGE FEED ---
+    def version(self):
+        with self.lock:
+            return self.db.execute("SELECT COALESCE(MAX(version), 0) FROM list_changes").fetchone()[0]
+
+    def oldest_version(self):
+        """Oldest version still in the feed. A reader whose version is older than this - 1 must reload."""
+        with self.lock:
+            return self.db.execute("SELECT COALESCE(MIN(version), 0) FROM list_changes").fetchone()[0]
+
+    def prune_changes(self, max_age=FEED_RETENTION):
+        """Drops feed entries older than max_age (the newest one is always kept). Returns rows removed."""
+        return self._write(lambda db: db.execute(
+            "DELETE FROM list_changes WHERE at < ? AND version < (SELECT MAX(version) FROM list_changes)",
+            (time.time() - max_age,)).rowcount)
+
+    def changes_since(self, version, limit=FEED_LIMIT):
+        """[(version, list, domain, op)] after `version`, oldest first. Call again with the last version to page on."""
+        with self.lock:
+            return self.db.execute(
+                "SELECT version, list, domain, op FROM list_changes WHERE version > ? ORDER BY version LIMIT ?",
+                (version, limit),
+            ).fetchall()
+
+    # --- TEXT FILES ---
+    def import_text_files(self):
+        """First use only: seeds each list from its existing text file."""
+        def fn(db):
+            for name, path in self.list_files.items():
+                key = f"imported:{name}"
+                if db.execute("SELECT 1 FROM list_meta WHERE key = ?", (key,)).fetchone():
+                    continue
+                if os.path.exists(path):
+                    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                        self._add(db, name, _clean(f), time.time())
+                db.execute("INSERT INTO list_meta (key, value) VALUES (?, 1)", (key,))
+        self._write(fn)
+
+    def export(self, name):
+        """Rewrites the list's text file (atomically) if the list changed since the last export. Returns True if written."""
+        self._check(name)
+        path = self.list_files[name]
+        with self.lock:
+            current = self.db.execute(
+                "SELECT COALESCE(MAX(version), 0) FROM list_changes WHERE list = ?", (name,)).fetchone()[0]
+            row = self.db.execute("SELECT value FROM list_meta WHERE key = ?", (f"exported:{name}",)).fetchone()
+        if row and row[0] == current and os.path.exists(path):
+            return False
+        domains = self.members(name)
+        with open(f"{path}.tmp", "w") as f:
+            f.write("".join(f"{domain}\n" for domain in domains))
+        os.replace(f"{path}.tmp", path)
+        self._write(lambda db: db.execute(
+            "INSERT OR REPLACE INTO list_meta (key, value) VALUES (?, ?)", (f"exported:{name}", current)))
+        return True
+
+    def export_all(self):
+        """Exports every changed list and prunes the change feed. Returns the names written."""
+        written = [name for name in self.list_files if self.export(name)]
+        self.prune_changes()
+        return written
+
+def _clean(domains):
+    """Strips, lowercases and dedupes (keeping order); drops blanks and comments."""
+    cleaned = (d.strip().lower() for d in domains)
+    return list(dict.fromkeys(d for d in cleaned if d and not d.startswith("#")))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared block/allow list store")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("export", help="Write the text files (for CoreDNS and the manager)")
+    sub.add_parser("stats", help="Print list sizes and the current version")
+    feed = sub.add_parser("changes", help="Print the change feed")
+    feed.add_argument("--since", type=int, default=0)
+    args = parser.parse_args()
+
+    store = ListStore()
+    if args.command == "export":
+        print(f"Exported: {', '.join(store.export_all()) or 'nothing changed'}")
+    elif args.command == "stats":
+        for name in store.list_files:
+            print(f"{name}: {store.count(name)}")
+        print(f"version: {store.version()}")
+    else:
+        for version, name, domain, op in store.changes_since(args.since):
+            print(f"{version}\t{op}{domain}\t{name}")
+    sys.exit(0)
@@ -1,6 +1,18 @@
 import os
+import re
+import sys
+import json
+import hashlib
+import time
+import ipaddress
+import heapq
+import resource
+import tempfile
 import requests
 import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from blocklist_index import BlocklistIndex, write_index, reversed_key, key_domain
+from list_store import ListStore
 
 # --- CONFIGURATION ---
 # FIXED: Variable name is now consistent everywhere
@@ -10,6 +22,32 @@ FINAL_FILE = f"{BLOCKLIST_DIR}/final_blocklist.txt"
 AI_FILE = f"{BLOCKLIST_DIR}/ai_blocks.txt"
 WHITELIST_FILE = f"{BLOCKLIST_DIR}/whitelist.txt"
 BLACKLIST_FILE = f"{BLOCKLIST_DIR}/blacklist.txt"
+# Wildcard-capable output: subdomains of a blocked parent are collapsed into one *.parent rule
+RPZ_FILE = f"{BLOCKLIST_DIR}/final_blocklist.rpz"
+# Compiled, mmap-able copy of the final list (see blocklist_index.py) for the worker and dashboard
+INDEX_FILE = f"{BLOCKLIST_DIR}/final_blocklist.idx"
+# Previous build (hash + counts) and the added/removed diff against it
+MANIFEST_FILE = f"{BLOCKLIST_DIR}/final_blocklist.manifest.json"
+DIFF_FILE = f"{BLOCKLIST_DIR}/final_blocklist.diff"
+# New list, written by build() and only swapped in by publish()
+STAGED_FILE = f"{FINAL_FILE}.tmp"
+# Which sources listed each staged domain ("reversed key<TAB>source mask" lines), for the index
+STAGED_SOURCES_FILE = f"{FINAL_FILE}.sources.tmp"
+# Published outputs, kept as <file>.prev by keep_previous() so a bad deploy can be rolled back
+PUBLISHED_FILES = [FINAL_FILE, MANIFEST_FILE, RPZ_FILE, INDEX_FILE]
+
+# Exit codes (src/deploy.py only publishes + probes DNS on EXIT_CHANGED)
+EXIT_CHANGED = 0
+EXIT_FAILED = 1
+EXIT_UNCHANGED = 3
+
+# Per-source cache: parsed domains + ETag/Last-Modified of the last good download
+SOURCE_CACHE_DIR = "data/cache/sources"
+DOWNLOAD_WORKERS = 8
+DOWNLOAD_TIMEOUT = 45
+
+# External sort: at most this many domains are held in memory per sorted run
+SORT_CHUNK = 250_000
 
 # --- BLOCK SOURCES (The Bad Guys) ---
 BLOCKLIST_URLS = {
@@ -25,6 +63,9 @@ WHITELIST_URLS = {
     "Hagezi Whitelist": "https://raw.githubusercontent.com/hagezi/dns-blocklists/main/domains/whitelist.txt"
 }
 
+# Bit order of the per-domain source mask in the index (the dashboard shows these names)
+PROVENANCE_NAMES = [*BLOCKLIST_URLS, "AI Blocks", "Manual Blacklist"]
+
 def log(msg):
     print(f"[{datetime.datetime.now()}] {msg}")
 
@@ -33,74 +74,424 @@ def get_file_lines(filepath):
     with open(filepath, "r", encoding="utf-8", errors="ignore") as f:
         return set([l.strip() for l in f if l.strip() and not l.startswith("#")])
 
+# Names from the standard hosts-file header (localhost, broadcasthost, ip6-allnodes ...), never blocked
+LOCAL_NAMES = {"localhost", "localhost.localdomain", "local", "broadcasthost", "ip6-localhost", "ip6-loopback",
+               "ip6-localnet", "ip6-mcastprefix", "ip6-allnodes", "ip6-allrouters", "ip6-allhosts"}
+
+def is_ip(token):
+    try:
+        ipaddress.ip_address(token.split("%")[0]) # fe80::1%lo0: scoped IPv6
+        return True
+    except ValueError:
+        return False
+
 def extract_domain(line):
     line = line.strip()
     if not line or line.startswith("#") or line.startswith("!"): return None
     line = line.split("#")[0].strip()
     parts = line.split()
-    if len(parts) >= 2 and (parts[0] == "0.0.0.0" or parts[0] == "127.0.0.1"): return parts[1]
-    return parts[0]
+    if not parts: return None
+    domain = parts[1] if len(parts) >= 2 and is_ip(parts[0]) else parts[0]
+    if is_ip(domain) or domain.lower() in LOCAL_NAMES: return None
+    return domain
 
-def download_from_urls(url_dict):
-    total_domains = set()
-    for name, url in url_dict.items():
-        try:
-            log(f"⬇️  Downloading {name}...")
-            r = requests.get(url, timeout=45)
+# --- STREAMING SORT/MERGE HELPERS ---
+def iter_file(filepath):
+    """Yields the lines of a one-domain-per-line file, without newlines."""
+    with open(filepath, "r", encoding="utf-8", errors="ignore") as f:
+        for line in f:
+            yield line.rstrip("\n")
+
+def unique(sorted_items):
+    """Drops consecutive duplicates from a sorted stream."""
+    last = None
+    for item in sorted_items:
+        if item != last:
+            yield item
+            last = item
+
+def merge_unique(*sorted_streams):
+    return unique(heapq.merge(*sorted_streams))
+
+def external_sort(items, out_path, tmp_dir):
+    """Sorts + dedupes a stream of domains into out_path using bounded memory. Returns the count written."""
+    runs = []
+    chunk = []
+
+    def spill():
+        run_path = os.path.join(tmp_dir, f"run{len(runs)}.txt")
+        with open(run_path, "w") as f:
+            for domain in unique(sorted(chunk)):
+                f.write(f"{domain}\n")
+        runs.append(run_path)
+        chunk.clear()
+
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= SORT_CHUNK:
+            spill()
+    spill()
+
+    count = 0
+    with open(out_path, "w") as f:
+        for domain in merge_unique(*(iter_file(run) for run in runs)):
+            f.write(f"{domain}\n")
+            count += 1
+    for run in runs:
+        os.remove(run)
+    return count
+
+# --- SOURCE DOWNLOADS ---
+def source_cache_paths(name):
+    slug = re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_")
+    return f"{SOURCE_CACHE_DIR}/{slug}.txt", f"{SOURCE_CACHE_DIR}/{slug}.json"
+
+def load_cached_source(name):
+    """Returns (path to sorted domains, meta) of the last good download, or (None, {}) if there is none."""
+    domains_path, meta_path = source_cache_paths(name)
+    if not (os.path.exists(domains_path) and os.path.exists(meta_path)):
+        return None, {}
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if not meta.get("sorted"):
+        return None, {} # Written by an older manager (unsorted), download again
+    return domains_path, meta
+
+def fetch_source(name, url):
+    """Conditionally downloads one source into its sorted cache file. Returns (path or None, status message)."""
+    cached, meta = load_cached_source(name)
+    headers = {}
+    if cached is not None and meta.get("url") == url:
+        if meta.get("etag"): headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"): headers["If-Modified-Since"] = meta["last_modified"]
+
+    os.makedirs(SOURCE_CACHE_DIR, exist_ok=True)
+    domains_path, meta_path = source_cache_paths(name)
+    try:
+        with requests.get(url, headers=headers, timeout=DOWNLOAD_TIMEOUT, stream=True) as r:
+            if r.status_code == 304 and cached is not None:
+                return cached, f"♻️  Unchanged, reused {meta.get('count')} cached domains"
             if r.status_code == 200:
-                lines = r.text.split("\n")
-                count = 0
-                for line in lines:
-                    domain = extract_domain(line)
-                    if domain:
-                        total_domains.add(domain)
-                        count += 1
-                log(f"    ✅ Found {count} domains in {name}")
+                r.encoding = r.encoding or "utf-8"
+                # Parse lines as they arrive and sort them into a temp file; the body is never held in memory.
+                # Temp file + rename, so a failed download never clobbers the "last good copy".
+                lines = r.iter_lines(decode_unicode=True)
+                with tempfile.TemporaryDirectory(dir=SOURCE_CACHE_DIR) as tmp_dir:
+                    count = external_sort(filter(None, map(extract_domain, lines)), f"{domains_path}.tmp", tmp_dir)
+                with open(f"{meta_path}.tmp", "w") as f:
+                    json.dump({
+                        "url": url,
+                        "etag": r.headers.get("ETag"),
+                        "last_modified": r.headers.get("Last-Modified"),
+                        "count": count,
+                        "sorted": True,
+                        "fetched_at": str(datetime.datetime.now()),
+                    }, f)
+                os.replace(f"{domains_path}.tmp", domains_path)
+                os.replace(f"{meta_path}.tmp", meta_path)
+                return domains_path, f"✅ Found {count} domains"
+            error = f"Status: {r.status_code}"
+    except Exception as e:
+        error = str(e)
+
+    # Failed: fall back to the last good copy
+    if cached is not None:
+        return cached, f"⚠️  Failed ({error}), using last good copy from {meta.get('fetched_at')} ({meta.get('count')} domains)"
+    return None, f"❌ Failed ({error}), no cached copy"
+
+def fetch_sources(url_dict):
+    """Fetches all sources concurrently. Returns {name: path to its sorted domains, or None}."""
+    results = {}
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as pool:
+        futures = {}
+        for name, url in url_dict.items():
+            futures[pool.submit(fetch_source, name, url)] = (name, time.time())
+        for future in as_completed(futures):
+            name, started = futures[future]
+            path, message = future.result()
+            log(f"    {message} in {name} ({time.time() - started:.1f}s)")
+            results[name] = path
+    return results
+
+def merge_tagged(*sorted_streams):
+    """Merges sorted streams into (domain, mask) pairs, where bit i of mask is set if stream i had the domain."""
+    def tagged(stream, bit):
+        for domain in stream:
+            yield domain, bit
+
+    merged = heapq.merge(*(tagged(stream, bit) for bit, stream in enumerate(sorted_streams)))
+    current, mask = None, 0
+    for domain, bit in merged:
+        if domain != current:
+            if current is not None:
+                yield current, mask
+            current, mask = domain, 0
+        mask |= 1 << bit
+    if current is not None:
+        yield current, mask
+
+def subtract_sorted(blocked, allowed):
+    """Yields the (domain, mask) pairs of sorted stream `blocked` whose domain is not in sorted stream `allowed`."""
+    allowed = iter(allowed)
+    current = next(allowed, None)
+    for domain, mask in blocked:
+        while current is not None and current < domain:
+            current = next(allowed, None)
+        if domain != current:
+            yield domain, mask
+
+# --- SUFFIX COLLAPSING ---
+# Walks reversed keys ("ads.example.com" -> "com example ads", see blocklist_index.py). Space sorts
+# below every hostname character, so in sorted order a domain is followed directly by all of its
+# subdomains (a depth-first walk of the reversed-label suffix trie), and a stack of ancestors is
+# all we need to keep in memory.
+def collapse_suffixes(blocked_keys, allowed, tmp_dir):
+    """
+    Walks the blocked keys (sorted) and allowed domains in reversed-label order. Yields ("block", domain)
+    for every blocked domain without a blocked parent, ("covered", domain) for the redundant
+    ones, and ("allow", domain) for whitelisted names that sit under a blocked parent.
+    """
+    allowed_path = os.path.join(tmp_dir, "allowed_rev.txt")
+    external_sort(map(reversed_key, allowed), allowed_path, tmp_dir)
+
+    # Tag 0 = blocked, 1 = allowed; a name can't be both (the whitelist was already subtracted)
+    stream = heapq.merge(((k, 0) for k in blocked_keys), ((k, 1) for k in iter_file(allowed_path)))
+    parents = [] # Blocked ancestors of the current key
+    for key, tag in stream:
+        while parents and not key.startswith(parents[-1] + " "):
+            parents.pop()
+        if tag == 0:
+            if parents:
+                yield "covered", key_domain(key)
             else:
-                log(f"    ❌ Failed {name} (Status: {r.status_code})")
-        except Exception as e:
-            log(f"    ❌ Error {name}: {e}")
-    return total_domains
+                yield "block", key_domain(key)
+                parents.append(key)
+        elif parents:
+            yield "allow", key_domain(key)
 
-def update():
+def write_rpz(blocked_keys, allowed, tmp_dir):
+    """Writes RPZ_FILE (one wildcard rule per uncovered blocked domain). Returns (rules, covered, exceptions)."""
+    rules = covered = exceptions = 0
+    with open(f"{RPZ_FILE}.tmp", "w") as f:
+        f.write(f"; Updated: {datetime.datetime.now()}\n")
+        f.write("$TTL 300\n@ IN SOA localhost. root.localhost. 1 3600 600 86400 300\n@ IN NS localhost.\n")
+        for kind, domain in collapse_suffixes(blocked_keys, allowed, tmp_dir):
+            if kind == "block":
+                f.write(f"{domain} CNAME .\n*.{domain} CNAME .\n")
+                rules += 1
+            elif kind == "covered":
+                covered += 1
+            else:
+                # Whitelisted subdomain of a blocked parent: let it through
+                f.write(f"{domain} CNAME rpz-passthru.\n")
+                exceptions += 1
+    os.replace(f"{RPZ_FILE}.tmp", RPZ_FILE)
+    return rules, covered, exceptions
+
+def iter_final_domains(filepath):
+    for line in iter_file(filepath):
+        if line.startswith("0.0.0.0 "):
+            yield line[8:]
+
+# --- INCREMENTAL BUILDS ---
+def load_manifest():
+    if not os.path.exists(MANIFEST_FILE):
+        return {}
+    try:
+        with open(MANIFEST_FILE) as f:
+            return json.load(f)
+    except ValueError:
+        return {}
+
+def write_json_atomic(filepath, data):
+    with open(f"{filepath}.tmp", "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(f"{filepath}.tmp", filepath)
+
+def write_diff(old_path, new_path, old_hash, new_hash):
+    """Writes DIFF_FILE (+domain / -domain lines) by walking the old and new sorted lists. Returns (added, removed)."""
+    old = iter_final_domains(old_path) if os.path.exists(old_path) else iter(())
+    new = iter_final_domains(new_path)
+    added = removed = 0
+    with open(f"{DIFF_FILE}.tmp", "w") as f:
+        f.write(f"# from {old_hash} to {new_hash}\n")
+        x, y = next(old, None), next(new, None)
+        while x is not None or y is not None:
+            if y is None or (x is not None and x < y):
+                f.write(f"-{x}\n"); removed += 1; x = next(old, None)
+            elif x is None or y < x:
+                f.write(f"+{y}\n"); added += 1; y = next(new, None)
+            else:
+                x, y = next(old, None), next(new, None)
+    os.replace(f"{DIFF_FILE}.tmp", DIFF_FILE)
+    return added, removed
+
+def peak_rss_mb():
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def build():
+    """
+    Downloads and merges everything into STAGED_FILE; FINAL_FILE is not touched.
+    Returns (status, build): EXIT_UNCHANGED if the list, its sources and the whitelist match the published build
+    (the staged file is removed), EXIT_FAILED on error, EXIT_CHANGED with the build info otherwise.
+    """
     log("🚀 Manager Started: Fixing the internet...")
 
-    # 1. Download The Bad Lists
-    bad_domains = download_from_urls(BLOCKLIST_URLS)
-    
-    # 2. Download The Good Lists (Community Whitelists)
-    log("🛡️  Downloading Community Whitelists (Auto-Fixes)...")
-    good_domains = download_from_urls(WHITELIST_URLS)
-
-    # 3. Read Local Files
-    ai_data = get_file_lines(AI_FILE)
-    blacklist_data = get_file_lines(BLACKLIST_FILE)
-    local_whitelist = get_file_lines(WHITELIST_FILE)
-
-    # 4. MERGE: (Bad Lists + AI + Manual Block)
-    full_blocklist = bad_domains | ai_data | blacklist_data
-    
-    # 5. FILTER: Remove (Community Whitelist + Local Whitelist)
-    total_whitelist = good_domains | local_whitelist
-    final_list = full_blocklist - total_whitelist
-    
-    auto_fixed_count = len(full_blocklist) - len(final_list)
-    log(f"✨ Auto-Fixed {auto_fixed_count} false positives using Community Whitelists!")
-
-    # 6. Write Final File
+    # 1+2. Download The Bad Lists and The Good Lists (Community Whitelists), all at once.
+    # Each source ends up as a sorted, deduped file in the source cache.
+    log(f"⬇️  Downloading {len(BLOCKLIST_URLS)} blocklists + {len(WHITELIST_URLS)} whitelists (Auto-Fixes)...")
+    started = time.time()
+    sources = fetch_sources({**BLOCKLIST_URLS, **WHITELIST_URLS})
+    log(f"⏱️  Downloads finished in {time.time() - started:.1f}s")
+
+    # 3. Read Local Files (small, sorted in memory), exported fresh from the shared list store
+    exported = ListStore().export_all()
+    if exported:
+        log(f"📤 Exported from the list store: {', '.join(exported)}")
+    ai_data = sorted(get_file_lines(AI_FILE))
+    blacklist_data = sorted(get_file_lines(BLACKLIST_FILE))
+    local_whitelist = sorted(get_file_lines(WHITELIST_FILE))
+
+    # 4. MERGE: (Bad Lists + AI + Manual Block), as a sorted stream of (domain, source mask).
+    # A source that failed (no cached copy either) is an empty stream, so the bits stay stable.
+    good_files = [sources[name] for name in WHITELIST_URLS if sources[name]]
+    full_blocklist = merge_tagged(
+        *(iter_file(sources[name]) if sources[name] else iter(()) for name in BLOCKLIST_URLS),
+        ai_data, blacklist_data,
+    )
+
+    # 5. FILTER: Remove (Community Whitelist + Local Whitelist), also streamed
+    total_whitelist = merge_unique(*(iter_file(p) for p in good_files), local_whitelist)
+
+    # 6. Write the new list to the staging file: CoreDNS and the worker never see a half-written list
+    full_count = 0
+    final_count = 0
+    digest = hashlib.sha256() # The domain names: identifies the list (diff header, index)
+    # Everything publish() writes from: names with their source masks (index provenance) and the
+    # whitelist (RPZ exceptions), which can change while the names stay the same
+    inputs = hashlib.sha256("\n".join(PROVENANCE_NAMES).encode("utf-8"))
     try:
-        log(f"💾 Writing {len(final_list)} domains to firewall...")
-        with open(FINAL_FILE, "w") as f:
+        log("💾 Writing domains to firewall...")
+        with open(STAGED_FILE, "w") as f, open(STAGED_SOURCES_FILE, "w") as provenance:
             f.write(f"# Updated: {datetime.datetime.now()}\n")
             f.write("127.0.0.1 localhost\n::1 localhost\n")
-            for domain in sorted(final_list):
+
+            def counted(stream):
+                nonlocal full_count
+                for item in stream:
+                    full_count += 1
+                    yield item
+
+            for domain, mask in subtract_sorted(counted(full_blocklist), total_whitelist):
                 f.write(f"0.0.0.0 {domain}\n")
                 f.write(f":: {domain}\n") # IPv6 Support
-        
-        log("✅ Success! System updated.")
-    
+                provenance.write(f"{reversed_key(domain)}\t{mask}\n")
+                digest.update(f"{domain}\n".encode("utf-8"))
+                inputs.update(f"{domain}\t{mask}\n".encode("utf-8"))
+                final_count += 1
+        for domain in merge_unique(*(iter_file(p) for p in good_files), local_whitelist):
+            inputs.update(f"+{domain}\n".encode("utf-8"))
     except Exception as e:
         log(f"❌ Critical Error: {e}")
+        discard_staged()
+        return EXIT_FAILED, None
+
+    log(f"✨ Auto-Fixed {full_count - final_count} false positives using Community Whitelists!")
+
+    # 7. Skip everything downstream if the list is identical to the previous build
+    previous = load_manifest()
+    content_hash = digest.hexdigest()
+    inputs_hash = inputs.hexdigest()
+    if previous.get("inputs_hash") == inputs_hash and os.path.exists(FINAL_FILE):
+        discard_staged()
+        log(f"💤 No changes since the build of {previous.get('built_at')} ({final_count} domains). Nothing to deploy.")
+        return EXIT_UNCHANGED, None
+
+    return EXIT_CHANGED, {
+        "content_hash": content_hash,
+        "inputs_hash": inputs_hash,
+        "built_at": str(datetime.datetime.now()),
+        "domains": final_count,
+        "auto_fixed": full_count - final_count,
+        "sources": {name: load_cached_source(name)[1].get("count") if sources[name] else None for name in sources},
+        "local": {"ai_blocks": len(ai_data), "blacklist": len(blacklist_data), "whitelist": len(local_whitelist)},
+        "whitelist_files": good_files, # Not part of the manifest: needed again for the RPZ
+        "local_whitelist": local_whitelist,
+    }
+
+def publish(built):
+    """Diffs STAGED_FILE against the live list, swaps it in atomically, then writes the manifest and the RPZ."""
+    previous = load_manifest()
+    added, removed = write_diff(FINAL_FILE, STAGED_FILE, previous.get("content_hash"), built["content_hash"])
+    os.replace(STAGED_FILE, FINAL_FILE) # Atomic swap
+    manifest = {k: v for k, v in built.items() if k not in ("whitelist_files", "local_whitelist")}
+    manifest["diff"] = {"added": added, "removed": removed}
+    write_json_atomic(MANIFEST_FILE, manifest)
+    final_count = built["domains"]
+    log(f"✅ Success! System updated ({final_count} domains, +{added} / -{removed}, diff in {DIFF_FILE}).")
+
+    with tempfile.TemporaryDirectory(dir=BLOCKLIST_DIR) as tmp_dir:
+        # TAB sorts below every hostname character (and below the space between labels), so
+        # sorting "key<TAB>mask" lines puts them in the same order as the bare keys.
+        keys_path = os.path.join(tmp_dir, "blocked_rev.txt")
+        external_sort(iter_file(STAGED_SOURCES_FILE), keys_path, tmp_dir)
+        os.remove(STAGED_SOURCES_FILE)
+
+        def records():
+            for line in iter_file(keys_path):
+                key, mask = line.split("\t")
+                yield key, int(mask)
+
+        # 8. Compiled index (with provenance), checked by opening it the way the worker and dashboard will
+        write_index(INDEX_FILE, records(), built["content_hash"], PROVENANCE_NAMES)
+        index = BlocklistIndex(INDEX_FILE)
+        indexed = len(index)
+        index.close()
+        if indexed != final_count:
+            raise ValueError(f"{INDEX_FILE} holds {indexed} domains, expected {final_count}")
+        log(f"🗂️  Index: {indexed} domains, {os.path.getsize(INDEX_FILE) / 1024 / 1024:.1f} MB in {INDEX_FILE}")
+
+        # 9. Suffix collapse into the wildcard-capable RPZ output
+        total_whitelist = merge_unique(*(iter_file(p) for p in built["whitelist_files"]), built["local_whitelist"])
+        rules, covered, exceptions = write_rpz((key for key, _ in records()), total_whitelist, tmp_dir)
+    shrink = covered / final_count if final_count else 0
+    log(f"🌳 Suffix collapse: {final_count} domains -> {rules} wildcard rules + {exceptions} whitelist exceptions "
+        f"({covered} subdomains covered by a blocked parent, -{shrink:.0%}) in {RPZ_FILE}")
+
+def discard_staged():
+    """Removes what build() staged (after a failed build or validation)."""
+    for path in (STAGED_FILE, STAGED_SOURCES_FILE):
+        if os.path.exists(path):
+            os.remove(path)
+
+def keep_previous():
+    """Hard-links the published outputs to <file>.prev (no copy) before publish() replaces them."""
+    for path in PUBLISHED_FILES:
+        if os.path.exists(f"{path}.prev"):
+            os.remove(f"{path}.prev")
+        if os.path.exists(path):
+            os.link(path, f"{path}.prev")
+
+def rollback():
+    """Atomically puts the outputs saved by keep_previous() back. Returns False if there was nothing to restore."""
+    restored = False
+    for path in PUBLISHED_FILES:
+        if os.path.exists(f"{path}.prev"):
+            os.replace(f"{path}.prev", path)
+            restored = True
+    return restored
+
+def update():
+    status, built = build()
+    if built:
+        try:
+            publish(built)
+        except Exception as e:
+            log(f"❌ Critical Error: {e}")
+            status = EXIT_FAILED
+    log(f"📊 Peak memory (RSS): {peak_rss_mb():.0f} MB")
+    return status
 
 if __name__ == "__main__":
-    update()
+    sys.exit(update())
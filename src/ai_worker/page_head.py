@@ -0,0 +1,69 @@
+import time
+import codecs
+from html.parser import HTMLParser
+
+# Stop reading once </head> (or <body>) shows up, or after this many bytes, whichever comes first
+MAX_BYTES = 64 * 1024
+CHUNK_SIZE = 8 * 1024
+
+class HeadParser(HTMLParser):
+    """Incremental parser for the bits of <head> the judge uses: <title>, meta description and og: tags."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = None
+        self.description = None
+        self.og = {}
+        self.done = False
+        self._in_title = False
+        self._title_parts = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "title" and self.title is None:
+            self._in_title = True
+        elif tag == "meta":
+            attrs = dict(attrs)
+            name = (attrs.get("name") or attrs.get("property") or "").lower()
+            content = (attrs.get("content") or "").strip()
+            if name == "description" and content and self.description is None:
+                self.description = content
+            elif name.startswith("og:") and content:
+                self.og.setdefault(name[3:], content)
+        elif tag == "body":
+            self.done = True
+
+    def handle_endtag(self, tag):
+        if tag == "title" and self._in_title:
+            self._in_title = False
+            self.title = " ".join("".join(self._title_parts).split())
+        elif tag == "head":
+            self.done = True
+
+    def handle_data(self, data):
+        if self._in_title:
+            self._title_parts.append(data)
+
+def fetch_head(session, url, timeout=5, max_bytes=MAX_BYTES):
+    """
+    Streams a page and parses it only until the end of <head> (or max_bytes).
+    Returns a dict with status, title, description, og, bytes_read and elapsed (seconds).
+    Network errors propagate to the caller.
+    """
+    start = time.perf_counter()
+    result = {"status": None, "title": None, "description": None, "og": {}, "bytes_read": 0, "elapsed": 0.0}
+    with session.get(url, timeout=timeout, stream=True) as response:
+        result["status"] = response.status_code
+        if response.status_code == 200:
+            parser = HeadParser()
+            try:
+                decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+            except LookupError:
+                decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            for chunk in response.iter_content(CHUNK_SIZE):
+                result["bytes_read"] += len(chunk)
+                parser.feed(decoder.decode(chunk))
+                if parser.done or result["bytes_read"] >= max_bytes:
+                    break
+            result.update(title=parser.title, description=parser.description, og=parser.og)
+    result["elapsed"] = time.perf_counter() - start
+    return result
@@ -0,0 +1,120 @@
+import os
+import gc
+import sys
+import time
+import signal
+import logging
+
+# Pending entries idle for longer than this are assumed to belong to a dead process and are reclaimed
+RECLAIM_IDLE_MS = 60_000
+RECLAIM_INTERVAL = 15 # Seconds between reclaim scans
+MAX_DELIVERIES = 5 # A domain that keeps killing workers is dropped after this many attempts
+
+def ensure_group(r, stream, group):
+    """Creates the consumer group (and the stream) if they don't exist yet."""
+    try:
+        r.xgroup_create(stream, group, id="0", mkstream=True)
+    except Exception as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+class StreamConsumer:
+    """Reads batches from a Redis Stream consumer group; entries stay pending until ack()."""
+
+    def __init__(self, r, stream, group, consumer, batch_size, block_ms=1000):
+        self.r = r
+        self.stream = stream
+        self.group = group
+        self.consumer = consumer
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.ids = []
+        self.last_reclaim = 0.0
+
+    def fetch(self):
+        """Returns a batch of domains. Reclaimed entries from dead consumers are served first."""
+        entries = []
+        if time.time() - self.last_reclaim > RECLAIM_INTERVAL:
+            entries = self.reclaim()
+            self.last_reclaim = time.time()
+        if not entries:
+            resp = self.r.xreadgroup(self.group, self.consumer, {self.stream: ">"}, count=self.batch_size, block=self.block_ms)
+            entries = resp[0][1] if resp else []
+
+        self.ids = [(entry_id, (fields or {}).get("domain")) for entry_id, fields in entries]
+        return [fields["domain"] for _, fields in entries if fields and "domain" in fields]
+
+    def ack(self, keep=()):
+        """
+        Acknowledges the last batch: only now is it safe to forget about it. Entries for domains in
+        `keep` (no verdict, e.g. an inference error) stay pending and are reclaimed for a retry.
+        """
+        ids = [entry_id for entry_id, domain in self.ids if domain not in keep]
+        if ids:
+            self.r.xack(self.stream, self.group, *ids)
+        self.ids = []
+
+    def reclaim(self):
+        pending = self.r.xpending_range(self.stream, self.group, min="-", max="+", count=self.batch_size, idle=RECLAIM_IDLE_MS)
+        poison = [p["message_id"] for p in pending if p["times_delivered"] >= MAX_DELIVERIES]
+        if poison:
+            self.r.xack(self.stream, self.group, *poison)
+            logging.warning(f"☠️ Dropped {len(poison)} entries after {MAX_DELIVERIES} failed deliveries")
+
+        ids = [p["message_id"] for p in pending if p["times_delivered"] < MAX_DELIVERIES]
+        if not ids:
+            return []
+        claimed = self.r.xclaim(self.stream, self.group, self.consumer, min_idle_time=RECLAIM_IDLE_MS, message_ids=ids)
+        logging.info(f"♻️ Reclaimed {len(claimed)} pending entries from dead workers")
+        return claimed
+
+def run_pool(target, processes):
+    """
+    Supervisor: forks `processes` children that each run target(slot), and restarts any that die.
+
+    Everything loaded before this call (model weights, ignore set) is shared
+    copy-on-write with the children instead of being loaded once per process.
+    """
+    # Move everything allocated so far out of the GC's reach, so collections in
+    # the children don't write to (and thereby un-share) those pages.
+    gc.freeze()
+    children = {}
+
+    def spawn(slot):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 0
+            try:
+                target(slot)
+            except Exception:
+                logging.exception(f"Worker {slot} crashed")
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = slot
+        logging.info(f"👷 Worker {slot} started (pid {pid})")
+
+    def shutdown(signum, frame):
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    for slot in range(processes):
+        spawn(slot)
+
+    while True:
+        pid, status = os.wait()
+        slot = children.pop(pid, None)
+        if slot is None:
+            continue
+        logging.warning(f"💀 Worker {slot} (pid {pid}) exited with status {status}, restarting...")
+        time.sleep(1) # Don't spin if it dies on startup
+        spawn(slot)
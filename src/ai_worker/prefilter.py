@@ -0,0 +1,301 @@
+"""
+Lexical pre-filter in front of the classifier.
+
+Each unknown domain is routed to block, allow or the model with one Aho-Corasick pass over
+explicit terms and brands (with exceptions such as "essex"), site-name-only words ("poker.com",
+not "cams.bosch.com") and structural allow rules (CDN/telemetry suffixes, IP-like labels, local
+TLDs). Everything else goes to the model. The worker's WORKER_PREFILTER picks "on", "shadow"
+(model decides, disagreements are logged) or "off"; PREFILTER_RULES overrides the rules.
+
+Usage:
+    python src/ai_worker/prefilter.py route cams.bosch.com poker.com
+    python src/ai_worker/prefilter.py eval [--labeled domains.csv] [--engine torch-fp32]
+
+eval reports model calls avoided and disagreement with the labels (default: blacklist = unsafe,
+whitelist = safe) and, with --engine, with the model.
+"""
+import os
+import re
+import sys
+import json
+import time
+import logging
+import argparse
+from collections import Counter, deque
+from list_store import LIST_FILES
+from public_suffix import PublicSuffixList
+
+# --- CONFIGURATION ---
+# Cheap first stage in front of the model: obvious names are decided here, only ambiguous ones
+# cost a forward pass. Rules are the defaults below, optionally overridden by a JSON file with the
+# same keys (PREFILTER_RULES).
+RULES_FILE = os.getenv("PREFILTER_RULES", "")
+
+BLOCK = "block"
+ALLOW = "allow"
+MODEL = "model"
+
+DEFAULT_RULES = {
+    # Blocked wherever they appear in the name: explicit terms and brands, no ordinary word contains them
+    "block_substrings": [
+        "porn", "xxx", "hentai", "xvideo", "xhamster", "xnxx", "redtube", "youjizz", "brazzers",
+        "onlyfans", "chaturbate", "livejasmin", "stripchat", "camgirl", "nsfw",
+        "casino", "sportsbook", "pokerstars", "1xbet", "bet365", "betway",
+    ],
+    # Blocked only as a whole token (labels split on '.', '-' and digits): "sex" but not "essex"
+    "block_tokens": ["sex", "sexy", "nude", "nudes", "milf", "escorts", "betting"],
+    # Blocked only when they are the whole site name ("poker.com", "slots.co.uk"): as a host label or a
+    # word inside a name they are common in legitimate ones (cams.bosch.com, bets.essex.com), so those go to the model
+    "block_site_labels": [
+        "cams", "bets", "poker", "slots", "lotto", "escort", "naked", "jackpot", "roulette", "blackjack",
+        "bookmaker", "gambling",
+    ],
+    # A block match that lies inside one of these is ignored
+    "exceptions": ["essex", "sussex", "middlesex", "wessex", "xxxl"],
+    # CDN / cloud / telemetry infrastructure: hostnames, not sites with content to judge
+    "allow_suffixes": [
+        "akamai.net", "akamaiedge.net", "akamaized.net", "akadns.net", "edgekey.net", "edgesuite.net",
+        "cloudfront.net", "amazonaws.com", "azureedge.net", "azurefd.net", "trafficmanager.net",
+        "msedge.net", "windows.net", "windowsupdate.com", "fastly.net", "fastlylb.net", "cloudflare.net",
+        "cloudflare-dns.com", "gstatic.com", "googleapis.com", "googleusercontent.com", "gvt1.com",
+        "gvt2.com", "1e100.net", "app-measurement.com", "crashlytics.com", "apple-dns.net", "aaplimg.com",
+        "mzstatic.com", "cdn77.org", "jsdelivr.net", "digicert.com", "letsencrypt.org", "pki.goog",
+        "ntp.org",
+    ],
+    # Reverse lookups and names that never leave the network
+    "allow_tlds": ["arpa", "local", "lan", "internal", "localhost", "localdomain", "home", "corp", "invalid", "test"],
+}
+
+IPV4_RE = re.compile(r"^(\d{1,3})\.(\d{1,3})\.(\d{1,3})\.(\d{1,3})$")
+# EC2/ISP style host names: ip-10-0-0-1, 192-168-1-5, 10x0x0x1 ...
+IP_LABEL_RE = re.compile(r"^(?:ip-?)?\d{1,3}([-x_])\d{1,3}\1\d{1,3}\1\d{1,3}$")
+
+def load_rules(path=RULES_FILE):
+    """The default rules, with the keys of the JSON file at `path` (if any) replacing them."""
+    rules = dict(DEFAULT_RULES)
+    if path:
+        with open(path, "r") as f:
+            overrides = json.load(f)
+        unknown = set(overrides) - set(DEFAULT_RULES)
+        if unknown:
+            raise ValueError(f"Unknown pre-filter rule keys in {path}: {', '.join(sorted(unknown))}")
+        rules.update(overrides)
+    return rules
+
+# --- MULTI-PATTERN MATCHING ---
+class AhoCorasick:
+    """Finds every occurrence of many patterns in one pass over the text (time linear in the text)."""
+
+    def __init__(self, patterns):
+        # patterns: {pattern: value}. Node 0 is the root.
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        for pattern, value in patterns.items():
+            node = 0
+            for ch in pattern:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                node = nxt
+            self.out[node].append((len(pattern), value))
+
+        # Breadth-first: a node's failure link is the longest proper suffix that is also in the trie
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self.goto[node].items():
+                queue.append(nxt)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def matches(self, text):
+        """Yields (start, end, value) for every occurrence."""
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(ch, 0)
+            for length, value in self.out[node]:
+                yield i + 1 - length, i + 1, value
+
+# --- ROUTING ---
+class PreFilter:
+    """
+    Routes a domain to BLOCK, ALLOW or MODEL with a reason, e.g. ("block", "keyword:casino").
+    Keywords win over the structural allow rules; anything not decided goes to the model.
+    """
+
+    def __init__(self, rules=None, psl=None):
+        rules = rules or load_rules()
+        patterns = {}
+        for word in rules["exceptions"]:
+            patterns[word] = ("exception", word)
+        for word in rules["block_tokens"]:
+            patterns[word] = ("token", word)
+        for word in rules["block_substrings"]:
+            patterns[word] = ("substring", word)
+        self.matcher = AhoCorasick(patterns)
+        self.site_labels = set(rules["block_site_labels"])
+        self.psl = psl or PublicSuffixList()
+        self.allow_suffixes = set(rules["allow_suffixes"])
+        self.allow_tlds = set(rules["allow_tlds"])
+        self.counts = Counter() # Routes taken
+        self.shadow = Counter() # (route, model verdict) pairs, see compare()
+
+    def keyword(self, domain):
+        """The first block keyword in `domain` (not inside an exception), else a blocked site name, or None."""
+        hits, exceptions = [], []
+        for start, end, (kind, word) in self.matcher.matches(domain):
+            if kind == "exception":
+                exceptions.append((start, end))
+            elif kind == "substring" or self._whole_token(domain, start, end):
+                hits.append((start, end, word))
+        for start, end, word in sorted(hits):
+            if not any(s <= start and end <= e for s, e in exceptions):
+                return word
+        site = self.psl.registrable(domain)
+        if site and site.split(".")[0] in self.site_labels:
+            return site.split(".")[0]
+        return None
+
+    @staticmethod
+    def _whole_token(text, start, end):
+        return (start == 0 or not text[start - 1].isalpha()) and (end == len(text) or not text[end].isalpha())
+
+    def structure(self, domain):
+        """Why `domain` is infrastructure rather than a site (or None)."""
+        labels = domain.split(".")
+        if IPV4_RE.match(domain) or any(IP_LABEL_RE.match(label) for label in labels):
+            return "ip"
+        if labels[-1] in self.allow_tlds:
+            return f"tld:{labels[-1]}"
+        for i in range(len(labels) - 1):
+            suffix = ".".join(labels[i:])
+            if suffix in self.allow_suffixes:
+                return f"infra:{suffix}"
+        return None
+
+    def route(self, domain):
+        """Returns (BLOCK | ALLOW | MODEL, reason) and counts it."""
+        domain = domain.strip().lower().rstrip(".")
+        word = self.keyword(domain)
+        if word:
+            decision = (BLOCK, f"keyword:{word}")
+        else:
+            reason = self.structure(domain)
+            decision = (ALLOW, reason) if reason else (MODEL, None)
+        self.counts[decision[0]] += 1
+        return decision
+
+    def compare(self, route, model_blocks):
+        """Shadow mode: records what the model said about a domain the pre-filter would have decided."""
+        self.shadow[route, model_blocks] += 1
+
+    def disagreements(self):
+        """(disagreements, decided domains also checked by the model)."""
+        checked = sum(n for (route, _), n in self.shadow.items() if route != MODEL)
+        wrong = self.shadow[BLOCK, False] + self.shadow[ALLOW, True]
+        return wrong, checked
+
+    def summary(self):
+        total = sum(self.counts.values())
+        if not total:
+            return "no domains routed yet"
+        text = (f"{self.counts[BLOCK]} blocked, {self.counts[ALLOW]} allowed, {self.counts[MODEL]} to the model "
+                f"({(total - self.counts[MODEL]) / total:.0%} decided without the model)")
+        wrong, checked = self.disagreements()
+        if checked:
+            text += f", disagrees with the model on {wrong}/{checked} ({wrong / checked:.1%})"
+        return text
+
+# --- EVALUATION ---
+LABELS = {"1": True, "unsafe": True, "block": True, "0": False, "safe": False, "allow": False}
+
+def load_labeled(path):
+    """`domain<TAB or comma>label` lines (label: 1/0, unsafe/safe, block/allow). Returns [(domain, bool)]."""
+    labeled = []
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            fields = re.split(r"[\t,]", line, maxsplit=1)
+            label = fields[-1].strip().lower()
+            if len(fields) == 2 and label in LABELS:
+                labeled.append((fields[0].strip().lower(), LABELS[label]))
+    return labeled
+
+def load_list_labels():
+    """The hand-labeled local lists: blacklist = unsafe, whitelist = safe."""
+    labeled = []
+    for path, label in [(LIST_FILES["blacklist"], True), (LIST_FILES["whitelist"], False)]:
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                labeled.extend((l.strip().lower(), label) for l in f if l.strip() and not l.startswith("#"))
+    return labeled
+
+def evaluate(prefilter, labeled, engine_name=None, batch_size=64):
+    """Routes a labeled set; with an engine, also scores it to measure agreement with the model."""
+    start = time.perf_counter()
+    routes = [prefilter.route(domain) for domain, _ in labeled]
+    elapsed = time.perf_counter() - start
+    report = {
+        "domains": len(labeled),
+        "routes": dict(Counter(decision for decision, _ in routes)),
+        "model_calls_avoided": round(1 - sum(d == MODEL for d, _ in routes) / max(len(routes), 1), 4),
+        "route_us_per_domain": round(elapsed / max(len(routes), 1) * 1e6, 2),
+    }
+    decided = [(domain, label, decision, reason) for (domain, label), (decision, reason) in zip(labeled, routes) if decision != MODEL]
+    wrong = [(domain, decision, reason) for domain, label, decision, reason in decided if (decision == BLOCK) != label]
+    report["label_disagreements"] = len(wrong)
+    report["label_disagreement_rate"] = round(len(wrong) / max(len(decided), 1), 4)
+    report["label_disagreement_examples"] = wrong[:20]
+
+    if engine_name:
+        from engines import THRESHOLD, load_engine
+        engine = load_engine(engine_name)
+        domains = [domain for domain, _, _, _ in decided]
+        scores = []
+        for i in range(0, len(domains), batch_size):
+            scores.extend(engine.score(domains[i:i + batch_size]))
+        for (domain, _, decision, _), score in zip(decided, scores):
+            prefilter.compare(decision, score > THRESHOLD)
+        model_wrong, checked = prefilter.disagreements()
+        report["model_disagreements"] = model_wrong
+        report["model_disagreement_rate"] = round(model_wrong / max(checked, 1), 4)
+        report["model_disagreement_examples"] = [
+            (domain, decision, reason) for (domain, _, decision, reason), score in zip(decided, scores)
+            if (decision == BLOCK) != (score > THRESHOLD)
+        ][:20]
+    return report
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(asctime)s - PREFILTER - %(levelname)s - %(message)s', level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rules", default=RULES_FILE, help="JSON file overriding the default rules")
+    sub = parser.add_subparsers(dest="command", required=True)
+    explain = sub.add_parser("route", help="Print the route taken by each domain")
+    explain.add_argument("domains", nargs="+")
+    check = sub.add_parser("eval", help="Routes a labeled set and reports model calls avoided and disagreement")
+    check.add_argument("--labeled", help="domain,label file (default: blacklist = unsafe, whitelist = safe)")
+    check.add_argument("--engine", help="Also score the decided domains with this engine (see engines.py)")
+    args = parser.parse_args()
+
+    prefilter = PreFilter(load_rules(args.rules))
+    if args.command == "route":
+        for domain in args.domains:
+            decision, reason = prefilter.route(domain)
+            print(f"{domain}\t{decision}\t{reason or ''}")
+    else:
+        labeled = load_labeled(args.labeled) if args.labeled else load_list_labels()
+        print(json.dumps(evaluate(prefilter, labeled, args.engine), indent=2))
+    sys.exit(0)
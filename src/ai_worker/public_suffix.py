@@ -0,0 +1,60 @@
+import os
+import sys
+import logging
+
+# --- CONFIGURATION ---
+# Bundled copy of https://publicsuffix.org/list/public_suffix_list.dat (ICANN and private sections),
+# so the worker never needs the network for it. Refresh it now and then by downloading that file over this one.
+PSL_FILE = os.getenv("PSL_FILE", "data/public_suffix_list.dat")
+
+def _to_ascii(rule):
+    # DNS queries carry punycode (xn--...), the list is in Unicode
+    return ".".join(label if label.isascii() else label.encode("idna").decode("ascii") for label in rule.split("."))
+
+class PublicSuffixList:
+    """Finds the registrable domain (eTLD+1): "cdn1.example.co.uk" -> "example.co.uk"."""
+
+    def __init__(self, path=PSL_FILE):
+        self.rules = set()
+        self.exceptions = set()
+        if not os.path.exists(path):
+            # Default rule only ("*"): the registrable domain is the last two labels
+            logging.warning(f"⚠️ {path} not found, treating every TLD as the only public suffix")
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                rule = line.strip().split(" ")[0].lower()
+                if not rule or rule.startswith("//"):
+                    continue
+                try:
+                    if rule.startswith("!"):
+                        self.exceptions.add(_to_ascii(rule[1:]))
+                    else:
+                        self.rules.add(_to_ascii(rule))
+                except UnicodeError:
+                    continue # Not representable in IDNA 2003 (Python's codec): no DNS name will match it anyway
+
+    def suffix_length(self, labels):
+        """Number of trailing labels that form the public suffix."""
+        for i in range(len(labels)):
+            # Longest candidate first, so the first match is the prevailing rule
+            candidate = ".".join(labels[i:])
+            if candidate in self.exceptions:
+                return len(labels) - i - 1
+            if candidate in self.rules or (i + 1 < len(labels) and "*." + ".".join(labels[i + 1:]) in self.rules):
+                return len(labels) - i
+        return 1
+
+    def registrable(self, domain):
+        """The registrable domain of `domain`, or None if it is itself a public suffix (or a bare TLD)."""
+        labels = domain.strip().lower().rstrip(".").split(".")
+        n = self.suffix_length(labels)
+        if n >= len(labels):
+            return None
+        return ".".join(labels[-n - 1:])
+
+if __name__ == "__main__":
+    psl = PublicSuffixList()
+    print(f"{len(psl.rules)} rules, {len(psl.exceptions)} exceptions")
+    for domain in sys.argv[1:]:
+        print(f"{domain}\t{psl.registrable(domain)}")
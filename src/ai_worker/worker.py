@@ -1,22 +1,61 @@
 import redis
 import time
-import torch
 import os
+import sys
+import socket
 import logging
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
+import threading
+from contextlib import contextmanager
+from ignore_cache import IgnoreCache, IndexSource, ListSource, StoreSource, VerdictCache
+from list_store import ListStore
+from prefilter import BLOCK, MODEL, PreFilter, load_rules
+from public_suffix import PublicSuffixList
+from pool import StreamConsumer, ensure_group, run_pool
 
 # --- CONFIGURATION ---
 REDIS_HOST = "localhost"
 REDIS_PORT = 6379
 QUEUE_NAME = "dns_traffic"
 
+# Micro-batching: pop up to BATCH_SIZE domains (waiting at most BATCH_MAX_WAIT_MS
+# to fill the batch) and score them in a single forward pass.
+BATCH_SIZE = int(os.getenv("WORKER_BATCH_SIZE", "32"))
+BATCH_MAX_WAIT_MS = int(os.getenv("WORKER_BATCH_WAIT_MS", "20"))
+STATS_INTERVAL = 60 # Seconds between throughput reports
+
+# Queue backend: "list" (single process, BLPOP on QUEUE_NAME) or "stream" (worker pool
+# reading STREAM_NAME through a consumer group; the bridge must use the same backend).
+QUEUE_BACKEND = os.getenv("DNS_QUEUE", "list")
+STREAM_NAME = "dns_traffic_stream"
+STREAM_GROUP = "ai_workers"
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", str(os.cpu_count() or 1)))
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", "1")) # torch threads per pool process
+
 # Paths
 BLOCK_DIR = "data/blocklists"
-AI_LOG_FILE = f"{BLOCK_DIR}/ai_blocks.txt"
-WHITELIST_FILE = f"{BLOCK_DIR}/whitelist.txt"
-BLACKLIST_FILE = f"{BLOCK_DIR}/blacklist.txt"
 FINAL_FILE = f"{BLOCK_DIR}/final_blocklist.txt"
-MODEL_PATH = "nlp_model"
+INDEX_FILE = f"{BLOCK_DIR}/final_blocklist.idx" # Compiled by the manager (blocklist_index.py)
+
+# Inference backend: torch-fp32, torch-dynamic-int8 or onnxruntime (see engines.py)
+ENGINE = os.getenv("WORKER_ENGINE", "torch-fp32")
+
+# Startup: the model loads (and runs a warm-up batch) in the background while the worker already
+# drains the queue with the cheap checks. Sites that need the model wait for it, up to DEFER_MAX.
+WARMUP_DOMAINS = [f"warmup-{i}.example.com" for i in range(BATCH_SIZE)]
+DEFER_MAX = int(os.getenv("WORKER_DEFER_MAX", "50000"))
+
+# Lexical pre-filter (prefilter.py): "on" decides obvious names without the model, "shadow" only
+# compares its decisions with the model's (to validate new rules), "off" sends everything to the model
+PREFILTER_MODE = os.getenv("WORKER_PREFILTER", "on")
+
+# Subdomains are judged as their registrable domain (eTLD+1, public_suffix.py): cdn1.example.com and
+# img.example.com cost one inference for example.com. An UNSAFE site is blocked together with the names
+# queried under it (the resolver matches exact names). Shared hosts (github.io, blogspot.com ...) are
+# public suffixes in the PSL's private section, so each of their users is a site of its own.
+NORMALIZE = os.getenv("WORKER_NORMALIZE", "1") == "1"
+# Recent verdicts per site, SAFE ones included (those are on no list)
+VERDICT_CACHE_SIZE = int(os.getenv("WORKER_VERDICT_CACHE_SIZE", "100000"))
+VERDICT_CACHE_TTL = int(os.getenv("WORKER_VERDICT_CACHE_TTL", str(6 * 3600))) # Seconds
 
 # --- LOGGING SETUP ---
 logging.basicConfig(
@@ -24,126 +63,308 @@ logging.basicConfig(
     level=logging.INFO
 )
 
-def get_file_domains(filepath, needs_parsing=False):
-    """Reads a file and returns a set of domains."""
-    if not os.path.exists(filepath):
-        return set()
-    
-    domains = set()
-    try:
-        with open(filepath, "r", encoding="utf-8", errors="ignore") as f:
-            for line in f:
-                line = line.strip()
-                if not line or line.startswith("#"):
-                    continue
-                
-                # If reading final_blocklist.txt (Format: 0.0.0.0 domain.com)
-                if needs_parsing:
-                    parts = line.split()
-                    if len(parts) >= 2:
-                        domains.add(parts[1]) # Add the domain part
-                else:
-                    # Standard list (just domain.com)
-                    domains.add(line)
-    except Exception as e:
-        logging.error(f"Error reading {filepath}: {e}")
-    return domains
+STARTED = time.time()
+
+@contextmanager
+def startup_phase(name):
+    start = time.time()
+    yield
+    logging.info(f"⏱️ Startup: {name} took {time.time() - start:.2f}s")
 
 def load_global_cache():
     """Loads ALL lists to prevent redundant AI checks."""
-    # 1. Load Whitelist
-    whitelist = get_file_domains(WHITELIST_FILE)
-    
-    # 2. Load Manual Blacklist
-    blacklist = get_file_domains(BLACKLIST_FILE)
-    
-    # 3. Load Existing AI Blocks (Don't check what we already caught)
-    ai_blocks = get_file_domains(AI_LOG_FILE)
-    
-    # 4. Load the MASSIVE Final List (The 2 Million Domains)
-    # We parse this so we don't ask AI about Pornhub/Gambling sites already blocked.
-    # Note: This takes a second but saves massive bandwidth.
-    final_blocks = get_file_domains(FINAL_FILE, needs_parsing=True)
-
-    # Combine all known domains into one "Ignore Set"
     # If a domain is in ANY of these, AI should sleep.
-    ignore_set = whitelist | blacklist | ai_blocks | final_blocks
-    
-    logging.info(f"🔄 Cache Updated. Knowing {len(ignore_set)} domains to ignore.")
+    ignore_set = IgnoreCache([
+        # 1. Whitelist, 2. Manual Blacklist, 3. Existing AI Blocks (Don't check what we already caught).
+        # Shared with the judge and the dashboard through the list store; refreshes replay its change feed.
+        StoreSource(store, ["whitelist", "blacklist", "ai_blocks"]),
+        # 4. The MASSIVE Final List (The 2 Million Domains), rewritten by the manager on deploy.
+        # Read through the manager's mmapped index when there is one, instead of parsing the text.
+        IndexSource(INDEX_FILE) if os.path.exists(INDEX_FILE) else ListSource(FINAL_FILE, needs_parsing=True),
+    ])
+    if not os.path.exists(INDEX_FILE):
+        logging.warning(f"⚠️ {INDEX_FILE} not found, parsing {FINAL_FILE} instead (slow; the next deploy writes the index)")
+    ignore_set.refresh()
+
+    logging.info(f"🔄 Cache Loaded. Knowing {len(ignore_set)} domains to ignore.")
     return ignore_set
 
 # --- LOAD AI MODEL ---
-logging.info("🧠 Loading AI Model...")
-try:
-    device = torch.device("cpu")
-    model = AutoModelForSequenceClassification.from_pretrained(MODEL_PATH).to(device)
-    tokenizer = AutoTokenizer.from_pretrained(MODEL_PATH)
-    model.eval()
-    logging.info("✅ AI Model Loaded!")
-except Exception as e:
-    logging.error(f"❌ Failed to load model: {e}")
-    exit(1)
+engine = None
+THRESHOLD = None
+engine_ready = threading.Event()
+engine_failed = threading.Event()
+
+def load_model():
+    """Imports the inference stack, loads the engine and runs one warm-up batch. Sets engine_ready (or engine_failed)."""
+    global engine, THRESHOLD
+    logging.info(f"🧠 Loading AI Model ({ENGINE})...")
+    try:
+        with startup_phase(f"model load ({ENGINE})"):
+            import engines # torch/transformers: seconds to import, so not at the top of this file
+            engine = engines.load_engine(ENGINE)
+            THRESHOLD = engines.THRESHOLD
+        with startup_phase("model warm-up batch"):
+            engine.score(WARMUP_DOMAINS)
+        logging.info(f"✅ AI Model Loaded! ({time.time() - STARTED:.1f}s after start)")
+        engine_ready.set()
+    except Exception as e:
+        logging.error(f"❌ Failed to load model: {e}")
+        engine_failed.set()
 
 # --- CONNECT TO REDIS ---
-try:
-    r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
-    r.ping()
-    logging.info("✅ Connected to Redis.")
-except Exception as e:
-    logging.error(f"❌ Redis Connection Failed: {e}")
-    exit(1)
+r = None
+
+def connect_redis():
+    global r
+    try:
+        with startup_phase("Redis connection"):
+            r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+            r.ping()
+        logging.info("✅ Connected to Redis.")
+    except Exception as e:
+        logging.error(f"❌ Redis Connection Failed: {e}")
+        exit(1)
+
+# --- SHARED LISTS ---
+store = None
+prefilter = None
+psl = None
+verdicts = VerdictCache(VERDICT_CACHE_SIZE, VERDICT_CACHE_TTL)
+inference_stats = {"domains": 0, "inferences": 0} # Domains that needed a verdict vs. model inferences run
+deferred = {} # site -> domains waiting for the model to finish loading
+failed = set() # Domains of the current batch that got no verdict (model error), not acked in stream mode
+
+def load_lists():
+    """Opens the list store and builds the pre-filter and the suffix list. Returns the ignore set."""
+    global store, prefilter, psl
+    with startup_phase("list store, pre-filter and suffix list"):
+        store = ListStore()
+        psl = PublicSuffixList() if NORMALIZE else None
+        prefilter = PreFilter(load_rules(), psl) if PREFILTER_MODE in ("on", "shadow") else None
+    with startup_phase("ignore set (final list index + shared lists)"):
+        return load_global_cache()
+
+def is_haram_batch(domains):
+    """Returns a list of booleans, True where AI thinks the domain is bad (None for all of them if the model failed)."""
+    try:
+        # One forward pass, dynamically padded to the longest domain in the batch
+        return [confidence > THRESHOLD for confidence in engine.score(domains)]
+    except Exception as e:
+        logging.error(f"AI Prediction Error: {e}")
+        return [None] * len(domains)
 
 def is_haram(domain):
     """Returns True if AI thinks the domain is bad."""
+    return is_haram_batch([domain])[0]
+
+def fetch_batch(max_size=BATCH_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS):
+    """Pops up to max_size domains from Redis. Blocks (1s) for the first one, then waits at most max_wait_ms to fill the batch."""
+    job = r.blpop(QUEUE_NAME, timeout=1)
+    if not job:
+        return []
+
+    batch = [job[1]]
+    deadline = time.time() + max_wait_ms / 1000
+    while len(batch) < max_size:
+        # LPOP with a count drains several items in one round trip (Redis 6.2+)
+        items = r.lpop(QUEUE_NAME, max_size - len(batch))
+        if items:
+            batch.extend(items)
+            continue
+        if time.time() >= deadline:
+            break
+        time.sleep(0.002)
+    return batch
+
+def save_blocks(domains, reasons=None):
+    """Adds the batch's detections to ai_blocks in one transaction (safe alongside the judge and the dashboard)."""
+    for domain in domains:
+        reason = (reasons or {}).get(domain)
+        logging.warning(f"⛔ HARAM DETECTED: {domain}" + (f" (pre-filter: {reason})" if reason else ""))
     try:
-        inputs = tokenizer(domain, return_tensors="pt", truncation=True, max_length=64).to(device)
-        with torch.no_grad():
-            outputs = model(**inputs)
-            probs = torch.nn.functional.softmax(outputs.logits, dim=-1)
-            confidence = probs[0][1].item()
-        return confidence > 0.90
+        store.add("ai_blocks", domains)
     except Exception as e:
-        logging.error(f"AI Prediction Error: {e}")
-        return False
+        logging.error(f"❌ Failed to save AI blocks: {e}")
 
-def save_block(domain):
-    """Writes to AI file (and appends to our local memory cache)."""
-    with open(AI_LOG_FILE, "a") as f:
-        f.write(f"{domain}\n")
-    logging.warning(f"⛔ HARAM DETECTED: {domain}")
+def site_of(domain):
+    """The name the model judges: the registrable domain (or the name itself if it is a public suffix)."""
+    return (psl.registrable(domain) or domain) if psl else domain
 
-def main():
-    logging.info("🚀 Smart Worker Started. Waiting for traffic...")
-    
+def process_batch(batch, ignore_set):
+    """Classifies the unknown domains of a batch. Returns how many went through the AI."""
+    # 1. THE ULTIMATE CHECK
+    # If we know this domain (Good OR Bad), SKIP IT. Also drop repeats inside the batch.
+    unknown = list(dict.fromkeys(d for d in batch if d not in ignore_set))
+    if not unknown:
+        return 0
+
+    # 2. PRE-FILTER: obvious names (explicit keywords, CDN/telemetry, IPs, local TLDs) are decided without the model
+    routes = {domain: prefilter.route(domain) for domain in unknown} if prefilter else {}
+    if PREFILTER_MODE == "on":
+        reasons = {domain: reason for domain, (decision, reason) in routes.items() if decision == BLOCK}
+        ambiguous = [domain for domain in unknown if routes[domain][0] == MODEL]
+    else:
+        reasons, ambiguous = {}, unknown
+
+    # 3. NORMALIZE: one verdict per registrable domain. A name whose site is listed (or on the final list) without
+    # a verdict of ours is judged on its own: the resolver matches exact names, so the site's entry doesn't cover it.
+    sites = {}
+    for domain in ambiguous:
+        site = site_of(domain)
+        known = site in ignore_set and site not in verdicts.items
+        sites.setdefault(domain if known else site, []).append(domain)
+
+    # 4. VERDICT CACHE, then RUN AI CHECK (Only for truly new/unknown sites, all in one forward pass)
+    if engine_ready.is_set():
+        blocked, scanned = classify_sites(sites, routes)
+    else:
+        # Still starting up: the known names were handled above, the rest wait for the model
+        for site, domains in sites.items():
+            deferred.setdefault(site, []).extend(domains)
+        blocked, scanned = [], 0
+        if len(deferred) >= DEFER_MAX:
+            logging.warning(f"⏳ {len(deferred)} sites waiting for the model, pausing until it is loaded...")
+            while not engine_ready.wait(1):
+                if engine_failed.is_set():
+                    sys.exit(1) # load_model() logged why; a restart retries the load
+    record_blocks(list(reasons) + blocked, ignore_set, reasons)
+    return scanned
+
+def cached_verdicts(names):
+    """{name: True/False, or None on a model error}, and the inferences run. Cached verdicts first, then one forward pass."""
+    found = {name: verdicts.get(name) for name in names}
+    pending = [name for name, bad in found.items() if bad is None]
+    if pending:
+        for name, bad in zip(pending, is_haram_batch(pending)):
+            if bad is not None: # Model errors are not cached: the name is checked again next time
+                verdicts.put(name, bad)
+            found[name] = bad
+    return found, len(pending)
+
+def classify_sites(sites, routes=None):
+    """
+    {site: [queried names]} -> (names to block, inferences run): one verdict per site, cached or from
+    one forward pass. An UNSAFE site is blocked together with every name queried under it.
+    """
+    site_verdicts, ran = cached_verdicts(sites)
+    blocked = []
+    for site, domains in sites.items():
+        bad = site_verdicts[site]
+        if bad is None:
+            failed.update(domains)
+        elif bad:
+            blocked += [site] + [domain for domain in domains if domain != site] # Exact-match resolver: each name needs its entry
+    inference_stats["domains"] += sum(len(domains) for domains in sites.values())
+    inference_stats["inferences"] += ran
+
+    if PREFILTER_MODE == "shadow" and routes:
+        for site, domains in sites.items():
+            if site_verdicts[site] is not None:
+                for domain in domains:
+                    prefilter.compare(routes[domain][0], site_verdicts[site])
+    return blocked, ran
+
+def record_blocks(blocked, ignore_set, reasons=None):
+    blocked = [domain for domain in dict.fromkeys(blocked) if domain not in ignore_set] # A site may be blocked already
+    if blocked:
+        save_blocks(blocked, reasons)
+        for domain in blocked:
+            ignore_set.add(domain) # Add to memory immediately so we don't re-check it in 1 second
+
+def drain_deferred(ignore_set):
+    """Classifies the sites that arrived while the model was loading. Returns how many went through the AI."""
+    sites = {}
+    for site, domains in deferred.items():
+        for domain in domains:
+            # A site blocked or listed meanwhile no longer covers its names: judge those on their own
+            if domain not in ignore_set:
+                known = site in ignore_set and site not in verdicts.items
+                sites.setdefault(domain if known else site, []).append(domain)
+    sites = list(sites.items())
+    deferred.clear()
+    logging.info(f"🧠 Classifying {len(sites)} sites that arrived while the model was loading...")
+    scanned = 0
+    for i in range(0, len(sites), BATCH_SIZE):
+        blocked, ran = classify_sites(dict(sites[i:i + BATCH_SIZE]))
+        record_blocks(blocked, ignore_set)
+        scanned += ran
+    return scanned
+
+def run(fetch, ack=None, ignore_set=None):
+    """Worker loop: fetch a batch, classify it, ack it (stream mode), repeat."""
     # Initial Cache Load
-    ignore_set = load_global_cache()
+    if ignore_set is None:
+        ignore_set = load_global_cache()
     last_update = time.time()
     
-    # How often to reload the massive list (Seconds)
-    # 300 seconds (5 mins) is a good balance for the huge list.
-    CACHE_REFRESH_RATE = 300 
+    # How often to check the lists for changes (Seconds)
+    # Unchanged files cost one stat() each, so this can be frequent.
+    CACHE_REFRESH_RATE = 30
+
+    # Throughput counters (reset every STATS_INTERVAL)
+    popped = 0
+    scanned = 0
+    last_stats = time.time()
 
     while True:
         # Periodic Cache Refresh
         if time.time() - last_update > CACHE_REFRESH_RATE:
-            ignore_set = load_global_cache()
+            if ignore_set.refresh():
+                logging.info(f"🔄 Cache Updated. Knowing {len(ignore_set)} domains to ignore.")
             last_update = time.time()
 
-        # Get domain from Redis (Timeout allows loop to check cache timer)
-        job = r.blpop(QUEUE_NAME, timeout=1)
-        
-        if job:
-            domain = job[1]
-            
-            # 1. THE ULTIMATE CHECK
-            # If we know this domain (Good OR Bad), SKIP IT.
-            if domain in ignore_set:
-                continue 
-
-            # 2. RUN AI CHECK (Only for truly new/unknown sites)
-            if is_haram(domain):
-                save_block(domain)
-                ignore_set.add(domain) # Add to memory immediately so we don't re-check it in 1 second
+        # Periodic Throughput Report
+        elapsed = time.time() - last_stats
+        if elapsed >= STATS_INTERVAL:
+            logging.info(f"📈 Throughput: {popped / elapsed:.1f} domains/sec popped, {scanned / elapsed:.1f} domains/sec scanned by AI")
+            if prefilter:
+                logging.info(f"🔎 Pre-filter ({PREFILTER_MODE}): {prefilter.summary()}")
+            needed, ran = inference_stats["domains"], inference_stats["inferences"]
+            logging.info(f"🧮 Verdict cache: {verdicts.hit_rate():.0%} hit rate ({len(verdicts.items)} sites), "
+                         f"{max(needed - ran, 0)} of {needed} inferences saved by site normalization and caching")
+            popped = scanned = 0
+            last_stats = time.time()
+
+        if engine_failed.is_set():
+            sys.exit(1)
+        if deferred and engine_ready.is_set():
+            scanned += drain_deferred(ignore_set)
+
+        # Get a batch of domains from Redis (Timeout allows loop to check cache timer)
+        batch = fetch()
+        if batch:
+            popped += len(batch)
+            scanned += process_batch(batch, ignore_set)
+        if ack:
+            ack(failed) # Domains without a verdict stay pending and are retried
+        failed.clear()
+
+def pool_process(slot, ignore_set):
+    """Body of one forked pool process."""
+    engine.after_fork(WORKER_THREADS)
+    # Fresh connection per process (sockets must not be shared across fork)
+    client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+    consumer = StreamConsumer(client, STREAM_NAME, STREAM_GROUP, f"{socket.gethostname()}-{os.getpid()}", BATCH_SIZE)
+    run(consumer.fetch, consumer.ack, ignore_set)
+
+def main():
+    connect_redis()
+    ignore_set = load_lists()
+    if QUEUE_BACKEND == "stream":
+        logging.info(f"🚀 Smart Worker Pool Starting ({WORKER_PROCESSES} processes x {WORKER_THREADS} threads)...")
+        ensure_group(r, STREAM_NAME, STREAM_GROUP)
+        # Loaded once here, then shared copy-on-write by every forked process (so not in the background:
+        # fork() must not race a loading thread). Restarted processes get it from the parent instantly.
+        load_model()
+        if engine_failed.is_set():
+            exit(1)
+        logging.info(f"⏱️ Startup: ready after {time.time() - STARTED:.1f}s")
+        run_pool(lambda slot: pool_process(slot, ignore_set), WORKER_PROCESSES)
+    else:
+        threading.Thread(target=load_model, name="model-loader", daemon=True).start()
+        logging.info(f"🚀 Smart Worker Started after {time.time() - STARTED:.1f}s (model still loading). Waiting for traffic...")
+        run(fetch_batch, ignore_set=ignore_set)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,208 @@
+import os
+import socket
+import struct
+import ipaddress
+import threading
+
+# Minimal dnstap reader: Frame Streams over a Unix socket + the few protobuf fields we need.
+# No protobuf/fstrm dependency; the wire formats are small enough to decode by hand.
+# Specs: https://github.com/farsightsec/fstrm (Frame Streams), https://dnstap.info (dnstap.proto)
+
+CONTENT_TYPE = b"protobuf:dnstap.Dnstap"
+
+# Frame Streams control frame types
+CONTROL_ACCEPT = 0x01
+CONTROL_START = 0x02
+CONTROL_STOP = 0x03
+CONTROL_READY = 0x04
+CONTROL_FINISH = 0x05
+CONTROL_FIELD_CONTENT_TYPE = 0x01
+
+# dnstap.Message.Type values for queries a resolver received from clients
+CLIENT_QUERY = 5
+CLIENT_RESPONSE = 6
+
+QTYPE_NAMES = {1: "A", 28: "AAAA", 5: "CNAME", 15: "MX", 16: "TXT", 65: "HTTPS", 64: "SVCB", 12: "PTR"}
+
+# --- FRAME STREAMS ---
+def _read_exact(f, n):
+    data = f.read(n)
+    if len(data) != n:
+        raise EOFError("Frame Streams connection closed")
+    return data
+
+def read_frame(f):
+    """Returns ("data", payload) or ("control", (type, content_types))."""
+    (length,) = struct.unpack(">I", _read_exact(f, 4))
+    if length:
+        return "data", _read_exact(f, length)
+
+    # Escape sequence: a control frame follows
+    (control_length,) = struct.unpack(">I", _read_exact(f, 4))
+    body = _read_exact(f, control_length)
+    (control_type,) = struct.unpack(">I", body[:4])
+    content_types = []
+    pos = 4
+    while pos + 8 <= len(body):
+        field_type, field_length = struct.unpack(">II", body[pos:pos + 8])
+        pos += 8
+        if field_type == CONTROL_FIELD_CONTENT_TYPE:
+            content_types.append(body[pos:pos + field_length])
+        pos += field_length
+    return "control", (control_type, content_types)
+
+def control_frame(control_type, content_type=None):
+    body = struct.pack(">I", control_type)
+    if content_type:
+        body += struct.pack(">II", CONTROL_FIELD_CONTENT_TYPE, len(content_type)) + content_type
+    return struct.pack(">II", 0, len(body)) + body
+
+def data_frame(payload):
+    return struct.pack(">I", len(payload)) + payload
+
+# --- PROTOBUF (just enough of the wire format) ---
+def _varint(buf, pos):
+    result = shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if not b & 0x80:
+            return result, pos
+        shift += 7
+
+def _fields(buf):
+    """Yields (field_number, value) for a protobuf message; value is int or bytes."""
+    pos = 0
+    while pos < len(buf):
+        key, pos = _varint(buf, pos)
+        number, wire_type = key >> 3, key & 0x7
+        if wire_type == 0:
+            value, pos = _varint(buf, pos)
+        elif wire_type == 2:
+            length, pos = _varint(buf, pos)
+            value, pos = buf[pos:pos + length], pos + length
+        elif wire_type == 1:
+            value, pos = buf[pos:pos + 8], pos + 8
+        elif wire_type == 5:
+            value, pos = buf[pos:pos + 4], pos + 4
+        else:
+            raise ValueError(f"Unsupported protobuf wire type {wire_type}")
+        yield number, value
+
+def _encode_varint(value):
+    out = bytearray()
+    while True:
+        b = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(b | 0x80)
+        else:
+            out.append(b)
+            return bytes(out)
+
+def _encode_field(number, value):
+    if isinstance(value, int):
+        return _encode_varint(number << 3) + _encode_varint(value)
+    return _encode_varint(number << 3 | 2) + _encode_varint(len(value)) + value
+
+# --- DNS WIRE FORMAT ---
+def parse_question(wire):
+    """Returns (qname, qtype) from the question section of a DNS message."""
+    pos = 12 # Fixed header
+    labels = []
+    end = None
+    while True:
+        length = wire[pos]
+        if length == 0:
+            pos += 1
+            break
+        if length & 0xC0 == 0xC0:
+            # Compression pointer (unusual in a question, but legal). Only backwards jumps, so no loops.
+            target = (length & 0x3F) << 8 | wire[pos + 1]
+            if target >= pos:
+                raise ValueError("Bad DNS compression pointer")
+            end = end or pos + 2
+            pos = target
+            continue
+        labels.append(wire[pos + 1:pos + 1 + length].decode("ascii", errors="ignore"))
+        pos += 1 + length
+    pos = end or pos
+    (qtype,) = struct.unpack(">H", wire[pos:pos + 2])
+    return ".".join(labels).lower(), qtype
+
+def build_query(qname, qtype, query_id=0):
+    """Builds a minimal DNS query message (used by the replay harness)."""
+    header = struct.pack(">HHHHHH", query_id, 0x0100, 1, 0, 0, 0)
+    question = b"".join(bytes([len(l)]) + l.encode("ascii") for l in qname.split(".") if l) + b"\x00"
+    return header + question + struct.pack(">HH", qtype, 1)
+
+# --- DNSTAP ---
+def decode_dnstap(payload):
+    """Decodes one dnstap frame. Returns {"qname", "qtype", "client", "type"} or None if it carries no query."""
+    message = None
+    for number, value in _fields(payload):
+        if number == 14: # Dnstap.message
+            message = value
+    if message is None:
+        return None
+
+    msg_type, client, wire = None, None, None
+    for number, value in _fields(message):
+        if number == 1: # Message.type
+            msg_type = value
+        elif number == 4: # Message.query_address
+            client = str(ipaddress.ip_address(value))
+        elif number == 10: # Message.query_message (needs "full" in the Corefile)
+            wire = value
+        elif number == 14 and wire is None: # Message.response_message (also carries the question)
+            wire = value
+    if wire is None:
+        return None
+
+    qname, qtype = parse_question(wire)
+    return {"qname": qname, "qtype": QTYPE_NAMES.get(qtype, str(qtype)), "client": client, "type": msg_type}
+
+def encode_dnstap(qname, qtype=1, client="127.0.0.1", msg_type=CLIENT_QUERY):
+    """Builds a dnstap frame payload for a client query (used by the replay harness)."""
+    message = (
+        _encode_field(1, msg_type)
+        + _encode_field(4, ipaddress.ip_address(client).packed)
+        + _encode_field(10, build_query(qname, qtype))
+    )
+    return _encode_field(15, 1) + _encode_field(14, message) # Dnstap.type = MESSAGE
+
+# --- SERVER ---
+def handle_connection(conn, on_payload):
+    """Runs the bidirectional Frame Streams handshake, then passes every data frame to on_payload."""
+    f = conn.makefile("rb")
+    try:
+        kind, value = read_frame(f)
+        if kind != "control" or value[0] != CONTROL_READY or CONTENT_TYPE not in value[1]:
+            return
+        conn.sendall(control_frame(CONTROL_ACCEPT, CONTENT_TYPE))
+
+        while True:
+            kind, value = read_frame(f)
+            if kind == "data":
+                on_payload(value)
+            elif value[0] == CONTROL_STOP:
+                conn.sendall(control_frame(CONTROL_FINISH))
+                return
+            # START (and anything else) needs no reply
+    except EOFError:
+        pass
+    finally:
+        f.close()
+        conn.close()
+
+def serve(socket_path, on_payload):
+    """Listens on a Unix socket for dnstap writers (CoreDNS); one thread per connection."""
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen(8)
+    while True:
+        conn, _ = server.accept()
+        threading.Thread(target=handle_connection, args=(conn, on_payload), daemon=True).start()
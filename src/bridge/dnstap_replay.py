@@ -0,0 +1,130 @@
+"""
+Local dnstap test harness: replays recorded dnstap frames into the bridge's socket.
+
+Recorded files are Frame Streams files, e.g. captured from CoreDNS with the
+`dnstap` CLI (dnstap -u /tmp/dnstap.sock -w capture.fstrm), or generated here.
+
+    # Make a capture from a domain list (one domain per line)
+    python src/bridge/dnstap_replay.py generate data/blocklists/blacklist.txt capture.fstrm
+
+    # Replay it into a running bridge (BRIDGE_INPUT=dnstap)
+    python src/bridge/dnstap_replay.py replay capture.fstrm --socket /tmp/dnstap.sock
+
+    # Self-test: replay into an in-process reader and check every frame decodes
+    python src/bridge/dnstap_replay.py selftest capture.fstrm
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import tempfile
+import threading
+import dnstap
+
+def read_capture(path):
+    """Yields the data frame payloads of a (unidirectional) Frame Streams file."""
+    with open(path, "rb") as f:
+        while True:
+            try:
+                kind, value = dnstap.read_frame(f)
+            except EOFError:
+                return
+            if kind == "data":
+                yield value
+            elif value[0] == dnstap.CONTROL_STOP:
+                return
+
+def generate(domains_file, out_path, clients=20):
+    """Writes a Frame Streams file with one CLIENT_QUERY per domain (alternating A/AAAA)."""
+    count = 0
+    with open(domains_file, "r", encoding="utf-8", errors="ignore") as src, open(out_path, "wb") as out:
+        out.write(dnstap.control_frame(dnstap.CONTROL_START, dnstap.CONTENT_TYPE))
+        for line in src:
+            domain = line.strip()
+            if not domain or domain.startswith("#"):
+                continue
+            qtype = 1 if count % 2 == 0 else 28
+            client = f"192.168.1.{count % clients + 1}"
+            out.write(dnstap.data_frame(dnstap.encode_dnstap(domain, qtype, client)))
+            count += 1
+        out.write(dnstap.control_frame(dnstap.CONTROL_STOP))
+    print(f"✅ Wrote {count} frames to {out_path}")
+
+def replay(path, socket_path, rate=0):
+    """Connects as a dnstap writer (like CoreDNS) and sends every recorded frame. rate=0 means as fast as possible."""
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.connect(socket_path)
+    f = conn.makefile("rb")
+
+    conn.sendall(dnstap.control_frame(dnstap.CONTROL_READY, dnstap.CONTENT_TYPE))
+    kind, value = dnstap.read_frame(f)
+    if kind != "control" or value[0] != dnstap.CONTROL_ACCEPT:
+        raise RuntimeError("Reader did not ACCEPT the dnstap content type")
+    conn.sendall(dnstap.control_frame(dnstap.CONTROL_START, dnstap.CONTENT_TYPE))
+
+    start = time.time()
+    sent = 0
+    for payload in read_capture(path):
+        conn.sendall(dnstap.data_frame(payload))
+        sent += 1
+        if rate:
+            delay = start + sent / rate - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+    conn.sendall(dnstap.control_frame(dnstap.CONTROL_STOP))
+    kind, value = dnstap.read_frame(f)
+    if kind != "control" or value[0] != dnstap.CONTROL_FINISH:
+        raise RuntimeError("Reader did not FINISH")
+    conn.close()
+
+    elapsed = time.time() - start
+    print(f"✅ Replayed {sent} frames in {elapsed:.2f}s ({sent / max(elapsed, 1e-9):.0f} frames/sec)")
+    return sent
+
+def selftest(path):
+    """Replays into an in-process reader and checks that every frame decodes to a query."""
+    socket_path = os.path.join(tempfile.mkdtemp(), "dnstap.sock")
+    decoded, failed = [], []
+
+    def on_payload(payload):
+        try:
+            query = dnstap.decode_dnstap(payload)
+            (decoded if query else failed).append(query)
+        except (ValueError, IndexError) as e:
+            failed.append(e)
+
+    threading.Thread(target=dnstap.serve, args=(socket_path, on_payload), daemon=True).start()
+    while not os.path.exists(socket_path):
+        time.sleep(0.01)
+
+    sent = replay(path, socket_path)
+    for query in decoded[:5]:
+        print(f"    {query['client']} {query['qtype']} {query['qname']}")
+    if failed or len(decoded) != sent:
+        print(f"❌ Decoded {len(decoded)}/{sent} frames ({len(failed)} failed)")
+        return False
+    print(f"✅ Decoded all {sent} frames")
+    return True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    gen = sub.add_parser("generate", help="Build a capture file from a domain list")
+    gen.add_argument("domains")
+    gen.add_argument("out")
+    rep = sub.add_parser("replay", help="Send a capture to a dnstap socket")
+    rep.add_argument("capture")
+    rep.add_argument("--socket", default="/tmp/dnstap.sock")
+    rep.add_argument("--rate", type=float, default=0, help="Frames per second (0 = unthrottled)")
+    test = sub.add_parser("selftest", help="Replay into an in-process reader and verify decoding")
+    test.add_argument("capture")
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        generate(args.domains, args.out)
+    elif args.command == "replay":
+        replay(args.capture, args.socket, args.rate)
+    else:
+        sys.exit(0 if selftest(args.capture) else 1)
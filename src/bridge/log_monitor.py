@@ -1,29 +1,217 @@
+import os
+import sys
 import time
 import redis
 import re
+import queue
+import threading
 import subprocess
+from collections import OrderedDict
+
+# Shared list parsing/snapshot code lives with the worker
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ai_worker"))
+from ignore_cache import IgnoreCache, IndexSource, ListSource, StoreSource
+from list_store import ListStore
+import dnstap
 
 # CONFIG
 LOG_FILE = "logs/query.log"
-r = redis.Redis(host='localhost', port=6379, db=0)
+QUEUE_NAME = "dns_traffic"
+
+# Queue backend, must match the worker: "list" (QUEUE_NAME) or "stream" (STREAM_NAME, for the worker pool)
+QUEUE_BACKEND = os.getenv("DNS_QUEUE", "list")
+STREAM_NAME = "dns_traffic_stream"
+STREAM_MAXLEN = 1_000_000 # Approximate cap so acknowledged entries don't pile up forever
+
+# Input: "log" tails CoreDNS's text query log, "dnstap" listens for CoreDNS dnstap frames
+# (lets production run without the `log` plugin; see Corefile.example)
+BRIDGE_INPUT = os.getenv("BRIDGE_INPUT", "log")
+DNSTAP_SOCKET = os.getenv("DNSTAP_SOCKET", "/tmp/dnstap.sock")
+DNSTAP_QTYPES = {"A", "AAAA", "HTTPS"} # Query types worth classifying
+
+# Known lists: domains already in any of these never need to reach the AI
+BLOCK_DIR = "data/blocklists"
+FINAL_FILE = f"{BLOCK_DIR}/final_blocklist.txt"
+INDEX_FILE = f"{BLOCK_DIR}/final_blocklist.idx" # Compiled by the manager, mmapped (shared with the worker's page cache)
+KNOWN_REFRESH_RATE = 30 # Seconds between (cheap, change-driven) list refreshes
+
+# Recently forwarded domains are not pushed again until their TTL runs out
+RECENT_MAX_SIZE = 100_000
+RECENT_TTL = 600 # Seconds
+
+# Pushes are sent through one Redis pipeline per batch
+PUSH_BATCH_SIZE = 100
+PUSH_MAX_WAIT = 0.5 # Seconds a domain may wait in the buffer
+
+# Stdout is only written once per interval (a line per domain made print the bottleneck)
+LOG_INTERVAL = 10 # Seconds
+
+# Extract domain using Regex (looks for "A IN domain.com.")
+# CoreDNS Log format: ... A IN google.com. ...
+QUERY_RE = re.compile(rb'A\s+IN\s+([a-zA-Z0-9.-]+)\.')
+
+class RecentCache:
+    """Bounded LRU of domains forwarded in the last `ttl` seconds."""
+
+    def __init__(self, max_size=RECENT_MAX_SIZE, ttl=RECENT_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.items = OrderedDict()
+
+    def seen(self, domain, now=None):
+        """Returns True if domain was forwarded recently, otherwise remembers it and returns False."""
+        now = now or time.time()
+        stamp = self.items.get(domain)
+        if stamp is not None and now - stamp < self.ttl:
+            self.items.move_to_end(domain)
+            return True
+        self.items[domain] = now
+        self.items.move_to_end(domain)
+        if len(self.items) > self.max_size:
+            self.items.popitem(last=False)
+        return False
+
+class Pusher:
+    """Buffers domains and sends them to Redis in pipelined batches (size- or time-bounded)."""
+
+    def __init__(self, r, batch_size=PUSH_BATCH_SIZE, max_wait=PUSH_MAX_WAIT):
+        self.r = r
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.buffer = []
+        self.first_at = 0.0
+        self.sent = 0
+
+    def push(self, domain):
+        if not self.buffer:
+            self.first_at = time.time()
+        self.buffer.append(domain)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
 
-print("🌉 Bridge Started: Watching DNS -> Sending to AI...")
+    def flush_if_due(self):
+        if self.buffer and time.time() - self.first_at >= self.max_wait:
+            self.flush()
 
-# Open the log file
-# We use subprocess 'tail' because it handles file rotation better than Python
-f = subprocess.Popen(['tail','-F',LOG_FILE], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    def flush(self):
+        if not self.buffer:
+            return
+        pipe = self.r.pipeline(transaction=False)
+        for domain in self.buffer:
+            if QUEUE_BACKEND == "stream":
+                pipe.xadd(STREAM_NAME, {"domain": domain}, maxlen=STREAM_MAXLEN, approximate=True)
+            else:
+                pipe.lpush(QUEUE_NAME, domain)
+        pipe.execute()
+        self.sent += len(self.buffer)
+        self.buffer = []
 
-while True:
-    line = f.stdout.readline()
-    if line:
-        text = line.decode('utf-8')
-        # Extract domain using Regex (looks for "A IN domain.com.")
-        # CoreDNS Log format: ... A IN google.com. ...
-        match = re.search(r'A\s+IN\s+([a-zA-Z0-9.-]+)\.', text)
+class Bridge:
+    """Filters query names down to unknown, not-recently-seen domains and forwards them to the AI queue."""
+
+    def __init__(self, r):
+        self.pusher = Pusher(r)
+        self.recent = RecentCache()
+        # Same snapshot of the lists the worker ignores (the final list through the index, like the worker)
+        self.known = IgnoreCache([
+            StoreSource(ListStore(), ["whitelist", "blacklist", "ai_blocks"]),
+            IndexSource(INDEX_FILE) if os.path.exists(INDEX_FILE) else ListSource(FINAL_FILE, needs_parsing=True),
+        ])
+        if not os.path.exists(INDEX_FILE):
+            print(f"⚠️ {INDEX_FILE} not found, parsing {FINAL_FILE} instead (slow; the next deploy writes the index)", flush=True)
+        self.known.refresh()
+        self.last_refresh = time.time()
+        self.last_log = time.time()
+        self.stats = {"matched": 0, "known": 0, "deduped": 0}
+        self.last_domain = None
+
+    def handle(self, domain):
+        self.stats["matched"] += 1
+        # Ignore local/weird domains
+        if "udp" in domain or "tcp" in domain:
+            return
+        if domain in self.known:
+            self.stats["known"] += 1
+            return
+        if self.recent.seen(domain):
+            self.stats["deduped"] += 1
+            return
+        # Push to AI Queue
+        self.pusher.push(domain)
+        self.last_domain = domain
+
+    def handle_line(self, line):
+        match = QUERY_RE.search(line)
         if match:
-            domain = match.group(1)
-            # Ignore local/weird domains
-            if "udp" not in domain and "tcp" not in domain:
-                # Push to AI Queue
-                r.lpush("dns_traffic", domain)
-                print(f"➡️  Sent to AI: {domain}")
+            self.handle(match.group(1).decode("ascii", errors="ignore"))
+
+    def tick(self):
+        """Housekeeping between lines: flush due batches, refresh lists, print a summary."""
+        self.pusher.flush_if_due()
+        now = time.time()
+        if now - self.last_refresh > KNOWN_REFRESH_RATE:
+            self.known.refresh()
+            self.last_refresh = now
+        if now - self.last_log >= LOG_INTERVAL:
+            if self.stats["matched"]:
+                print(f"➡️  Sent to AI: {self.pusher.sent} (matched {self.stats['matched']}, known {self.stats['known']}, "
+                      f"deduped {self.stats['deduped']}) last: {self.last_domain}", flush=True)
+            self.pusher.sent = 0
+            self.stats = dict.fromkeys(self.stats, 0)
+            self.last_log = now
+
+def follow(path):
+    """Yields new lines of path (or None every 100ms when idle), surviving log rotation."""
+    # We use subprocess 'tail' because it handles file rotation better than Python
+    f = subprocess.Popen(['tail', '-F', path], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    lines = queue.Queue(maxsize=10_000)
+
+    def reader():
+        for line in iter(f.stdout.readline, b''):
+            lines.put(line)
+
+    threading.Thread(target=reader, daemon=True).start()
+    while True:
+        try:
+            yield lines.get(timeout=0.1)
+        except queue.Empty:
+            yield None
+
+def dnstap_queries(socket_path):
+    """Yields query names received over dnstap (or None every 100ms when idle)."""
+    names = queue.Queue(maxsize=10_000)
+
+    def on_payload(payload):
+        try:
+            query = dnstap.decode_dnstap(payload)
+        except (ValueError, IndexError):
+            return # Malformed frame
+        if query and query["type"] == dnstap.CLIENT_QUERY and query["qtype"] in DNSTAP_QTYPES:
+            names.put(query["qname"])
+
+    threading.Thread(target=dnstap.serve, args=(socket_path, on_payload), daemon=True).start()
+    while True:
+        try:
+            yield names.get(timeout=0.1)
+        except queue.Empty:
+            yield None
+
+def main():
+    r = redis.Redis(host='localhost', port=6379, db=0)
+    bridge = Bridge(r)
+
+    if BRIDGE_INPUT == "dnstap":
+        print(f"🌉 Bridge Started: Listening for dnstap on {DNSTAP_SOCKET} -> Sending to AI...", flush=True)
+        for domain in dnstap_queries(DNSTAP_SOCKET):
+            if domain:
+                bridge.handle(domain)
+            bridge.tick()
+    else:
+        print("🌉 Bridge Started: Watching DNS -> Sending to AI...", flush=True)
+        for line in follow(LOG_FILE):
+            if line:
+                bridge.handle_line(line)
+            bridge.tick()
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,17 @@
-from flask import Flask, render_template_string, request, redirect, url_for, flash, Response, stream_with_context, session
+from flask import Flask, render_template_string, request, redirect, url_for, flash, Response, stream_with_context, session, jsonify
 import os
 import subprocess
 import sys
 import time
-import re
 from functools import wraps
 from datetime import datetime
 from dotenv import load_dotenv
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ai_worker"))
+from lookup import DomainLookup
+from list_store import ListStore
+from query_stats import Aggregator
+
 load_dotenv()
 
 app = Flask(__name__)
@@ -24,10 +28,8 @@ QUERY_LOG = f"{LOG_DIR}/query.log"
 JUDGE_LOG = f"{LOG_DIR}/judge.log"
 DEPLOY_LOG = f"{LOG_DIR}/deploy.log"
 
-AI_FILE = f"{BLOCK_DIR}/ai_blocks.txt"
-WHITELIST_FILE = f"{BLOCK_DIR}/whitelist.txt"
-BLACKLIST_FILE = f"{BLOCK_DIR}/blacklist.txt"
 FINAL_FILE = f"{BLOCK_DIR}/final_blocklist.txt"
+INDEX_FILE = f"{BLOCK_DIR}/final_blocklist.idx" # Compiled by the manager (blocklist_index.py)
 
 # --- LOGIN TEMPLATE ---
 LOGIN_TEMPLATE = """
@@ -168,6 +170,7 @@ HTML_TEMPLATE = """
                     <li class="nav-item"><a class="nav-link {% if active_tab == 'ai' %}active{% endif %}" href="/?tab=ai">Suspects</a></li>
                     <li class="nav-item"><a class="nav-link {% if active_tab == 'blacklist' %}active{% endif %}" href="/?tab=blacklist">Blacklist</a></li>
                     <li class="nav-item"><a class="nav-link {% if active_tab == 'whitelist' %}active{% endif %}" href="/?tab=whitelist">Whitelist</a></li>
+                    <li class="nav-item"><a class="nav-link {% if active_tab == 'stats' %}active{% endif %}" href="/?tab=stats">Traffic</a></li>
                     <li class="nav-item"><a class="nav-link {% if active_tab == 'logs' %}active{% endif %}" href="/?tab=logs">Logs</a></li>
                 </ul>
             </div>
@@ -181,7 +184,7 @@ HTML_TEMPLATE = """
                             <button name="action" value="whitelist" class="btn btn-outline-success btn-sm">Whitelist Selected</button>
                             <button name="action" value="delete" class="btn btn-outline-secondary btn-sm">Ignore</button>
                         </div>
-                        <table class="table table-hover datatable"><thead><tr><th width="30"><input type="checkbox" class="selectAll"></th><th>Domain</th><th class="text-end">Actions</th></tr></thead><tbody>{% for domain in ai_domains %}<tr><td><input type="checkbox" name="domains" value="{{ domain }}"></td><td>{{ domain }}</td><td class="text-end"><a href="/move_to_blacklist/{{ domain }}" class="btn btn-sm btn-light text-danger"><i class="fas fa-ban"></i></a> <a href="/move_to_whitelist/{{ domain }}" class="btn btn-sm btn-light text-success"><i class="fas fa-check"></i></a></td></tr>{% endfor %}</tbody></table>
+                        <table class="table table-hover datatable" data-source="ai"><thead><tr><th width="30"><input type="checkbox" class="selectAll"></th><th>Domain</th><th class="text-end">Actions</th></tr></thead><tbody></tbody></table>
                     </form>
 
                 {% elif active_tab == 'blacklist' %}
@@ -196,17 +199,9 @@ HTML_TEMPLATE = """
                             <button name="action" value="whitelist" class="btn btn-outline-success btn-sm">Move to Whitelist</button>
                             <button name="action" value="delete" class="btn btn-outline-secondary btn-sm">Delete Selected</button>
                         </div>
-                        <table class="table table-hover datatable">
+                        <table class="table table-hover datatable" data-source="blacklist">
                             <thead><tr><th width="30"><input type="checkbox" class="selectAll"></th><th>Blocked Domain</th><th class="text-end">Action</th></tr></thead>
-                            <tbody>
-                                {% for domain in bl_domains %}
-                                <tr>
-                                    <td><input type="checkbox" name="domains" value="{{ domain }}"></td>
-                                    <td class="text-danger fw-bold">{{ domain }}</td>
-                                    <td class="text-end"><a href="/remove_blacklist/{{ domain }}" class="btn btn-sm btn-light"><i class="fas fa-trash"></i></a></td>
-                                </tr>
-                                {% endfor %}
-                            </tbody>
+                            <tbody></tbody>
                         </table>
                     </form>
 
@@ -217,20 +212,20 @@ HTML_TEMPLATE = """
                             <button name="action" value="block" class="btn btn-outline-danger btn-sm">Move to Blacklist</button>
                             <button name="action" value="delete" class="btn btn-outline-secondary btn-sm">Delete Selected</button>
                         </div>
-                        <table class="table table-hover datatable">
+                        <table class="table table-hover datatable" data-source="whitelist">
                             <thead><tr><th width="30"><input type="checkbox" class="selectAll"></th><th>Safe Domain</th><th class="text-end">Action</th></tr></thead>
-                            <tbody>
-                                {% for domain in wl_domains %}
-                                <tr>
-                                    <td><input type="checkbox" name="domains" value="{{ domain }}"></td>
-                                    <td class="text-success fw-bold">{{ domain }}</td>
-                                    <td class="text-end"><a href="/remove_whitelist/{{ domain }}" class="btn btn-sm btn-light"><i class="fas fa-trash"></i></a></td>
-                                </tr>
-                                {% endfor %}
-                            </tbody>
+                            <tbody></tbody>
                         </table>
                     </form>
 
+                {% elif active_tab == 'stats' %}
+                    <p class="text-muted small">Last {{ stats.window_minutes }} minutes, counting since {{ stats.since }} (updated {{ stats.updated }}): {{ stats.queries }} queries, {{ stats.blocked }} blocked, ~{{ stats.unique_clients }} clients.</p>
+                    <div class="row">
+                        <div class="col-md-4"><h6>Top Queried</h6><table class="table table-sm">{% for domain, n in stats.top_queried %}<tr><td>{{ domain }}</td><td class="text-end">{{ n }}</td></tr>{% endfor %}</table></div>
+                        <div class="col-md-4"><h6>Top Blocked</h6><table class="table table-sm">{% for domain, n in stats.top_blocked %}<tr><td class="text-danger">{{ domain }}</td><td class="text-end">{{ n }}</td></tr>{% endfor %}</table></div>
+                        <div class="col-md-4"><h6>QPS per Minute</h6><table class="table table-sm">{% for row in stats.qps|reverse %}<tr><td>{{ row.minute }}</td><td class="text-end">{{ row.qps }}</td><td class="text-end text-danger">{{ row.blocked }} blocked</td></tr>{% endfor %}</table></div>
+                    </div>
+
                 {% elif active_tab == 'logs' %}
                     <div class="row"><div class="col-md-6"><h6>Judge Logs</h6><div class="log-box">{{ judge_logs }}</div></div><div class="col-md-6"><h6>Deploy Logs</h6><div class="log-box">{{ deploy_logs }}</div></div></div>
                 {% endif %}
@@ -240,7 +235,24 @@ HTML_TEMPLATE = """
     <script src="https://code.jquery.com/jquery-3.7.0.min.js"></script><script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js"></script><script src="https://cdn.datatables.net/1.13.4/js/jquery.dataTables.min.js"></script><script src="https://cdn.datatables.net/1.13.4/js/dataTables.bootstrap5.min.js"></script>
     <script>
         $(document).ready(function(){
-            $('.datatable').DataTable({"pageLength":10,"lengthMenu":[10,25,50]});
+            // Server-side paging/search/sort: the page only ever holds the rows on screen
+            const esc = d => $('<div>').text(d).html().replace(/"/g, '&quot;');
+            const url = d => encodeURIComponent(d);
+            const ACTIONS = {
+                ai: d => `<a href="/move_to_blacklist/${url(d)}" class="btn btn-sm btn-light text-danger"><i class="fas fa-ban"></i></a> <a href="/move_to_whitelist/${url(d)}" class="btn btn-sm btn-light text-success"><i class="fas fa-check"></i></a>`,
+                blacklist: d => `<a href="/remove_blacklist/${url(d)}" class="btn btn-sm btn-light"><i class="fas fa-trash"></i></a>`,
+                whitelist: d => `<a href="/remove_whitelist/${url(d)}" class="btn btn-sm btn-light"><i class="fas fa-trash"></i></a>`
+            };
+            const DOMAIN_CLASS = {ai: '', blacklist: 'text-danger fw-bold', whitelist: 'text-success fw-bold'};
+            $('.datatable').each(function(){
+                const source = $(this).data('source');
+                $(this).DataTable({"serverSide":true,"processing":true,"ajax":"/api/list/" + source,"pageLength":10,"lengthMenu":[10,25,50],"order":[[1,"asc"]],
+                    "columns":[
+                        {"data":"domain","orderable":false,"render":d => `<input type="checkbox" name="domains" value="${esc(d)}">`},
+                        {"data":"domain","className":DOMAIN_CLASS[source],"render":$.fn.dataTable.render.text()},
+                        {"data":"domain","orderable":false,"className":"text-end","render":ACTIONS[source]}
+                    ]});
+            });
             $('.selectAll').on('click',function(){$('input[type="checkbox"]',$(this).closest('table').find('tbody tr')).prop('checked',this.checked);});
         });
     </script>
@@ -249,24 +261,21 @@ HTML_TEMPLATE = """
 LOG_TEMPLATE = """<!DOCTYPE html><html><head><title>Live</title><style>body{background:#000;color:#0f0;font-family:monospace;padding:20px}.line{border-bottom:1px solid #222;padding:2px}</style></head><body><h3>Running Judge...</h3><div id="log"></div><script>const log=document.getElementById('log');const es=new EventSource("/stream_judge");es.onmessage=function(e){if(e.data.includes("DONE_SIGNAL")){window.location.href='/';return;}const div=document.createElement('div');div.className='line';div.innerText=e.data;log.appendChild(div);window.scrollTo(0,document.body.scrollHeight);};</script></body></html>"""
 
 # --- HELPERS ---
-def get_lines(filepath):
-    if not os.path.exists(filepath): return []
-    with open(filepath, "r") as f: return sorted(list(set([l.strip() for l in f if l.strip()])))
-
-def save_lines(filepath, lines):
-    with open(filepath, "w") as f: f.write("\n".join(lines) + "\n")
-
-def count_unique_users():
-    if not os.path.exists(QUERY_LOG): return 0
-    unique_ips = set()
-    try:
-        cmd = f"tail -n 5000 {QUERY_LOG}"
-        output = subprocess.check_output(cmd, shell=True).decode('utf-8', errors='ignore')
-        ips = re.findall(r'\[INFO\]\s+([0-9a-fA-F:.]+):\d+\s+-', output)
-        for ip in ips:
-            if ip not in ['127.0.0.1', '::1']: unique_ips.add(ip)
-    except: return 0
-    return len(unique_ips)
+# The suspect/block/safe lists live in the shared list store (transactions, so edits here
+# can't clobber what the worker and the judge write at the same time)
+store = ListStore()
+LISTS = {"ai": "ai_blocks", "blacklist": "blacklist", "whitelist": "whitelist"} # Tab/form name -> store list
+
+def list_counts(): return {"ai_count": store.count("ai_blocks"), "bl_count": store.count("blacklist"), "wl_count": store.count("whitelist")}
+
+# Query log analytics (unique clients, top domains, QPS), aggregated incrementally in the background
+query_stats = Aggregator(QUERY_LOG, INDEX_FILE)
+
+def traffic_stats():
+    query_stats.ensure_started() # Lazily: WSGI servers and `flask run` never execute __main__
+    return query_stats.latest
+
+def count_unique_users(): return traffic_stats()["unique_clients"]
 
 def read_log_tail(filepath, n=100):
     if not os.path.exists(filepath): return "No logs."
@@ -306,28 +315,70 @@ def logout():
 def index():
     tab = request.args.get('tab', 'ai')
     return render_template_string(HTML_TEMPLATE, active_tab=tab,
-                                  ai_domains=get_lines(AI_FILE), ai_count=len(get_lines(AI_FILE)),
-                                  bl_domains=get_lines(BLACKLIST_FILE), bl_count=len(get_lines(BLACKLIST_FILE)),
-                                  wl_domains=get_lines(WHITELIST_FILE), wl_count=len(get_lines(WHITELIST_FILE)),
+                                  **list_counts(),
                                   judge_logs=(read_log_tail(JUDGE_LOG) if tab=='logs' else ""),
                                   deploy_logs=(read_log_tail(DEPLOY_LOG) if tab=='logs' else ""),
+                                  stats=traffic_stats(),
                                   unique_users=count_unique_users())
 
+# Check Master Database: in-process lookups against the manager's index + the local lists
+lookup_service = DomainLookup(INDEX_FILE, store)
+MAX_BULK_LOOKUP = 10_000
+
+def describe(result):
+    """One-line verdict for the Check Status box: (text, color, icon)."""
+    domain, sources = result["domain"], ", ".join(result["sources"] or [])
+    if result["status"] == "whitelisted":
+        return f"{domain} is SAFE (Whitelisted)", "success", "check-circle"
+    if result["status"] == "blocked":
+        if result["match"] == "exact":
+            return f"{domain} is BLOCKED (Database: {sources})", "danger", "ban"
+        return f"{domain} is BLOCKED (Manual, live after the next deploy)", "danger", "ban"
+    if result["status"] == "parent_blocked":
+        return f"{domain} is ALLOWED, but its parent {result['matched']} is BLOCKED (Database: {sources})", "warning", "sitemap"
+    if "ai_blocks" in result["local"]:
+        return f"{domain} is ALLOWED (AI suspect, blocked after the next deploy)", "warning", "robot"
+    return f"{domain} is ALLOWED", "secondary", "globe"
+
 @app.route('/check_domain', methods=['POST'])
 @login_required
 def check_domain():
     domain = request.form.get('check_domain').strip().lower()
-    res, color, icon = f"{domain} is ALLOWED", "secondary", "globe"
-    if domain in get_lines(WHITELIST_FILE): res, color, icon = f"{domain} is SAFE (Whitelisted)", "success", "check-circle"
-    elif domain in get_lines(BLACKLIST_FILE): res, color, icon = f"{domain} is BLOCKED (Manual)", "danger", "ban"
-    else:
-        try: subprocess.check_call(['grep', '-q', f"0.0.0.0 {domain}$", FINAL_FILE]); res, color, icon = f"{domain} is BLOCKED (Database)", "danger", "ban"
-        except: pass
+    res, color, icon = describe(lookup_service.lookup_many([domain])[0])
     return render_template_string(HTML_TEMPLATE, active_tab='ai', search_result=res, search_color=color, search_icon=icon,
-                                  unique_users=count_unique_users(),
-                                  ai_domains=get_lines(AI_FILE), ai_count=len(get_lines(AI_FILE)),
-                                  bl_domains=get_lines(BLACKLIST_FILE), bl_count=len(get_lines(BLACKLIST_FILE)),
-                                  wl_domains=get_lines(WHITELIST_FILE), wl_count=len(get_lines(WHITELIST_FILE)))
+                                  unique_users=count_unique_users(), **list_counts())
+
+MAX_PAGE_LENGTH = 100
+
+@app.route('/api/list/<name>')
+@login_required
+def api_list(name):
+    """DataTables server-side protocol: one page of a list, filtered by search[value] and sorted by domain."""
+    if name not in LISTS: return jsonify(error=f"Unknown list '{name}'"), 404
+    start = max(0, request.args.get('start', 0, type=int))
+    length = request.args.get('length', 10, type=int)
+    length = MAX_PAGE_LENGTH if length < 1 else min(length, MAX_PAGE_LENGTH)
+    page, matching = store.page(LISTS[name], start, length, request.args.get('search[value]', '').strip().lower(),
+                                descending=request.args.get('order[0][dir]') == 'desc')
+    return jsonify(draw=request.args.get('draw', 0, type=int), recordsTotal=store.count(LISTS[name]), recordsFiltered=matching,
+                   data=[{"domain": d} for d in page])
+
+@app.route('/api/lookup', methods=['POST'])
+@login_required
+def api_lookup():
+    """Bulk lookup: {"domains": [...]} -> {"results": [{domain, status, match, matched, sources, local}, ...]}"""
+    domains = (request.get_json(silent=True) or {}).get('domains')
+    if not isinstance(domains, list) or not all(isinstance(d, str) for d in domains):
+        return jsonify(error="Expected JSON: {\"domains\": [\"example.com\", ...]}"), 400
+    if len(domains) > MAX_BULK_LOOKUP:
+        return jsonify(error=f"At most {MAX_BULK_LOOKUP} domains per request"), 400
+    start = time.perf_counter()
+    results = lookup_service.lookup_many(domains)
+    return jsonify(results=results, elapsed_ms=round((time.perf_counter() - start) * 1000, 2))
+
+@app.route('/api/stats')
+@login_required
+def api_stats(): return jsonify(traffic_stats())
 
 @app.route('/run_judge_view')
 @login_required
@@ -351,61 +402,55 @@ def bulk_action():
     
     if not domains: return redirect(url_for('index', tab=source))
 
-    # Determine Source File
-    source_file = AI_FILE if source=='ai' else (BLACKLIST_FILE if source=='blacklist' else WHITELIST_FILE)
-    lines = get_lines(source_file)
+    # Determine Source List
+    source_list = LISTS.get(source, "whitelist")
     
     # 1. DELETE ACTION
     if action == 'delete':
-        for d in domains: 
-            if d in lines: lines.remove(d)
-        save_lines(source_file, lines)
+        store.remove(source_list, domains)
         flash(f"Deleted {len(domains)} domains from {source}.", "secondary")
 
     # 2. BLOCK ACTION
     elif action == 'block':
-        bl_lines = get_lines(BLACKLIST_FILE)
-        for d in domains:
-            if d in lines: lines.remove(d)
-            if d not in bl_lines: bl_lines.append(d)
-        save_lines(source_file, lines)
-        save_lines(BLACKLIST_FILE, bl_lines)
+        store.move(domains, source_list, "blacklist")
         flash(f"Blocked {len(domains)} domains.", "danger")
 
     # 3. WHITELIST ACTION
     elif action == 'whitelist':
-        wl_lines = get_lines(WHITELIST_FILE)
-        for d in domains:
-            if d in lines: lines.remove(d)
-            if d not in wl_lines: wl_lines.append(d)
-        save_lines(source_file, lines)
-        save_lines(WHITELIST_FILE, wl_lines)
+        store.move(domains, source_list, "whitelist")
         flash(f"Whitelisted {len(domains)} domains.", "success")
 
     return redirect(url_for('index', tab=source))
 
 @app.route('/move_to_blacklist/<d>')
 @login_required
-def move_to_blacklist(d): l=get_lines(AI_FILE); (l.remove(d) if d in l else None); save_lines(AI_FILE, l); bl=get_lines(BLACKLIST_FILE); (bl.append(d) if d not in bl else None); save_lines(BLACKLIST_FILE, bl); return redirect(url_for('index', tab='ai'))
+def move_to_blacklist(d): store.move([d], "ai_blocks", "blacklist"); return redirect(url_for('index', tab='ai'))
 
 @app.route('/move_to_whitelist/<d>')
 @login_required
-def move_to_whitelist(d): l=get_lines(AI_FILE); (l.remove(d) if d in l else None); save_lines(AI_FILE, l); wl=get_lines(WHITELIST_FILE); (wl.append(d) if d not in wl else None); save_lines(WHITELIST_FILE, wl); return redirect(url_for('index', tab='ai'))
+def move_to_whitelist(d): store.move([d], "ai_blocks", "whitelist"); return redirect(url_for('index', tab='ai'))
 
 @app.route('/add_blacklist', methods=['POST'])
 @login_required
-def add_blacklist(): d=request.form.get('domain').strip(); l=get_lines(BLACKLIST_FILE); (l.append(d) if d and d not in l else None); save_lines(BLACKLIST_FILE, l); return redirect(url_for('index', tab='blacklist'))
+def add_blacklist(): store.add("blacklist", [request.form.get('domain', '')]); return redirect(url_for('index', tab='blacklist'))
 
 @app.route('/remove_blacklist/<d>')
 @login_required
-def remove_blacklist(d): l=get_lines(BLACKLIST_FILE); (l.remove(d) if d in l else None); save_lines(BLACKLIST_FILE, l); return redirect(url_for('index', tab='blacklist'))
+def remove_blacklist(d): store.remove("blacklist", [d]); return redirect(url_for('index', tab='blacklist'))
 
 @app.route('/remove_whitelist/<d>')
 @login_required
-def remove_whitelist(d): l=get_lines(WHITELIST_FILE); (l.remove(d) if d in l else None); save_lines(WHITELIST_FILE, l); return redirect(url_for('index', tab='whitelist'))
+def remove_whitelist(d): store.remove("whitelist", [d]); return redirect(url_for('index', tab='whitelist'))
 
 @app.route('/deploy', methods=['POST'])
 @login_required
-def deploy(): subprocess.Popen(["bash", "src/auto_deploy.sh"]); flash("System updating... Check Logs.", "info"); return redirect(url_for('index'))
-
-if __name__ == '__main__': app.run(host='0.0.0.0', port=5000, threaded=True)
+def deploy():
+    # Build + validate + atomic swap + DNS health probe; CoreDNS reloads the list without a restart
+    os.makedirs(LOG_DIR, exist_ok=True)
+    with open(DEPLOY_LOG, "a") as out:
+        subprocess.Popen([sys.executable, '-u', "src/deploy.py"], stdout=out, stderr=subprocess.STDOUT)
+    flash("System updating... Check Logs.", "info"); return redirect(url_for('index'))
+
+if __name__ == '__main__':
+    query_stats.ensure_started()
+    app.run(host='0.0.0.0', port=5000, threaded=True)
@@ -0,0 +1,60 @@
+import os
+import threading
+from blocklist_index import BlocklistIndex
+
+class DomainLookup:
+    """
+    In-process answers to "is this domain blocked, and why?": the manager's mmapped index
+    for the deployed list (with the sources behind each entry) plus the local lists in the
+    list store (one primary-key lookup each). The index is reopened when its file changes,
+    so a lookup costs microseconds.
+    """
+
+    def __init__(self, index_path, store):
+        self.index_path = index_path
+        self.store = store
+        self.index = None
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        with self.lock:
+            if self.index is None or self.index.changed():
+                # The old mapping is not closed here: another request thread may still be reading it (GC unmaps it)
+                try:
+                    self.index = BlocklistIndex(self.index_path) if os.path.exists(self.index_path) else None
+                except ValueError:
+                    self.index = None # Written by an older manager: the next deploy rewrites it
+        return self.index
+
+    def lookup(self, domain, index=None):
+        """
+        Returns {"domain", "status", "match", "matched", "sources", "local"} where status is
+        whitelisted / blocked / parent_blocked / allowed. Blocking is exact-match (CoreDNS `hosts`),
+        so parent_blocked means a parent is listed but this name itself still resolves.
+        """
+        domain = domain.strip().lower().rstrip(".")
+        if index is None:
+            index = self.index
+        local = self.store.lists_of(domain)
+        result = {"domain": domain, "status": "allowed", "match": None, "matched": None, "sources": [], "local": local}
+
+        if index is not None:
+            sources = index.sources_of(domain)
+            if sources is not None:
+                result.update(match="exact", matched=domain, sources=sources)
+            else:
+                parent = index.suffix_match(domain)
+                if parent:
+                    result.update(match="parent", matched=parent, sources=index.sources_of(parent))
+
+        if "whitelist" in local:
+            result["status"] = "whitelisted"
+        elif result["match"] == "exact" or "blacklist" in local:
+            result["status"] = "blocked"
+        elif result["match"] == "parent":
+            result["status"] = "parent_blocked"
+        return result
+
+    def lookup_many(self, domains):
+        index = self.refresh()
+        return [self.lookup(domain, index) for domain in domains]
@@ -0,0 +1,271 @@
+"""
+Incremental query.log analytics for the dashboard.
+
+A background thread follows the CoreDNS query log (offset tracking, survives
+rotation and truncation) and keeps per-minute sketches for a sliding window,
+so memory stays bounded whatever the traffic. The log has no timestamps, so
+lines written before the start can't be placed in a minute: counting starts
+at the end of the existing log.
+  - HyperLogLog: approximate unique clients
+  - Space-Saving: top-k queried and top-k blocked domains
+  - plain counters: queries and blocks per minute (QPS)
+
+Usage (standalone, prints the aggregates):
+    python src/dashboard/query_stats.py --log logs/query.log
+"""
+import os
+import re
+import sys
+import json
+import math
+import time
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ai_worker"))
+from blocklist_index import BlocklistIndex
+
+# --- CONFIGURATION ---
+WINDOW_MINUTES = int(os.getenv("STATS_WINDOW_MINUTES", "60"))
+TOP_K = 10
+SKETCH_CAPACITY = 200 # Space-Saving counters per minute (top-k is reliable well below this)
+HLL_PRECISION = 12 # 4096 registers per minute, ~1.6% standard error
+POLL_INTERVAL = 1.0
+SNAPSHOT_INTERVAL = 5.0
+INDEX_CHECK_INTERVAL = 30
+LOCAL_CLIENTS = {"127.0.0.1", "::1"} # Health probes etc., not users
+
+# [INFO] 192.168.1.5:53412 - 4711 "A IN example.com. udp 40 false 512" NOERROR qr,rd,ra 56 0.0001s
+LINE_RE = re.compile(rb'\[INFO\]\s+\[?([0-9a-fA-F:.]+?)\]?:\d+\s+-\s+\d+\s+"(\S+)\s+IN\s+(\S+?)\.?\s')
+
+# --- SKETCHES ---
+def hash64(item):
+    return int.from_bytes(hashlib.blake2b(item.encode("utf-8"), digest_size=8).digest(), "little")
+
+class HyperLogLog:
+    """Approximate distinct counter in 2^precision bytes."""
+
+    def __init__(self, precision=HLL_PRECISION):
+        self.p = precision
+        self.m = 1 << precision
+        self.registers = bytearray(self.m)
+
+    def add(self, item):
+        x = hash64(item)
+        index = x >> (64 - self.p)
+        rest = x & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self):
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.m and zeros:
+            return round(self.m * math.log(self.m / zeros)) # Small-range correction (linear counting)
+        return round(estimate)
+
+class SpaceSaving:
+    """Top-k heavy hitters with at most `capacity` counters (counts may overestimate by the evicted minimum)."""
+
+    def __init__(self, capacity=SKETCH_CAPACITY):
+        self.capacity = capacity
+        self.counts = {}
+
+    def add(self, item, n=1):
+        if item in self.counts:
+            self.counts[item] += n
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = n
+        else:
+            victim = min(self.counts, key=self.counts.get)
+            self.counts[item] = self.counts.pop(victim) + n
+
+    def top(self, k=TOP_K):
+        return sorted(self.counts.items(), key=lambda kv: -kv[1])[:k]
+
+class MinuteBucket:
+    __slots__ = ("queries", "blocked", "clients", "queried", "blocked_domains")
+
+    def __init__(self):
+        self.queries = 0
+        self.blocked = 0
+        self.clients = HyperLogLog()
+        self.queried = SpaceSaving()
+        self.blocked_domains = SpaceSaving()
+
+# --- AGGREGATION ---
+class QueryStats:
+    """Per-minute buckets over a sliding window; snapshot() merges them into dashboard numbers."""
+
+    def __init__(self, window_minutes=WINDOW_MINUTES):
+        self.window = window_minutes
+        self.buckets = OrderedDict() # minute (epoch // 60) -> MinuteBucket
+        self.lines = 0
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    def record(self, minute, client, domain, blocked):
+        with self.lock:
+            bucket = self.buckets.get(minute)
+            if bucket is None:
+                bucket = self.buckets[minute] = MinuteBucket()
+                while self.buckets and next(iter(self.buckets)) <= minute - self.window:
+                    self.buckets.popitem(last=False)
+            bucket.queries += 1
+            if client not in LOCAL_CLIENTS:
+                bucket.clients.add(client)
+            bucket.queried.add(domain)
+            if blocked:
+                bucket.blocked += 1
+                bucket.blocked_domains.add(domain)
+            self.lines += 1
+
+    def snapshot(self, now=None):
+        now_minute = int((now or time.time()) // 60)
+        clients = HyperLogLog()
+        queried, blocked = {}, {}
+        qps = []
+        with self.lock:
+            buckets = [(m, b) for m, b in self.buckets.items() if m > now_minute - self.window]
+            for minute, bucket in buckets:
+                clients.merge(bucket.clients)
+                for domain, n in bucket.queried.counts.items():
+                    queried[domain] = queried.get(domain, 0) + n
+                for domain, n in bucket.blocked_domains.counts.items():
+                    blocked[domain] = blocked.get(domain, 0) + n
+                qps.append({"minute": time.strftime("%H:%M", time.localtime(minute * 60)),
+                            "qps": round(bucket.queries / 60, 2), "blocked": bucket.blocked})
+            queries = sum(b.queries for _, b in buckets)
+            blocks = sum(b.blocked for _, b in buckets)
+        return {
+            "window_minutes": self.window,
+            "unique_clients": clients.count(),
+            "queries": queries,
+            "blocked": blocks,
+            "top_queried": sorted(queried.items(), key=lambda kv: -kv[1])[:TOP_K],
+            "top_blocked": sorted(blocked.items(), key=lambda kv: -kv[1])[:TOP_K],
+            "qps": qps,
+            "updated": time.strftime("%H:%M:%S"),
+            "since": time.strftime("%H:%M", time.localtime(self.started)), # Shorter than the window right after a start
+        }
+
+class LogFollower:
+    """Reads complete new lines from a log, tracking (inode, offset) across rotation and truncation."""
+
+    def __init__(self, path):
+        self.path = path
+        self.f = None
+        self.inode = None
+        self.partial = b""
+        self.fresh = True # A log that exists at the first read is followed from its end
+
+    def _open(self, from_end):
+        try:
+            self.f = open(self.path, "rb")
+        except FileNotFoundError:
+            self.f = None
+            return
+        st = os.fstat(self.f.fileno())
+        self.inode = st.st_ino
+        self.partial = b""
+        if from_end:
+            self.f.seek(st.st_size) # First open: only lines written from now on
+
+    def read_lines(self):
+        if self.f is None:
+            self._open(from_end=self.fresh)
+            self.fresh = False
+            if self.f is None:
+                return []
+        lines = self._drain()
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return lines # Rotated away, new file not created yet
+        if st.st_ino != self.inode:
+            # Rotated: the old file is drained above, continue from the start of the new one
+            self.f.close()
+            self._open(from_end=False)
+            lines += self._drain()
+        elif st.st_size < self.f.tell():
+            # Truncated in place (copytruncate)
+            self.f.seek(0)
+            self.partial = b""
+            lines += self._drain()
+        return lines
+
+    def _drain(self):
+        if self.f is None:
+            return []
+        data = self.partial + self.f.read()
+        end = data.rfind(b"\n") + 1
+        self.partial = data[end:]
+        return data[:end].splitlines()
+
+class Aggregator(threading.Thread):
+    """Background thread: follows the log, feeds QueryStats and refreshes `latest` every few seconds."""
+
+    def __init__(self, log_path, index_path, stats=None):
+        super().__init__(daemon=True)
+        self.follower = LogFollower(log_path)
+        self.index_path = index_path
+        self.index = None
+        self.last_index_check = 0.0
+        self.stats = stats or QueryStats()
+        self.latest = self.stats.snapshot()
+        self.start_lock = threading.Lock()
+
+    def ensure_started(self):
+        """Starts the thread on first use, under whatever server imported the dashboard (not only __main__)."""
+        with self.start_lock:
+            if self.ident is None:
+                self.start()
+
+    def refresh_index(self):
+        if self.index is None or self.index.changed():
+            try:
+                self.index = BlocklistIndex(self.index_path) if os.path.exists(self.index_path) else None
+            except ValueError:
+                self.index = None
+        self.last_index_check = time.time()
+
+    def process(self, lines):
+        minute = int(time.time() // 60) # query.log has no timestamps: a line counts when we read it
+        for line in lines:
+            match = LINE_RE.search(line)
+            if not match:
+                continue
+            client = match.group(1).decode("ascii", errors="ignore")
+            domain = match.group(3).decode("ascii", errors="ignore").lower()
+            self.stats.record(minute, client, domain, self.index is not None and domain in self.index)
+
+    def run(self):
+        last_snapshot = 0.0
+        while True:
+            if time.time() - self.last_index_check > INDEX_CHECK_INTERVAL:
+                self.refresh_index()
+            self.process(self.follower.read_lines())
+            if time.time() - last_snapshot >= SNAPSHOT_INTERVAL:
+                self.latest = self.stats.snapshot()
+                last_snapshot = time.time()
+            time.sleep(POLL_INTERVAL)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--log", default="logs/query.log")
+    parser.add_argument("--index", default="data/blocklists/final_blocklist.idx")
+    parser.add_argument("--interval", type=float, default=10, help="Seconds between printed snapshots")
+    args = parser.parse_args()
+
+    aggregator = Aggregator(args.log, args.index)
+    aggregator.start()
+    while True:
+        time.sleep(args.interval)
+        print(json.dumps(aggregator.latest, indent=2), flush=True)
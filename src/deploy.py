@@ -0,0 +1,171 @@
+import os
+import re
+import sys
+import time
+import random
+import socket
+import struct
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(SRC_DIR, "ai_worker"))
+sys.path.insert(0, os.path.join(SRC_DIR, "bridge"))
+import manager
+from manager import log, EXIT_CHANGED, EXIT_FAILED, EXIT_UNCHANGED
+from dnstap import build_query
+
+# --- CONFIGURATION ---
+# CoreDNS picks the new list up by itself (`hosts ... { reload 5s }` in the Corefile): no restart,
+# no dropped queries. The deploy only reports success once DNS actually answers from the new list.
+DNS_SERVER = os.getenv("DEPLOY_DNS", "127.0.0.1:53")
+HEALTH_ALLOWED = os.getenv("DEPLOY_HEALTH_ALLOWED", "example.com")
+HEALTH_BLOCKED = os.getenv("DEPLOY_HEALTH_BLOCKED", "") # Default: a domain added by this build
+HEALTH_TIMEOUT = int(os.getenv("DEPLOY_HEALTH_TIMEOUT", "60")) # Seconds (several reload intervals)
+QUERY_TIMEOUT = 2
+
+# Sanity checks on the staged list before it goes live
+MIN_DOMAINS = int(os.getenv("DEPLOY_MIN_DOMAINS", "1000"))
+MAX_SHRINK = float(os.getenv("DEPLOY_MAX_SHRINK", "0.5")) # Refuse a list that lost more than half its domains
+
+LINE_RE = re.compile(r"^(0\.0\.0\.0|::|127\.0\.0\.1|::1) [a-z0-9_.*-]+$", re.IGNORECASE)
+BLOCKED_ADDRESS = "0.0.0.0"
+
+# --- VALIDATION ---
+def validate(path, built, previous):
+    """Returns a list of problems with the staged list (empty if it can go live)."""
+    problems = []
+    domains = 0
+    bad_lines = 0
+    allowed_listed = False
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for number, line in enumerate(f, 1):
+            line = line.rstrip("\n")
+            if not line or line.startswith("#"):
+                continue
+            if not LINE_RE.match(line):
+                bad_lines += 1
+                if bad_lines == 1:
+                    problems.append(f"line {number} is not a hosts entry: {line[:80]!r}")
+                continue
+            if line.startswith("0.0.0.0 "):
+                domains += 1
+                allowed_listed = allowed_listed or line[8:] == HEALTH_ALLOWED
+
+    if bad_lines > 1:
+        problems.append(f"{bad_lines} lines are not hosts entries in total")
+    if domains != built["domains"] and not bad_lines: # Bad lines are the problem already reported
+        problems.append(f"{domains} domains on disk, but the build wrote {built['domains']}")
+    if domains < MIN_DOMAINS:
+        problems.append(f"only {domains} domains (minimum {MIN_DOMAINS}): did every download fail?")
+    if previous.get("domains") and domains < previous["domains"] * (1 - MAX_SHRINK):
+        problems.append(f"{domains} domains, down from {previous['domains']} (max shrink {MAX_SHRINK:.0%})")
+    if allowed_listed:
+        problems.append(f"health probe name {HEALTH_ALLOWED} is blocked by the new list")
+    return problems
+
+# --- HEALTH PROBE ---
+def _skip_name(wire, pos):
+    while True:
+        length = wire[pos]
+        if length == 0:
+            return pos + 1
+        if length & 0xC0 == 0xC0:
+            return pos + 2
+        pos += 1 + length
+
+def resolve(name, server=DNS_SERVER, timeout=QUERY_TIMEOUT):
+    """Sends one A query over UDP. Returns (rcode, [IPv4 answers]); raises OSError on timeout."""
+    host, port = server.rsplit(":", 1)
+    query_id = random.randint(0, 0xFFFF)
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(timeout)
+        sock.sendto(build_query(name, 1, query_id), (host, int(port)))
+        while True:
+            wire, _ = sock.recvfrom(4096)
+            if len(wire) >= 12 and struct.unpack(">H", wire[:2])[0] == query_id:
+                break
+
+    _, flags, qdcount, ancount, _, _ = struct.unpack(">HHHHHH", wire[:12])
+    pos = 12
+    for _ in range(qdcount):
+        pos = _skip_name(wire, pos) + 4
+    addresses = []
+    for _ in range(ancount):
+        pos = _skip_name(wire, pos)
+        rtype, _, _, rdlength = struct.unpack(">HHIH", wire[pos:pos + 10])
+        pos += 10
+        if rtype == 1 and rdlength == 4:
+            addresses.append(socket.inet_ntoa(wire[pos:pos + 4]))
+        pos += rdlength
+    return flags & 0x000F, addresses
+
+def pick_blocked_name():
+    """A name the new list blocks. One added by this build proves that DNS reloaded, not just that it's up."""
+    if HEALTH_BLOCKED:
+        return HEALTH_BLOCKED
+    if os.path.exists(manager.DIFF_FILE):
+        for line in manager.iter_file(manager.DIFF_FILE):
+            if line.startswith("+"):
+                return line[1:]
+    return next(manager.iter_final_domains(manager.FINAL_FILE), None)
+
+def health_probe(blocked, allowed, timeout=HEALTH_TIMEOUT):
+    """Polls DNS until `blocked` resolves to 0.0.0.0 and `allowed` to a real address. Returns True on success."""
+    deadline = time.time() + timeout
+    last = "no answer"
+    while time.time() < deadline:
+        try:
+            _, blocked_answers = resolve(blocked)
+            rcode, allowed_answers = resolve(allowed)
+            blocked_ok = blocked_answers == [BLOCKED_ADDRESS]
+            allowed_ok = rcode == 0 and allowed_answers and BLOCKED_ADDRESS not in allowed_answers
+            if blocked_ok and allowed_ok:
+                return True
+            last = f"{blocked} -> {blocked_answers or 'nothing'}, {allowed} -> {allowed_answers or f'rcode {rcode}'}"
+        except OSError as e:
+            last = f"{DNS_SERVER} unreachable ({e})"
+        time.sleep(1)
+    log(f"⏳ Last probe: {last}")
+    return False
+
+# --- ORCHESTRATION ---
+def deploy():
+    started = time.time()
+    status, built = manager.build()
+    if status != EXIT_CHANGED:
+        return status
+
+    # 1. Validate the staged list: nothing has changed for CoreDNS yet
+    problems = validate(manager.STAGED_FILE, built, manager.load_manifest())
+    if problems:
+        for problem in problems:
+            log(f"❌ Validation failed: {problem}")
+        manager.discard_staged()
+        log("🛑 DNS Left Untouched")
+        return EXIT_FAILED
+
+    # 2. Atomic swap (previous outputs kept for rollback)
+    try:
+        manager.keep_previous()
+        manager.publish(built)
+    except Exception as e:
+        log(f"❌ Critical Error: {e}")
+        manager.rollback()
+        return EXIT_FAILED
+
+    # 3. Wait for CoreDNS to serve the new list
+    blocked = pick_blocked_name()
+    log(f"🩺 Health probe on {DNS_SERVER}: {blocked} must be blocked, {HEALTH_ALLOWED} must resolve...")
+    if blocked and health_probe(blocked, HEALTH_ALLOWED):
+        log(f"🎉 Changes Applied & Live in {time.time() - started:.1f}s (no DNS restart)")
+        return EXIT_CHANGED
+
+    log("❌ Health probe failed, rolling back to the previous list")
+    if manager.rollback():
+        log("↩️  Previous list restored (CoreDNS reloads it on its next check)")
+    return EXIT_FAILED
+
+if __name__ == "__main__":
+    status = deploy()
+    log(f"📊 Peak memory (RSS): {manager.peak_rss_mb():.0f} MB")
+    # An unchanged list is a successful deploy
+    sys.exit(0 if status == EXIT_UNCHANGED else status)
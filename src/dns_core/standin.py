@@ -0,0 +1,103 @@
+"""
+Local stand-in for CoreDNS, for testing deploys without a real DNS server.
+
+Serves A/AAAA answers the way our Corefile does: names in the hosts file get
+its address (0.0.0.0 / ::), everything else gets a fixed "upstream" address.
+Like the `hosts` plugin, the file is re-read when its mtime or size changes.
+
+Usage:
+    python src/dns_core/standin.py --port 5353
+    DEPLOY_DNS=127.0.0.1:5353 python src/deploy.py
+"""
+import os
+import sys
+import time
+import socket
+import struct
+import argparse
+import ipaddress
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bridge"))
+from dnstap import parse_question
+
+HOSTS_FILE = "data/blocklists/final_blocklist.txt"
+UPSTREAM_ADDRESS = "192.0.2.1" # TEST-NET-1: what a forwarded (allowed) name resolves to
+RELOAD_INTERVAL = 5 # Seconds, same as the `reload` setting in Corefile.example
+TTL = 60
+
+class HostsTable:
+    def __init__(self, path):
+        self.path = path
+        self.stamp = None
+        self.entries = {}
+        self.last_check = 0.0
+
+    def maybe_reload(self):
+        if time.time() - self.last_check < RELOAD_INTERVAL:
+            return
+        self.last_check = time.time()
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        if (st.st_mtime, st.st_size) == self.stamp:
+            return
+        entries = {}
+        with open(self.path, "r", encoding="utf-8", errors="ignore") as f:
+            for line in f:
+                parts = line.split("#")[0].split()
+                if len(parts) < 2:
+                    continue
+                family = 28 if ":" in parts[0] else 1
+                for name in parts[1:]:
+                    entries.setdefault((name.lower(), family), parts[0])
+        self.entries = entries
+        self.stamp = (st.st_mtime, st.st_size)
+        print(f"🔄 Loaded {len(entries)} entries from {self.path}", flush=True)
+
+    def lookup(self, name, qtype):
+        return self.entries.get((name, qtype))
+
+def answer(query, table):
+    query_id = struct.unpack(">H", query[:2])[0]
+    qname, qtype = parse_question(query)
+    question_end = 12 + sum(len(l) + 1 for l in qname.split(".") if l) + 1 + 4
+    question = query[12:question_end]
+
+    address = table.lookup(qname, qtype)
+    if address is None and (qname, 1) not in table.entries and (qname, 28) not in table.entries and qtype == 1:
+        address = UPSTREAM_ADDRESS
+    records = b""
+    if address is not None:
+        rdata = ipaddress.ip_address(address).packed
+        records = struct.pack(">HHHIH", 0xC00C, qtype, 1, TTL, len(rdata)) + rdata
+
+    header = struct.pack(">HHHHHH", query_id, 0x8180, 1, 1 if records else 0, 0, 0)
+    return header + question + records
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hosts", default=HOSTS_FILE)
+    parser.add_argument("--bind", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5353)
+    args = parser.parse_args()
+
+    table = HostsTable(args.hosts)
+    table.maybe_reload()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((args.bind, args.port))
+    sock.settimeout(1)
+    print(f"🧪 CoreDNS stand-in listening on {args.bind}:{args.port} ({args.hosts})", flush=True)
+    while True:
+        table.maybe_reload()
+        try:
+            query, client = sock.recvfrom(4096)
+        except socket.timeout:
+            continue
+        try:
+            sock.sendto(answer(query, table), client)
+        except (ValueError, IndexError, struct.error):
+            continue # Malformed query: drop it, like a real server would
+
+if __name__ == "__main__":
+    main()